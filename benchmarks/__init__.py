@@ -0,0 +1,10 @@
+"""
+Offline benchmarks of the ingest and query hot paths:
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --baseline bench.json   # exits 1 on regressions
+
+Everything runs without network access: PDFs are generated (synthetic.py),
+and the embedding and chat models are deterministic fakes (fakes.py) unless
+--embeddings names a real backend (torch, onnx or onnx_int8).
+"""
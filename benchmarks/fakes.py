@@ -0,0 +1,48 @@
+from typing import List
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+import hashlib
+import json
+import numpy as np
+
+AUDIT_REPLY = json.dumps({
+    "summary": "Synthetic project plan with objectives, methodology and budget.",
+    "budget": "R$ 1.000.000",
+    "trl_level": 4,
+})
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Deterministic bag-of-words embeddings: each word adds a signed unit at a
+    position derived from its hash. Texts sharing words are similar, so
+    retrieval behaves like it would with a real model, at a fraction of the cost.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self._words = {}
+
+    def _word(self, word: str):
+        slot = self._words.get(word)
+        if slot is None:
+            digest = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            slot = self._words[word] = (digest % self.dim, 1.0 if digest >> 63 else -1.0)
+        return slot
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                slot, sign = self._word(word)
+                vectors[row, slot] += sign
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return (vectors / np.maximum(norms, 1e-12)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def fake_chat_model(trailing_words: int = 50) -> FakeListChatModel:
+    """A chat model that answers with a JSON object followed by prose, as real models often do."""
+    return FakeListChatModel(responses=[AUDIT_REPLY + "\n\nExplanation: " + "details " * trailing_words])
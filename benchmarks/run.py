@@ -0,0 +1,225 @@
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from unittest import mock
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.fakes import HashEmbeddings, fake_chat_model
+from benchmarks.synthetic import synthetic_chunks, synthetic_queries, write_pdf
+from src.embeddings import EMBEDDING_BACKENDS
+from src.extraction import EXTRACTION_BACKENDS
+from src.index_factory import IndexSpec
+from src.ingest import IngestionEngine
+import src.embeddings as embeddings_module
+import src.rag_engine as rag_engine_module
+
+# Metric name suffixes that say which direction is better, used by --baseline
+LOWER_IS_BETTER = ("_ms", "_s")
+HIGHER_IS_BETTER = ("_per_s",)
+
+
+def percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    values = np.asarray(samples_ms)
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean()),
+    }
+
+
+def timed(fn: Callable[[], Any]) -> float:
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+@contextmanager
+def engine_factory(embeddings: str) -> Iterator[Callable[..., "rag_engine_module.RAGEngine"]]:
+    """Yields a RAGEngine constructor that uses HashEmbeddings, or the real model on the given backend."""
+    if embeddings in EMBEDDING_BACKENDS:
+        model = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+        yield lambda path, spec: rag_engine_module.RAGEngine(
+            model, path, index_spec=spec, query_batch_size=1, embedding_backend=embeddings
+        )
+        return
+    with mock.patch.object(embeddings_module, "torch_embeddings", lambda *args, **kwargs: HashEmbeddings()):
+        yield lambda path, spec: rag_engine_module.RAGEngine("hash", path, index_spec=spec, query_batch_size=1)
+
+
+def bench_startup(runs: int = 3) -> Dict[str, Any]:
+    """Cold import of the API module in a fresh interpreter, the part of startup before the app answers."""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import src.api"], check=True, capture_output=True)
+        samples.append(time.perf_counter() - started)
+    return {"import_api_s": min(samples)}
+
+
+def bench_ingest(workdir: str, pages: int) -> Dict[str, Any]:
+    # Every tenth page is a ruled budget table, which "auto" hands to pdfplumber
+    pdf = write_pdf(os.path.join(workdir, "plan.pdf"), pages=pages, table_pages=range(0, pages, 10))
+    results: Dict[str, Any] = {"pages": pages}
+    for backend in EXTRACTION_BACKENDS:
+        for name, workers in (("serial", 1), ("parallel", None)):
+            ingestor = IngestionEngine(max_workers=workers, parallel_min_pages=1, extraction_backend=backend)
+            started = time.perf_counter()
+            docs = ingestor.load_pdf(pdf)
+            results[f"load_{backend}_{name}_pages_per_s"] = len(docs) / (time.perf_counter() - started)
+
+    ingestor = IngestionEngine()
+    started = time.perf_counter()
+    chunks = ingestor.chunk_documents(docs)
+    elapsed = time.perf_counter() - started
+    results["chunks"] = len(chunks)
+    results["chunk_pages_per_s"] = len(docs) / elapsed
+    results["chunk_chunks_per_s"] = len(chunks) / elapsed
+    return results
+
+
+def bench_embed(make_engine, workdir: str, texts: int) -> Dict[str, Any]:
+    engine = make_engine(os.path.join(workdir, "embed_store"), IndexSpec())
+    docs = [d.page_content for d in synthetic_chunks(texts, seed=7)]
+    engine.embeddings.embed_documents(docs[:8])  # warm up (model load, thread pools)
+    elapsed = timed(lambda: engine.embeddings.embed_documents(docs))
+    return {"texts": texts, "texts_per_s": texts / elapsed}
+
+
+def bench_index(make_engine, workdir: str, size: int, index_type: str, queries: int) -> Dict[str, Any]:
+    engine = make_engine(os.path.join(workdir, f"store_{index_type}_{size}"), IndexSpec(index_type=index_type))
+    docs = synthetic_chunks(size)
+    results: Dict[str, Any] = {"chunks": size, "build_s": timed(lambda: engine.add_documents(docs))}
+    results["compact_s"] = timed(engine.compact)
+
+    texts = synthetic_queries(queries)
+    engine.batch_retrieve(texts[:4], k=10)  # warm up the embedding matrices
+    samples = []
+    for text in texts:
+        started = time.perf_counter()
+        engine.batch_retrieve([text], k=10)
+        samples.append((time.perf_counter() - started) * 1000)
+    results.update({f"retrieve_{key}": value for key, value in percentiles(samples).items()})
+    results["batch_retrieve_queries_per_s"] = len(texts) / timed(lambda: engine.batch_retrieve(texts, k=10))
+    return results
+
+
+def bench_audit(make_engine, workdir: str, size: int, requests: int) -> Dict[str, Any]:
+    """End-to-end POST /audit: retrieval, context packing, the (fake) LLM call and JSON extraction."""
+    from fastapi.testclient import TestClient
+    import src.api as api
+
+    engine = make_engine(os.path.join(workdir, "audit_store"), IndexSpec())
+    engine.add_documents(synthetic_chunks(size))
+    api.state.rag_engine = engine
+    api.state.llm = fake_chat_model()
+    api._set_retriever()
+
+    # Without the context manager the startup hook (which connects to Bedrock) doesn't run
+    client = TestClient(api.app)
+    samples = []
+    for i, query in enumerate(synthetic_queries(requests, seed=3)):
+        # Distinct prompts, so neither the retrieval nor the response cache answers
+        started = time.perf_counter()
+        response = client.post("/audit", json={"query": query, "system_prompt": f"Extract the budget ({i})."})
+        samples.append((time.perf_counter() - started) * 1000)
+        response.raise_for_status()
+    return {"chunks": size, "requests": requests, **percentiles(samples)}
+
+
+def flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = float(value)
+    return flat
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> List[str]:
+    """Names the metrics that got worse than `baseline` by more than `tolerance` (a fraction)."""
+    before, after = flatten(baseline), flatten(current)
+    regressions = []
+    for name, old in before.items():
+        new = after.get(name)
+        if new is None or old <= 0:
+            continue
+        if name.endswith(HIGHER_IS_BETTER):
+            change = (old - new) / old
+        elif name.endswith(LOWER_IS_BETTER):
+            change = (new - old) / old
+        else:
+            continue
+        if change > tolerance:
+            regressions.append(f"{name}: {old:.4g} -> {new:.4g} ({change:+.0%} worse)")
+    return regressions
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the ingest and query hot paths.")
+    parser.add_argument("--pages", type=int, default=200, help="pages in the synthetic PDF")
+    parser.add_argument("--sizes", default="1000,10000,50000", help="comma-separated corpus sizes (chunks)")
+    parser.add_argument("--index-types", default="flat", help="comma-separated FAISS index types")
+    parser.add_argument("--queries", type=int, default=200, help="queries per corpus size")
+    parser.add_argument("--audit-requests", type=int, default=50)
+    parser.add_argument("--embeddings", choices=("fake",) + EMBEDDING_BACKENDS, default="fake",
+                        help="fake (hash-based, offline) or a real embedding backend")
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    parser.add_argument("--baseline", help="results JSON to compare against; exits 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    results: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as workdir, engine_factory(args.embeddings) as make_engine:
+        results["startup"] = bench_startup()
+        results["ingest"] = bench_ingest(workdir, args.pages)
+        results["embed"] = bench_embed(make_engine, workdir, texts=2000)
+        results["index"] = {
+            index_type: {str(size): bench_index(make_engine, workdir, size, index_type, args.queries) for size in sizes}
+            for index_type in args.index_types.split(",")
+        }
+        results["audit"] = bench_audit(make_engine, workdir, min(sizes), args.audit_requests)
+
+    report = {"environment": environment(), "config": vars(args), "results": results}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(json.load(f)["results"], results, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+from typing import Iterable, List, Optional
+from langchain_core.documents import Document
+import random
+
+SECTIONS = ["Objetivos", "Metodologia", "Cronograma", "Orcamento", "Equipe", "Resultados Esperados"]
+
+WORDS = (
+    "projeto pesquisa desenvolvimento inovacao tecnologia prototipo ensaio validacao "
+    "laboratorio processo produto mercado risco custo prazo entrega meta indicador "
+    "analise dados modelo sistema sensor software hardware integracao teste piloto "
+    "industrial parceria universidade recurso financiamento etapa atividade relatorio"
+).split()
+
+
+def sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 16))]
+    return " ".join(words).capitalize() + "."
+
+
+def page_lines(rng: random.Random, page: int, lines: int, width: int = 90) -> List[str]:
+    """Lines of one page: a section heading, then paragraphs wrapped at `width` characters."""
+    out = [f"{page + 1}. {SECTIONS[page % len(SECTIONS)]}"]
+    current = ""
+    while len(out) < lines:
+        for word in sentence(rng).split():
+            if len(current) + len(word) + 1 > width:
+                out.append(current)
+                current = ""
+            current = f"{current} {word}".strip()
+        if rng.random() < 0.2:
+            out.extend([current, ""])
+            current = ""
+    return out[:lines]
+
+
+def budget_table(rng: random.Random, rows: int = 12) -> List[str]:
+    """Lines of a budget table: item, quantity, unit cost and total per row."""
+    lines = ["Item Quantidade Valor unitario Total"]
+    for row in range(rows):
+        quantity, unit = rng.randint(1, 40), rng.randint(100, 90_000)
+        lines.append(f"{rng.choice(WORDS).capitalize()} {row + 1} {quantity} {unit:,}.00 {quantity * unit:,}.00")
+    return lines
+
+
+def _escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(
+    path: str,
+    pages: int,
+    lines_per_page: int = 50,
+    seed: int = 0,
+    blank_pages: Iterable[int] = (),
+    table_pages: Iterable[int] = (),
+) -> str:
+    """
+    Writes a PDF with `pages` pages of generated project-plan prose, using only
+    the standard Helvetica font so any PDF reader can extract it. Pages listed
+    in `blank_pages` (0-based) have no text; pages in `table_pages` hold a ruled
+    budget table instead of prose.
+    """
+    blank_pages, table_pages = set(blank_pages), set(table_pages)
+    rng = random.Random(seed)
+    objects: List[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(b"")  # filled in once the page tree exists
+    tree = add(b"")
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    kids = []
+    for page in range(pages):
+        if page in blank_pages:
+            stream = b""
+        elif page in table_pages:
+            rows = budget_table(rng)
+            # One text object per cell, plus the cell borders
+            cells = []
+            for r, row in enumerate(rows):
+                y = 780 - r * 20
+                for c, cell in enumerate([" ".join(row.split()[:-3]), *row.split()[-3:]]):
+                    cells.append(f"BT /F1 9 Tf {60 + c * 120} {y + 6} Td ({_escape(cell)}) Tj ET")
+                    cells.append(f"{55 + c * 120} {y} 120 20 re S")
+            stream = "\n".join(cells).encode("latin-1")
+        else:
+            text = " T* ".join(f"({_escape(line)}) Tj" for line in page_lines(rng, page, lines_per_page))
+            stream = f"BT /F1 10 Tf 13 TL 50 800 Td {text} ET".encode("latin-1")
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        kids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (tree, font, content)
+        ))
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % tree
+    objects[tree - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids)
+    )
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+
+    with open(path, "wb") as f:
+        f.write(out)
+    return path
+
+
+def synthetic_chunks(count: int, seed: int = 0, source: Optional[str] = None, chunk_chars: int = 800) -> List[Document]:
+    """Chunk-sized documents spread over several sources, for index benchmarks that skip PDF parsing."""
+    rng = random.Random(seed)
+    docs = []
+    for i in range(count):
+        text = ""
+        while len(text) < chunk_chars:
+            text = f"{text} {sentence(rng)}".strip()
+        docs.append(Document(
+            page_content=f"{SECTIONS[i % len(SECTIONS)]}: {text}",
+            metadata={"source": source or f"doc_{i // 500}.pdf", "page": i % 500 // 5 + 1},
+        ))
+    return docs
+
+
+def synthetic_queries(count: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    return [f"{rng.choice(SECTIONS)}: {sentence(rng)}" for _ in range(count)]
@@ -13,7 +13,28 @@ export async function uploadFile(file: File) {
     throw new Error('Upload failed');
   }
 
-  return response.json();
+  // Ingestion runs in the background; poll the job until it finishes
+  const job = await response.json();
+  return waitForJob(job.job_id);
+}
+
+export async function waitForJob(jobId: string, intervalMs: number = 1000) {
+  while (true) {
+    const response = await fetch(`${API_URL}/jobs/${jobId}`);
+    if (!response.ok) {
+      throw new Error('Upload failed');
+    }
+
+    const job = await response.json();
+    if (job.status === 'succeeded') {
+      return job;
+    }
+    if (job.status === 'failed' || job.status === 'cancelled') {
+      throw new Error(job.error || `Upload ${job.status}`);
+    }
+
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
 }
 
 export async function runAudit(query: string = "Analise este projeto e extraia as métricas de conformidade.") {
@@ -32,3 +53,66 @@ export async function runAudit(query: string = "Analise este projeto e extraia a
 
   return response.json();
 }
+
+export async function streamAudit(
+  query: string,
+  onToken: (delta: string) => void,
+  systemPrompt?: string,
+) {
+  const response = await fetch(`${API_URL}/audit/stream`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify(systemPrompt ? { query, system_prompt: systemPrompt } : { query }),
+  });
+
+  if (!response.ok || !response.body) {
+    const errorData = await response.json().catch(() => ({ detail: 'Unknown error' }));
+    throw new Error(errorData.detail || 'Audit failed');
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // SSE events are separated by a blank line
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const raw = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      const event = raw.match(/^event: (.*)$/m)?.[1];
+      const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] ?? 'null');
+      if (event === 'token') onToken(data.delta);
+      if (event === 'result') return data;
+      if (event === 'error') throw new Error(data.detail);
+    }
+  }
+
+  throw new Error('Audit stream ended without a result');
+}
+
+// `tag` names a quick tag (e.g. "Budget"); known tags are answered from their section of the document.
+// `documents` limits an item to some documents (file names); all of them when omitted
+export async function runBatchAudit(items: { query: string; system_prompt?: string; tag?: string; documents?: string[] }[]) {
+  const response = await fetch(`${API_URL}/audit/batch`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({ items }),
+  });
+
+  if (!response.ok) {
+    const errorData = await response.json().catch(() => ({ detail: 'Unknown error' }));
+    throw new Error(errorData.detail || 'Audit failed');
+  }
+
+  return response.json();
+}
@@ -1,23 +1,40 @@
+import time
+
+# Startup is measured from the first import of this module
+_IMPORT_STARTED = time.perf_counter()
+
 from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+from contextlib import contextmanager
 import shutil
+import json
 import os
+import threading
+import logging
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Set
 from dotenv import load_dotenv
 
 # Load env vars explicitly
 load_dotenv()
 
-# Import our modules
-from src.ingest import IngestionEngine
-from src.rag_engine import RAGEngine
-from src.auditor import AuditorAgent
+# Import our modules. LLM provider SDKs and the PDF stack are imported where first
+# needed and the embedding model loads lazily, to keep cold starts short
+from src.shards import ShardedRAGEngine, build_engine
+from src.auditor import DEFAULT_SYSTEM_PROMPT, AuditorAgent, LLMConcurrencyLimiter, LLMQueueTimeout
+from src.context_packer import ContextPacker
 from src.config import settings
-from langchain_aws import ChatBedrock
-from langchain_openai import ChatOpenAI
-import boto3
+from src.caches import AuditCaches, TTLCache
+from src.jobs import IngestJob, JobManager, QueueFull
+from src.utils import prefetch
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+_APP_IMPORTED = time.perf_counter()
 
 app = FastAPI(title="R&D Auditor API")
 
@@ -30,6 +47,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def _cache_path(name: str) -> Optional[str]:
+    return os.path.join(settings.AUDIT_CACHE_DIR, name) if settings.AUDIT_CACHE_DIR else None
+
 # Global state
 class AppState:
     def __init__(self):
@@ -37,98 +57,302 @@ class AppState:
         self.retriever = None
         self.llm = None
         self.auditor = None
+        # Live as soon as the app answers; ready once the LLM, store and warmup are done
+        self.ready = False
+        self.startup: Dict[str, Any] = {}
+        self.llm_limiter = LLMConcurrencyLimiter(
+            max_in_flight=settings.LLM_MAX_CONCURRENCY,
+            queue_timeout=settings.LLM_QUEUE_TIMEOUT_SECONDS
+        )
+        self.audit_caches = AuditCaches(
+            retrieval=TTLCache(
+                max_entries=settings.RETRIEVAL_CACHE_MAX_ENTRIES,
+                ttl_seconds=settings.RETRIEVAL_CACHE_TTL_SECONDS,
+                persist_path=_cache_path("retrieval.json")
+            ),
+            responses=TTLCache(
+                max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+                ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+                persist_path=_cache_path("responses.json")
+            ),
+            index_version=lambda: state.rag_engine.current_version() if state.rag_engine else ""
+        )
+        self.context_packer = ContextPacker(
+            max_tokens=settings.CONTEXT_TOKEN_BUDGET,
+            encoding=settings.CONTEXT_TOKENIZER
+        )
+        self.jobs = JobManager(
+            max_concurrent=settings.INGEST_MAX_CONCURRENT_JOBS,
+            max_queued=settings.INGEST_MAX_QUEUED_JOBS
+        )
 
 state = AppState()
+metrics.configure(
+    slow_request_ms=settings.METRICS_SLOW_REQUEST_MS,
+    slow_sample_size=settings.METRICS_SLOW_SAMPLE_SIZE
+)
 
-@app.on_event("startup")
-async def startup_event():
-    # Initialize RAG Engine
-    state.rag_engine = RAGEngine(
-        embedding_model_name=settings.EMBEDDING_MODEL_NAME,
-        vector_store_path=settings.VECTOR_DB_PATH
+def _build_auditor() -> AuditorAgent:
+    return AuditorAgent(
+        llm=state.llm,
+        retriever=state.retriever,
+        limiter=state.llm_limiter,
+        batch_retrieve=lambda queries, documents=None: state.rag_engine.batch_retrieve(queries, k=10, documents=documents),
+        caches=state.audit_caches,
+        packer=state.context_packer,
+        section_retrieve=lambda query, sections, documents=None: state.rag_engine.section_retrieve(
+            query, sections, k=settings.SECTION_LOOKUP_K, documents=documents
+        )
     )
-    
-    # Initialize LLM
+
+def preload() -> None:
+    """
+    Creates the engine (embedding model and memory-mapped store) ahead of the
+    workers. Called by src/gunicorn_conf.py in the master process, so forked
+    workers share the model weights and index pages copy-on-write.
+    """
+    state.rag_engine = build_engine(settings)
+    state.rag_engine.load_model()
+    if os.path.exists(settings.VECTOR_DB_PATH):
+        try:
+            state.rag_engine.load_vector_store()
+        except Exception as e:
+            print(f"⚠️ Could not preload vector store: {e}")
+
+def _set_retriever() -> None:
+    state.retriever = state.rag_engine.get_retriever(k=10)
+    if state.llm:
+        state.auditor = _build_auditor()
+
+async def _require_auditor() -> AuditorAgent:
+    if not state.auditor and state.llm and state.rag_engine and state.rag_engine.read_only:
+        # A reader that started before the writer published its first index; loading
+        # it runs off the event loop so other requests and streams keep going
+        try:
+            if await run_in_threadpool(state.rag_engine.refresh):
+                _set_retriever()
+        except Exception as e:
+            logger.warning(f"Could not load vector store: {e}")
+    if not state.auditor:
+        if not state.ready:
+            raise HTTPException(status_code=503, detail="Starting up", headers={"Retry-After": "2"})
+        raise HTTPException(status_code=503, detail="Auditor not initialized (LLM or Vector Store missing)")
+    return state.auditor
+
+@contextmanager
+def _startup_phase(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        state.startup[f"{name}_s"] = round(elapsed, 3)
+        metrics.observe(f"startup_{name}", elapsed)
+
+def _connect_llm():
+    """Creates the chat model; provider SDKs are imported here rather than with the app."""
     try:
+        import boto3
+        from langchain_aws import ChatBedrock
+
         print(f"Connecting to AWS Bedrock ({settings.AWS_REGION})...")
         bedrock_client = boto3.client(
             service_name="bedrock-runtime", 
             region_name=settings.AWS_REGION
         )
-        state.llm = ChatBedrock(
+        llm = ChatBedrock(
             model_id=settings.LLM_MODEL_ID, 
             client=bedrock_client,
             model_kwargs={"temperature": 0.0}
         )
         print("✅ AWS Bedrock connected.")
+        return llm
     except Exception as e:
         print(f"⚠️ Bedrock connection failed: {e}. Trying OpenAI...")
         if settings.OPENAI_API_KEY:
-            state.llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0)
+            from langchain_openai import ChatOpenAI
+
+            llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0)
             print("✅ OpenAI connected.")
-        else:
-            print("❌ No LLM available.")
+            return llm
+        print("❌ No LLM available.")
+        return None
 
-    # Load Vector Store if exists
-    if os.path.exists(settings.VECTOR_DB_PATH):
-        try:
-            state.rag_engine.load_vector_store()
-            state.retriever = state.rag_engine.get_retriever(k=10)
-            if state.llm:
-                state.auditor = AuditorAgent(llm=state.llm, retriever=state.retriever)
-            print("✅ Vector store loaded.")
-        except Exception as e:
-            print(f"⚠️ Could not load vector store: {e}")
+def _initialize() -> None:
+    """Connects the LLM, loads the vector store and warms up the query path, then marks the app ready."""
+    try:
+        with _startup_phase("llm"):
+            state.llm = _connect_llm()
+
+        # Load Vector Store if exists
+        if os.path.exists(settings.VECTOR_DB_PATH):
+            with _startup_phase("vector_store"):
+                try:
+                    _set_retriever()
+                    print(f"✅ Vector store loaded (version {state.rag_engine.index_version}, {settings.INDEX_ROLE}).")
+                except Exception as e:
+                    print(f"⚠️ Could not load vector store: {e}")
+
+        if settings.WARMUP_ON_STARTUP:
+            with _startup_phase("warmup"):
+                try:
+                    state.startup["warmup"] = {k: round(v, 3) for k, v in state.rag_engine.warmup().items()}
+                except Exception as e:
+                    print(f"⚠️ Warmup failed: {e}")
+    finally:
+        state.ready = True
+        state.startup["time_to_ready_s"] = round(time.perf_counter() - _IMPORT_STARTED, 3)
+        print(f"✅ Ready after {state.startup['time_to_ready_s']}s: {state.startup}")
+
+@app.on_event("startup")
+async def startup_event():
+    state.startup["import_s"] = round(_APP_IMPORTED - _IMPORT_STARTED, 3)
+    # Initialize RAG Engine (unless preloaded before the workers forked); the model loads on first use
+    with _startup_phase("engine"):
+        if state.rag_engine is None:
+            state.rag_engine = build_engine(settings)
+
+    if settings.STARTUP_IN_BACKGROUND:
+        # The app answers (and reports not ready on /health/ready) while this runs
+        threading.Thread(target=_initialize, name="startup", daemon=True).start()
+    else:
+        await run_in_threadpool(_initialize)
+
+def _ingest_file(job: IngestJob, file_path: str) -> None:
+    with metrics.trace("ingest", file=os.path.basename(file_path)):
+        _index_file(job, file_path)
+
+def _index_file(job: IngestJob, file_path: str) -> None:
+    """Runs on the ingestion pool: extract -> chunk -> embed -> index, reporting progress on `job`."""
+    from src.ingest import IngestionEngine
+
+    ingestor = IngestionEngine(
+        chunk_size=1000,
+        chunk_overlap=200,
+        max_workers=settings.INGEST_WORKERS or None,
+        parallel_min_pages=settings.INGEST_PARALLEL_MIN_PAGES,
+        extraction_backend=settings.INGEST_PDF_BACKEND
+    )
+
+    def tracked_chunks():
+        for chunk in ingestor.iter_chunks(file_path):
+            job.check_cancelled()
+            job.pages_processed = ingestor.pages_processed
+            job.chunks_processed = ingestor.chunks_processed
+            yield chunk
+        job.pages_processed = ingestor.pages_processed
+        if not ingestor.chunks_processed:
+            # Raised inside the stream, so a previous version of the file stays indexed
+            raise ValueError("No text extracted from PDF")
+
+    def on_batch(added: int) -> None:
+        job.chunks_added = added
 
-@app.post("/upload")
+    chunks = prefetch(tracked_chunks(), max_items=settings.INGEST_BATCH_SIZE * 2)
+
+    # Update Vector Store: the new version replaces a previous one only once it is fully indexed.
+    # On failure or cancellation nothing of it is kept and the previous version is still served.
+    try:
+        state.rag_engine.add_document_stream(
+            chunks,
+            batch_size=settings.INGEST_BATCH_SIZE,
+            on_batch=on_batch,
+            replace_source=file_path
+        )
+    finally:
+        # Stops the extraction thread (and its worker pool) if indexing ended early
+        chunks.close()
+
+    # The retriever always searches the engine's current snapshot, so it only needs creating once
+    if state.auditor is None:
+        _set_retriever()
+
+# Uploads being written to data/, before their job exists
+_receiving: Set[str] = set()
+
+@app.post("/upload", status_code=202)
 async def upload_file(file: UploadFile = File(...)):
+    """
+    Saves the PDF and queues it for ingestion. Returns a job id to poll on /jobs/{job_id}.
+    """
+    if state.rag_engine is None:
+        raise HTTPException(status_code=503, detail="Starting up", headers={"Retry-After": "2"})
+    if state.rag_engine.read_only:
+        raise HTTPException(status_code=503, detail="This worker serves a read-only index (INDEX_ROLE=reader); upload to the writer.")
+
+    # Ensure data directory exists
+    data_dir = Path("data")
+    data_dir.mkdir(exist_ok=True)
+
+    file_path = data_dir / file.filename
+
+    # The file is read by its job until it finishes, so it can't be overwritten meanwhile.
+    # Checked and claimed without awaiting in between, so concurrent uploads can't both pass.
+    active = state.jobs.active(file.filename)
+    if active is not None or file.filename in _receiving:
+        detail = f"{file.filename} is already being ingested"
+        raise HTTPException(status_code=409, detail=f"{detail} (job {active.id})" if active else detail)
+    _receiving.add(file.filename)
+
     try:
-        # Ensure data directory exists
-        data_dir = Path("data")
-        data_dir.mkdir(exist_ok=True)
-        
-        file_path = data_dir / file.filename
-        
-        # Save file
+        # Save file without blocking the event loop
         with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        # Process file
-        ingestor = IngestionEngine(chunk_size=1000, chunk_overlap=200)
-        documents = ingestor.process_file(str(file_path))
-        
-        if not documents:
-            raise HTTPException(status_code=400, detail="No text extracted from PDF")
-            
-        # Update Vector Store
-        state.rag_engine.create_vector_store(documents)
-        state.rag_engine.load_vector_store()
-        state.retriever = state.rag_engine.get_retriever(k=10)
-        
-        # Re-initialize auditor with new retriever
-        if state.llm:
-            state.auditor = AuditorAgent(llm=state.llm, retriever=state.retriever)
-            
-        return {"message": f"Successfully processed {file.filename}", "chunks": len(documents)}
-        
+            await run_in_threadpool(shutil.copyfileobj, file.file, buffer)
+
+        job = state.jobs.submit(file.filename, lambda job: _ingest_file(job, str(file_path)))
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        _receiving.discard(file.filename)
+
+    return {"message": f"Queued {file.filename} for processing", **job.to_dict()}
+
+@app.get("/jobs")
+def list_jobs():
+    return [job.to_dict() for job in state.jobs.list_jobs()]
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = state.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job.to_dict()
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    job = state.jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job.to_dict()
 
 class AuditRequest(BaseModel):
     query: str = "Analise este projeto."
-    system_prompt: str = "Você é um assistente de IA útil. Analise o documento fornecido e extraia as informações solicitadas em formato JSON."
+    system_prompt: str = DEFAULT_SYSTEM_PROMPT
+    # Quick tag ("Budget", "Timeline", ...); known tags read their section instead of searching the whole store
+    tag: Optional[str] = None
+    # File names (or paths) of the documents to audit; all indexed documents when omitted
+    documents: Optional[List[str]] = None
 
 import traceback
 
+@app.on_event("shutdown")
+def shutdown_event():
+    state.jobs.shutdown()
+    state.audit_caches.save()
+    if state.rag_engine and state.rag_engine.embedding_cache:
+        state.rag_engine.embedding_cache.save()
+
 @app.post("/audit")
 async def run_audit(request: AuditRequest):
-    if not state.auditor:
-        raise HTTPException(status_code=503, detail="Auditor not initialized (LLM or Vector Store missing)")
-    
+    auditor = await _require_auditor()
+
     try:
         print(f"Starting audit for query: {request.query}")
         # Pass both query and system_prompt to the auditor
-        result = state.auditor.audit_project(request.query, request.system_prompt)
+        with metrics.trace("audit"):
+            result = await auditor.aaudit_project(request.query, request.system_prompt, request.tag, request.documents)
         
         # Result is now likely a dict or list, not a Pydantic model
         if isinstance(result, dict) or isinstance(result, list):
@@ -141,12 +365,96 @@ async def run_audit(request: AuditRequest):
             return result.dict()
             
         return result
+    except LLMQueueTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         error_msg = f"Audit failed: {str(e)}"
         print(error_msg)
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=error_msg)
 
+class BatchAuditRequest(BaseModel):
+    items: List[AuditRequest] = Field(..., min_length=1, max_length=16)
+
+@app.post("/audit/batch")
+async def run_batch_audit(request: BatchAuditRequest):
+    """
+    Runs several audits (e.g. the quick tags) with one shared retrieval pass
+    and concurrent LLM calls. Returns per-item results, errors and timings.
+    """
+    auditor = await _require_auditor()
+
+    try:
+        with metrics.trace("audit_batch", items=len(request.items)):
+            return await auditor.abatch_audit(
+                [(item.query, item.system_prompt) for item in request.items],
+                tags=[item.tag for item in request.items],
+                documents=[item.documents for item in request.items]
+            )
+    except Exception as e:
+        error_msg = f"Batch audit failed: {str(e)}"
+        print(error_msg)
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=error_msg)
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/audit/stream")
+async def stream_audit(request: AuditRequest):
+    """
+    Server-sent events version of /audit: emits "retrieval", then "token" deltas
+    as the model generates, then "result" with the parsed JSON (or "error").
+    """
+    auditor = await _require_auditor()
+
+    async def events():
+        try:
+            with metrics.trace("audit_stream"):
+                async for item in auditor.astream_audit(request.query, request.system_prompt, request.tag, request.documents):
+                    yield _sse(item["event"], item["data"])
+        except Exception as e:
+            traceback.print_exc()
+            yield _sse("error", {"detail": f"Audit failed: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/metrics")
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/metrics/slow")
+def slow_requests():
+    """Per-stage breakdown of the latest requests slower than METRICS_SLOW_REQUEST_MS."""
+    return metrics.slow_requests()
+
+@app.get("/health/ready")
+def readiness_check():
+    """200 once startup has finished (LLM connected or given up on, store loaded, warmup run), 503 before."""
+    body = {"ready": state.ready, "startup": state.startup}
+    return JSONResponse(body, status_code=200 if state.ready else 503)
+
 @app.get("/health")
 def health_check():
-    return {"status": "ok", "llm": state.llm is not None, "vector_store": state.retriever is not None}
+    """Liveness: answers as soon as the app is up; `ready` tells whether it can serve audits yet."""
+    embedding_cache = state.rag_engine.embedding_cache if state.rag_engine else None
+    return {
+        "status": "ok",
+        "ready": state.ready,
+        "startup": state.startup,
+        "embedding_model_loaded": state.rag_engine.model.loaded if state.rag_engine else False,
+        "llm": state.llm is not None,
+        "vector_store": state.retriever is not None,
+        "index_role": settings.INDEX_ROLE,
+        "index_version": state.rag_engine.index_version if state.rag_engine else None,
+        "index_shards": state.rag_engine.stats() if isinstance(state.rag_engine, ShardedRAGEngine) else None,
+        "llm_in_flight": state.llm_limiter.in_flight,
+        "embedding_cache": embedding_cache.stats() if embedding_cache else None,
+        "query_batcher": state.rag_engine.query_batcher.stats() if state.rag_engine and state.rag_engine.query_batcher else None,
+        "audit_caches": state.audit_caches.stats(),
+    }
@@ -1,59 +1,286 @@
-from typing import Any, Dict, List, Optional
+from contextlib import asynccontextmanager, contextmanager
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Sequence, Tuple, Union
+from langchain_core.documents import Document
+from src.caches import AuditCaches
+from src.context_packer import ContextPacker, PackedContext
+from src.metrics import CACHE_EVENTS, CHUNKS, IN_FLIGHT, RETRIEVALS, TOKENS, observe, span
+from src.sections import sections_for_tag
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 from langchain_core.language_models import BaseChatModel
 import re
 import json
+import asyncio
+import contextvars
+import threading
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_SYSTEM_PROMPT = "Você é um assistente de IA útil. Analise o documento fornecido e extraia as informações solicitadas em formato JSON."
+
+class LLMQueueTimeout(Exception):
+    """Raised when an LLM call waited longer than the queue timeout for a free slot."""
+
+class LLMConcurrencyLimiter:
+    """
+    Caps the number of in-flight LLM calls per process. Callers wait for a slot
+    for at most `queue_timeout` seconds (None: as long as it takes) before
+    LLMQueueTimeout is raised.
+
+    Sync and async callers share one pool of slots and one FIFO queue: a
+    released slot is handed to the longest waiter, waking a blocked thread
+    through its Event or an async caller by resolving its future on its own
+    loop. Async waiters never block a thread or poll, so the event loop stays
+    free (and a cancelled waiter leaves nothing behind).
+    """
+
+    def __init__(self, max_in_flight: int = 8, queue_timeout: Optional[float] = 30.0):
+        self.max_in_flight = max_in_flight
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._free = max_in_flight
+        # threading.Event (sync) or asyncio.Future (async) per waiter, oldest first
+        self._waiters: Deque[Union[threading.Event, "asyncio.Future[None]"]] = deque()
+        self._lock = threading.Lock()
+
+    def _enter(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+        IN_FLIGHT.labels("llm").inc()
+
+    def _exit(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+        IN_FLIGHT.labels("llm").dec()
+        self._release()
+
+    def _release(self) -> None:
+        """Hands the slot to the oldest waiter, or frees it."""
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                    return
+                try:
+                    waiter.get_loop().call_soon_threadsafe(self._grant, waiter)
+                    return
+                except RuntimeError:
+                    continue  # its loop is closed
+            self._free += 1
+
+    def _grant(self, future: "asyncio.Future[None]") -> None:
+        # Runs on the waiter's loop; a waiter that gave up in the meantime passes the slot on
+        if future.done():
+            self._release()
+        else:
+            future.set_result(None)
+
+    def _timed_out(self) -> LLMQueueTimeout:
+        return LLMQueueTimeout(f"No LLM slot free after {self.queue_timeout}s")
+
+    @contextmanager
+    def sync_slot(self):
+        """Blocking counterpart of `slot`, for calls made from worker threads."""
+        with self._lock:
+            event = None
+            if self._free and not self._waiters:
+                self._free -= 1
+            else:
+                event = threading.Event()
+                self._waiters.append(event)
+        if event is not None and not event.wait(self.queue_timeout):
+            with self._lock:
+                # Set between the timeout and taking the lock: the slot is ours after all
+                if not event.is_set():
+                    self._waiters.remove(event)
+                    raise self._timed_out()
+        self._enter()
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def invoke(self, llm: BaseChatModel, prompt_value):
+        with self.sync_slot():
+            return llm.invoke(prompt_value)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Holds one in-flight slot, e.g. for the duration of a streamed completion."""
+        with self._lock:
+            future = None
+            if self._free and not self._waiters:
+                self._free -= 1
+            else:
+                future = asyncio.get_running_loop().create_future()
+                self._waiters.append(future)
+        if future is not None:
+            try:
+                await asyncio.wait_for(future, self.queue_timeout)
+            except BaseException as e:
+                with self._lock:
+                    if future in self._waiters:
+                        self._waiters.remove(future)
+                if future.done() and not future.cancelled():
+                    self._release()  # granted just as the wait ended
+                if isinstance(e, asyncio.TimeoutError):
+                    raise self._timed_out() from None
+                raise
+        self._enter()
+        try:
+            yield
+        finally:
+            self._exit()
+
+    async def ainvoke(self, llm: BaseChatModel, prompt_value):
+        async with self.slot():
+            return await llm.ainvoke(prompt_value)
+
+class JSONStreamExtractor:
+    """
+    Finds the first complete JSON object in text that arrives in pieces, e.g.
+    streamed LLM tokens. Braces are counted outside of strings only (tracking
+    quotes and backslash escapes), so values such as "see {appendix}" don't end
+    the object early. A balanced candidate that doesn't parse is dropped and the
+    scan continues with the next "{". Once `done`, the rest of the generation can
+    be cancelled: anything after the object is never used.
+    """
+
+    def __init__(self):
+        self._parts: List[str] = []
+        self._length = 0
+        self._start: Optional[int] = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self.value: Any = None
+        self.done = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def feed(self, delta: str) -> str:
+        """
+        Consumes the next piece of text. Returns the part of it up to and
+        including the end of the object (all of it while the object is still
+        open, "" once it has closed).
+        """
+        if self.done or not delta:
+            return ""
+        offset = self._length
+        self._parts.append(delta)
+        self._length += len(delta)
+        for i, char in enumerate(delta):
+            if self._start is None:
+                if char == "{":
+                    self._start, self._depth = offset + i, 1
+                continue
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0 and self._close(offset + i + 1):
+                    kept = delta[:i + 1]
+                    self._parts[-1] = kept
+                    self._length = offset + len(kept)
+                    return kept
+        return delta
+
+    def _close(self, end: int) -> bool:
+        try:
+            self.value = json.loads(self.text[self._start:end])
+            self.done = True
+        except ValueError:
+            # e.g. "{braces in prose}" before the actual answer
+            self._start = None
+        return self.done
+
+
 def clean_json_output(text: str) -> Any:
     """
     Cleans the LLM output to ensure it's valid JSON.
-    Uses a brace counter to extract the first valid JSON object.
+    Returns the first JSON object in the output (see JSONStreamExtractor).
     """
     # If the input is not a string (e.g. AIMessage), get the content
     if hasattr(text, 'content'):
         text = text.content
-    
-    logger.info(f"DEBUG: Raw LLM Output:\n{text}")
-        
-    # Remove markdown code blocks
-    text = re.sub(r'```json\s*', '', text)
-    text = re.sub(r'```\s*', '', text)
-    
-    # Attempt to extract JSON using brace counting
-    try:
-        start_index = text.find('{')
-        if start_index != -1:
-            brace_count = 0
-            for i, char in enumerate(text[start_index:], start=start_index):
-                if char == '{':
-                    brace_count += 1
-                elif char == '}':
-                    brace_count -= 1
-                    if brace_count == 0:
-                        # Found the matching closing brace
-                        potential_json = text[start_index:i+1]
-                        # Validate if it loads
-                        return json.loads(potential_json) 
-    except Exception as e:
-        logger.warning(f"Brace counting extraction failed: {e}")
+
+    logger.debug(f"Raw LLM output:\n{text}")
+
+    with span("parse_json"):
+        extractor = JSONStreamExtractor()
+        extractor.feed(text)
+    if extractor.done:
+        return extractor.value
 
     # Fallback: Return raw text wrapped in a dict if JSON parsing fails
     # This handles cases where the LLM returns plain text (e.g. a summary) instead of JSON.
+    text = re.sub(r'```json\s*', '', text)
+    text = re.sub(r'```\s*', '', text)
     return {"analysis_result": text}
 
 class AuditorAgent:
-    def __init__(self, llm: BaseChatModel, retriever):
+    def __init__(
+        self,
+        llm: BaseChatModel,
+        retriever,
+        limiter: Optional[LLMConcurrencyLimiter] = None,
+        batch_retrieve: Optional[Callable[..., List[List[Document]]]] = None,
+        caches: Optional[AuditCaches] = None,
+        packer: Optional[ContextPacker] = None,
+        section_retrieve: Optional[Callable[..., List[Document]]] = None,
+    ):
         self.llm = llm
         self.retriever = retriever
+        # Shared across agents so the cap holds when the agent is rebuilt after an upload
+        self.limiter = limiter or LLMConcurrencyLimiter()
+        # Retrieves for many queries in one pass (RAGEngine.batch_retrieve); falls back to the retriever.
+        # Audits scoped to documents need it, called with documents=[...]
+        self.batch_retrieve = batch_retrieve or self._retriever_batch
+        self.caches = caches
+        self.retrieval_params = dict(getattr(retriever, "search_kwargs", {}))
+        # Merges overlapping chunks and keeps the context within the token budget
+        self.packer = packer or ContextPacker()
+        # Reads the chunks of known sections for structured tags: (query, sections, documents=None),
+        # see RAGEngine.section_retrieve
+        self.section_retrieve = section_retrieve
+
+    def _retriever_batch(self, searches: List[str], documents: Optional[Sequence[str]] = None) -> List[List[Document]]:
+        """Fallback batch retrieval. The plain retriever can't be scoped, so scoped audits are refused rather than widened."""
+        if documents:
+            raise ValueError("Audits scoped to documents need a batch_retrieve that accepts documents=")
+        return self.retriever.batch(searches)
+
+    def pack_context(self, docs: List[Document]) -> PackedContext:
+        with span("pack_context"):
+            packed = self.packer.pack(docs)
+        CHUNKS.labels("retrieved").inc(packed.chunks)
+        TOKENS.labels("context").inc(packed.tokens)
+        TOKENS.labels("context_saved").inc(packed.tokens_saved)
+        logger.debug(
+            f"Context: {packed.chunks} chunks -> {packed.spans} spans, {packed.tokens} tokens "
+            f"({packed.tokens_saved} saved{', truncated' if packed.truncated else ''})"
+        )
+        return packed
 
     def format_docs(self, docs):
-        return "\n\n".join([d.page_content for d in docs])
+        return self.pack_context(docs).text
 
-    def get_chain(self, system_prompt_text: str):
+    def build_prompt(self, system_prompt_text: str) -> ChatPromptTemplate:
         # Define the prompt
         # We inject the user's system prompt directly.
         # We enforce JSON output in the system prompt instructions.
@@ -82,44 +309,339 @@ class AuditorAgent:
         
         Based on the context above, please answer the user query and return the result in JSON format."""
         
-        prompt = ChatPromptTemplate.from_messages([
+        return ChatPromptTemplate.from_messages([
             ("system", full_system_prompt),
             ("human", human_template)
         ])
 
-        # Debug step to print context
-        def debug_context(inputs):
-            ctx = inputs['context']
-            logger.info(f"DEBUG: Context Length: {len(ctx)} chars")
-            return inputs
+    @staticmethod
+    def render_prompt(prompt: ChatPromptTemplate, inputs: Dict[str, str]):
+        with span("render_prompt"):
+            return prompt.invoke(inputs)
+
+    def get_chain(self, system_prompt_text: str, sections: Sequence[str] = (), documents: Optional[Sequence[str]] = None):
+        prompt = self.build_prompt(system_prompt_text)
+
+        def retrieve(search: str) -> List[Document]:
+            return self._retrieve(search, sections, documents)
+
+        async def aretrieve(search: str) -> List[Document]:
+            return await self._aretrieve(search, sections, documents)
 
         # Define the chain using LCEL
         chain = (
             {
-                "context": self.retriever | self.format_docs, 
+                "context": RunnableLambda(retrieve, afunc=aretrieve) | self.format_docs, 
                 "query": RunnablePassthrough()
             }
-            | RunnableLambda(debug_context)
-            | prompt
-            | self.llm
+            | RunnableLambda(lambda inputs: self.render_prompt(prompt, inputs))
+            | RunnableLambda(self._call_llm, afunc=self._acall_llm)
             | RunnableLambda(clean_json_output)
         )
         
         return chain
 
-    def audit_project(self, query: str, system_prompt: str):
+    def sections_for(self, query: str, tag: Optional[str] = None) -> Tuple[str, ...]:
+        """
+        Sections that answer a structured tag: the explicit `tag`, or a query that
+        is just a tag or section name ("Budget", "Cronograma"). Empty when the
+        tag is unknown or section lookups are not available.
+        """
+        if self.section_retrieve is None:
+            return ()
+        return sections_for_tag(tag or query)
+
+    def _retrieve(self, search: str, sections: Sequence[str] = (), documents: Optional[Sequence[str]] = None) -> List[Document]:
+        return self._retrieve_many([search], [sections], [documents])[0]
+
+    async def _aretrieve(self, search: str, sections: Sequence[str] = (), documents: Optional[Sequence[str]] = None) -> List[Document]:
+        loop = asyncio.get_running_loop()
+        # With a copy of the context, so retrieval spans land in the caller's trace
+        return await loop.run_in_executor(None, contextvars.copy_context().run, self._retrieve, search, sections, documents)
+
+    def _retrieve_many(
+        self,
+        searches: List[str],
+        sections: Optional[List[Sequence[str]]] = None,
+        documents: Optional[List[Optional[Sequence[str]]]] = None,
+    ) -> List[List[Document]]:
+        """
+        Searches with sections are answered from the section index, skipping
+        the vector search (and the retrieval cache, as lookups are cheap); the
+        others, and those whose sections hold no chunks, go through _lookup_many.
+        `documents` scopes each search to some documents (None: all of them).
+        """
+        scopes = [tuple(sorted(scope or ())) for scope in documents or [None] * len(searches)]
+        with span("retrieve"):
+            results: List[Optional[List[Document]]] = [None] * len(searches)
+            for i, keys in enumerate(sections or []):
+                if keys:
+                    with span("section_lookup"):
+                        docs = self.section_retrieve(searches[i], keys, documents=list(scopes[i]) or None)
+                    if docs:
+                        results[i] = docs
+            missing = [i for i, docs in enumerate(results) if docs is None]
+            RETRIEVALS.labels("section").inc(len(searches) - len(missing))
+            RETRIEVALS.labels("vector").inc(len(missing))
+            if missing:
+                fetched = self._lookup_many([searches[i] for i in missing], [scopes[i] for i in missing])
+                for i, docs in zip(missing, fetched):
+                    results[i] = docs
+            return results
+
+    def _lookup_many(self, searches: List[str], scopes: Optional[List[Tuple[str, ...]]] = None) -> List[List[Document]]:
+        """Serves searches from the retrieval cache and batch-retrieves the rest."""
+        scopes = scopes or [()] * len(searches)
+        if not self.caches:
+            return self._fetch(searches, scopes)
+
+        keys = [
+            self.caches.retrieval_key(search, {**self.retrieval_params, "documents": list(scope)} if scope else self.retrieval_params)
+            for search, scope in zip(searches, scopes)
+        ]
+        results = [self.caches.get_docs(key) for key in keys]
+        missing = [i for i, docs in enumerate(results) if docs is None]
+        CACHE_EVENTS.labels("retrieval", "hit").inc(len(searches) - len(missing))
+        CACHE_EVENTS.labels("retrieval", "miss").inc(len(missing))
+        if missing:
+            fetched = self._fetch([searches[i] for i in missing], [scopes[i] for i in missing])
+            for i, docs in zip(missing, fetched):
+                self.caches.set_docs(keys[i], docs)
+                results[i] = docs
+        return results
+
+    def _fetch(self, searches: List[str], scopes: List[Tuple[str, ...]]) -> List[List[Document]]:
+        """Retrieves the searches of each document scope as one batch; a lone unscoped search goes through the retriever."""
+        results: List[List[Document]] = [[] for _ in searches]
+        groups: Dict[Tuple[str, ...], List[int]] = {}
+        for i, scope in enumerate(scopes):
+            groups.setdefault(scope, []).append(i)
+        for scope, rows in groups.items():
+            batch = [searches[i] for i in rows]
+            if scope:
+                fetched = self.batch_retrieve(batch, documents=list(scope))
+            elif len(batch) > 1:
+                fetched = self.batch_retrieve(batch)
+            else:
+                fetched = [self.retriever.invoke(batch[0])]
+            for i, docs in zip(rows, fetched):
+                results[i] = docs
+        return results
+
+    def _cached_response(self, prompt_value) -> Tuple[Optional[str], Optional[str]]:
+        if not self.caches:
+            return None, None
+        key = self.caches.response_key(prompt_value.to_string())
+        cached = self.caches.responses.get(key)
+        CACHE_EVENTS.labels("response", "miss" if cached is None else "hit").inc()
+        return key, cached
+
+    def _store_response(self, key: Optional[str], message) -> None:
+        if key is not None:
+            self.caches.responses.set(key, message.content if hasattr(message, "content") else str(message))
+
+    def _call_llm(self, prompt_value) -> str:
+        # Streams so that generation stops as soon as the JSON object is complete
+        key, cached = self._cached_response(prompt_value)
+        if cached is not None:
+            return cached
+        extractor = JSONStreamExtractor()
+        with self.limiter.sync_slot():
+            started = time.perf_counter()
+            stream = self.llm.stream(prompt_value)
+            try:
+                for n, chunk in enumerate(stream):
+                    if n == 0:
+                        observe("llm_first_token", time.perf_counter() - started)
+                    extractor.feed(chunk.content if hasattr(chunk, "content") else str(chunk))
+                    if extractor.done:
+                        break
+            finally:
+                stream.close()
+                self._observe_generation(started, extractor)
+        self._store_response(key, extractor.text)
+        return extractor.text
+
+    async def _acall_llm(self, prompt_value) -> str:
+        key, cached = self._cached_response(prompt_value)
+        if cached is not None:
+            return cached
+        extractor = JSONStreamExtractor()
+        async with self.limiter.slot():
+            async for _ in self._astream_json(prompt_value, extractor):
+                pass
+        self._store_response(key, extractor.text)
+        return extractor.text
+
+    async def _astream_json(self, prompt_value, extractor: JSONStreamExtractor) -> AsyncIterator[str]:
+        """
+        Yields generated text until `extractor` has a complete JSON object, then
+        closes the model stream, which cancels the rest of the generation.
+        """
+        started = time.perf_counter()
+        stream = self.llm.astream(prompt_value)
+        first = True
+        try:
+            async for chunk in stream:
+                if first:
+                    observe("llm_first_token", time.perf_counter() - started)
+                    first = False
+                delta = extractor.feed(chunk.content if hasattr(chunk, "content") else str(chunk))
+                if delta:
+                    yield delta
+                if extractor.done:
+                    break
+        finally:
+            await stream.aclose()
+            self._observe_generation(started, extractor)
+
+    def _observe_generation(self, started: float, extractor: JSONStreamExtractor) -> None:
+        observe("llm", time.perf_counter() - started)
+        TOKENS.labels("output").inc(self.packer.count_tokens(extractor.text))
+
+    @staticmethod
+    def search_text(query: str, system_prompt: str) -> str:
+        # Combine query and system_prompt for retrieval to ensure we find relevant sections
+        # (e.g. if prompt asks for "Budget", we want to search for "Budget" in the docs)
+        return f"{query}\n\nContext to look for: {system_prompt}"
+
+    def audit_project(self, query: str, system_prompt: str, tag: Optional[str] = None, documents: Optional[Sequence[str]] = None):
         """
         Runs the audit chain. 
         query: The specific question or instruction from the user.
         system_prompt: The persona or rules for the AI.
+        tag: A quick tag ("Budget", "Timeline"); known ones are answered from their sections.
+        documents: File names (or paths) of the documents to audit; all when None.
         """
-        # Combine query and system_prompt for retrieval to ensure we find relevant sections
-        # (e.g. if prompt asks for "Budget", we want to search for "Budget" in the docs)
-        combined_search = f"{query}\n\nContext to look for: {system_prompt}"
+        combined_search = self.search_text(query, system_prompt)
         
-        chain = self.get_chain(system_prompt)
+        chain = self.get_chain(system_prompt, self.sections_for(query, tag), documents)
         # We pass the combined search to the chain. 
         # The retriever will use it to find docs, and it will be passed as {query} to the prompt.
         result = chain.invoke(combined_search)
         return result
 
+    async def aaudit_project(
+        self, query: str, system_prompt: str, tag: Optional[str] = None, documents: Optional[Sequence[str]] = None
+    ):
+        """
+        Async version of audit_project. Retrieval runs in the default executor and
+        the LLM call goes through the provider's async client, so the event loop
+        stays free while the call is in flight.
+        """
+        combined_search = self.search_text(query, system_prompt)
+        chain = self.get_chain(system_prompt, self.sections_for(query, tag), documents)
+        return await chain.ainvoke(combined_search)
+
+    async def astream_audit(
+        self, query: str, system_prompt: str, tag: Optional[str] = None, documents: Optional[Sequence[str]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streams an audit as events: "retrieval" once the context is ready,
+        "token" for each piece of generated text and "result" with the parsed JSON.
+        Uses the same prompt and model as get_chain, through the model's astream.
+        """
+        combined_search = self.search_text(query, system_prompt)
+        docs = await self._aretrieve(combined_search, self.sections_for(query, tag), documents)
+        packed = self.pack_context(docs)
+        context = packed.text
+        yield {"event": "retrieval", "data": {**packed.to_dict(), "context_chars": len(context)}}
+
+        prompt_value = self.render_prompt(self.build_prompt(system_prompt), {"context": context, "query": combined_search})
+        key, cached = self._cached_response(prompt_value)
+        if cached is not None:
+            yield {"event": "token", "data": {"delta": cached}}
+            yield {"event": "result", "data": clean_json_output(cached)}
+            return
+
+        extractor = JSONStreamExtractor()
+        async with self.limiter.slot():
+            async for delta in self._astream_json(prompt_value, extractor):
+                yield {"event": "token", "data": {"delta": delta}}
+
+        self._store_response(key, extractor.text)
+        yield {"event": "result", "data": extractor.value if extractor.done else clean_json_output(extractor.text)}
+
+    async def _aanswer(self, search: str, system_prompt: str, context: str) -> Any:
+        prompt_value = self.render_prompt(self.build_prompt(system_prompt), {"context": context, "query": search})
+        message = await self._acall_llm(prompt_value)
+        return clean_json_output(message)
+
+    async def abatch_audit(
+        self,
+        items: List[Tuple[str, str]],
+        tags: Optional[List[Optional[str]]] = None,
+        documents: Optional[List[Optional[Sequence[str]]]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Audits several (query, system_prompt) items with one retrieval pass:
+        all searches are embedded and searched together, then the LLM calls
+        run concurrently (still subject to the limiter). The retrieved chunks
+        are deduplicated across items by content hash: a chunk several items
+        retrieved is one Document they share, each item packs its chunks
+        without repeats, and `unique_chunks` is the number of distinct chunks.
+        Each item still packs (and token-counts) its own prompt, since the
+        spans and budget cut differ per item. A failing item (packing or LLM
+        call) reports its error without failing the others. Items with a known tag (`tags`, one per
+        item) are answered from their sections; `documents` scopes each item
+        to some documents.
+        """
+        searches = [self.search_text(query, system_prompt) for query, system_prompt in items]
+        sections = [self.sections_for(query, tag) for (query, _), tag in zip(items, tags or [None] * len(items))]
+
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        retrieved = await loop.run_in_executor(
+            None, contextvars.copy_context().run, self._retrieve_many, searches, sections, documents
+        )
+        retrieval_ms = (time.perf_counter() - started) * 1000
+        # Content hash -> the one Document every item that retrieved the chunk packs
+        shared: Dict[str, Document] = {}
+        deduped: List[List[Document]] = []
+        for docs in retrieved:
+            item: Dict[str, Document] = {}
+            for doc in docs:
+                key = doc.metadata.get("content_hash") or doc.page_content
+                item.setdefault(key, shared.setdefault(key, doc))
+            deduped.append(list(item.values()))
+        unique_chunks = len(shared)
+
+        async def run_item(search: str, system_prompt: str, docs: List[Document]) -> Dict[str, Any]:
+            packed: Optional[PackedContext] = None
+            timings: Dict[str, float] = {}
+            started = time.perf_counter()
+            try:
+                packed = self.pack_context(docs)
+                timings["pack_ms"] = (time.perf_counter() - started) * 1000
+                started = time.perf_counter()
+                try:
+                    result, error = await self._aanswer(search, system_prompt, packed.text), None
+                finally:
+                    timings["llm_ms"] = (time.perf_counter() - started) * 1000
+            except Exception as e:
+                logger.warning(f"Batch audit item failed: {e}")
+                result, error = None, str(e)
+            return {
+                "result": result,
+                "error": error,
+                "chunks": len(docs),
+                "context_tokens": packed.tokens if packed else None,
+                "tokens_saved": packed.tokens_saved if packed else None,
+                "timings": timings,
+            }
+
+        results = await asyncio.gather(*[
+            run_item(search, system_prompt, docs)
+            for search, (_, system_prompt), docs in zip(searches, items, deduped)
+        ])
+        for (query, _), result in zip(items, results):
+            result["query"] = query
+
+        return {
+            "items": results,
+            "unique_chunks": unique_chunks,
+            "timings": {
+                "retrieval_ms": retrieval_ms,
+                "total_ms": (time.perf_counter() - started) * 1000,
+            },
+        }
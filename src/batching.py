@@ -0,0 +1,131 @@
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+from langchain_core.documents import Document
+import json
+import queue
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Request:
+    query: str
+    params: Dict[str, Any]
+    # Requests with equal keys run in the same batch_retrieve call; params may hold
+    # unhashable values such as a metadata filter dict
+    group: str
+    future: Future = field(default_factory=Future)
+
+
+class QueryBatcher:
+    """
+    Coalesces retrievals from concurrent callers into batched calls of
+    `retrieve_batch` (RAGEngine.batch_retrieve): one embedding batch and one
+    index.search per batch instead of one per query.
+
+    A single dispatcher thread takes the first waiting query, collects more for
+    at most `window_ms` or until `max_batch` are waiting, runs them as one batch
+    per distinct set of search params and hands each caller its result. Queries
+    that arrive while a batch runs are picked up together by the next one, so
+    under load batches grow without anyone waiting for the window.
+    """
+
+    def __init__(
+        self,
+        retrieve_batch: Callable[..., List[List[Document]]],
+        max_batch: int = 32,
+        window_ms: float = 2.0,
+    ):
+        self.retrieve_batch = retrieve_batch
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+        self.batches = 0
+        self.queries = 0
+        self.largest_batch = 0
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, query: str, **params: Any) -> "Future[List[Document]]":
+        self._ensure_started()
+        request = _Request(query=query, params=params, group=json.dumps(params, sort_keys=True, default=repr))
+        self._queue.put(request)
+        return request.future
+
+    def retrieve(self, query: str, **params: Any) -> List[Document]:
+        """Blocks until the batch holding this query has run."""
+        return self.submit(query, **params).result()
+
+    def _ensure_started(self) -> None:
+        # Started on first use rather than in __init__: threads don't survive the
+        # fork when the engine is preloaded in a gunicorn master
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            pending = [first]
+            closing = False
+            deadline = time.monotonic() + self.window
+            while len(pending) < self.max_batch:
+                try:
+                    remaining = deadline - time.monotonic()
+                    request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    closing = True
+                    break
+                pending.append(request)
+            self._dispatch(pending)
+            if closing:
+                return
+
+    def _dispatch(self, pending: List[_Request]) -> None:
+        groups: Dict[str, List[_Request]] = {}
+        for request in pending:
+            if request.future.set_running_or_notify_cancel():
+                groups.setdefault(request.group, []).append(request)
+
+        for requests in groups.values():
+            # Identical queries (e.g. the same quick tag from several users) are searched once
+            queries = list(dict.fromkeys(r.query for r in requests))
+            try:
+                results = dict(zip(queries, self.retrieve_batch(queries, **requests[0].params)))
+            except Exception as e:
+                logger.warning(f"Batched retrieval of {len(queries)} queries failed: {e}")
+                for request in requests:
+                    request.future.set_exception(e)
+                continue
+            for request in requests:
+                request.future.set_result(results[request.query])
+
+            self.batches += 1
+            self.queries += len(requests)
+            self.largest_batch = max(self.largest_batch, len(queries))
+
+    def close(self) -> None:
+        """Lets the dispatcher finish what is queued, then stops it."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "mean_batch": self.queries / self.batches if self.batches else None,
+            "largest_batch": self.largest_batch,
+            "waiting": self._queue.qsize(),
+        }
@@ -0,0 +1,148 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from langchain_core.documents import Document
+import hashlib
+import json
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a per-entry time-to-live. Values must be
+    JSON-serializable when `persist_path` is set; the cache is then loaded
+    from that file on creation and written back by save().
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, persist_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        if persist_path and os.path.exists(persist_path):
+            self._load()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING or entry[0] < time.time():
+                if entry is not _MISSING:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+        }
+
+    def _load(self) -> None:
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache file {self.persist_path}: {e}")
+            return
+        now = time.time()
+        for key, expires_at, value in entries[-self.max_entries:]:
+            if expires_at > now:
+                self._entries[key] = (expires_at, value)
+
+    def save(self) -> None:
+        if not self.persist_path:
+            return
+        with self._lock:
+            entries = [[key, expires_at, value] for key, (expires_at, value) in self._entries.items()]
+        os.makedirs(os.path.dirname(self.persist_path) or ".", exist_ok=True)
+        tmp_path = self.persist_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.persist_path)
+
+
+def _digest(*parts: str) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class AuditCaches:
+    """
+    Caches in front of the audit chain:
+    - retrieval: search text + retrieval params + index version -> retrieved chunks.
+      Entries for an older index version are dropped as soon as the version changes.
+    - responses: rendered prompt (system prompt, query and retrieved context) -> raw LLM output.
+      The context is part of the key, so an index change that alters the context misses naturally.
+    """
+
+    def __init__(self, retrieval: TTLCache, responses: TTLCache, index_version: Callable[[], str]):
+        self.retrieval = retrieval
+        self.responses = responses
+        self.index_version = index_version
+        self._seen_version: Optional[str] = None
+
+    def _current_version(self) -> str:
+        version = self.index_version()
+        if version != self._seen_version:
+            if self._seen_version is not None:
+                logger.info(f"Index version changed ({self._seen_version} -> {version}), clearing retrieval cache.")
+                self.retrieval.clear()
+            self._seen_version = version
+        return version
+
+    def retrieval_key(self, search: str, params: Dict[str, Any]) -> str:
+        return _digest(search, json.dumps(params, sort_keys=True), self._current_version())
+
+    def get_docs(self, key: str) -> Optional[List[Document]]:
+        cached = self.retrieval.get(key)
+        if cached is None:
+            return None
+        return [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in cached]
+
+    def set_docs(self, key: str, docs: List[Document]) -> None:
+        self.retrieval.set(key, [{"page_content": d.page_content, "metadata": d.metadata} for d in docs])
+
+    @staticmethod
+    def response_key(prompt_text: str) -> str:
+        return _digest(prompt_text)
+
+    def save(self) -> None:
+        self.retrieval.save()
+        self.responses.save()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "index_version": self._seen_version,
+            "retrieval": self.retrieval.stats(),
+            "responses": self.responses.stats(),
+        }
@@ -7,11 +7,101 @@ class Settings(BaseSettings):
     DATA_DIR: str = "data"
     VECTOR_DB_PATH: str = "vector_store_faiss"
     
+    # Ingestion (INGEST_WORKERS=0 uses every core)
+    INGEST_WORKERS: int = 0
+    INGEST_PARALLEL_MIN_PAGES: int = 32
+    # PDF text extraction: "auto" (PDFium, table-like pages via pdfplumber), "pypdfium2" or "pdfplumber"
+    INGEST_PDF_BACKEND: str = "auto"
+    # Chunks embedded and indexed per batch by the streaming ingest pipeline
+    INGEST_BATCH_SIZE: int = 64
+    # Background ingestion jobs running at once / waiting in the queue
+    INGEST_MAX_CONCURRENT_JOBS: int = 2
+    INGEST_MAX_QUEUED_JOBS: int = 16
+
     # Model Config
     EMBEDDING_MODEL_NAME: str = "sentence-transformers/all-MiniLM-L6-v2"
+    # Embedding backend: "torch" (sentence-transformers), "onnx" (ONNX Runtime) or "onnx_int8"
+    # (int8-quantized weights). ONNX models are exported into EMBEDDING_ONNX_DIR on first use
+    # (or ahead of time with `python -m src.embeddings`); EMBEDDING_PARITY_CHECK compares
+    # them with the PyTorch model at load. EMBEDDING_THREADS caps inference threads (0: all cores).
+    EMBEDDING_BACKEND: str = "torch"
+    EMBEDDING_BATCH_SIZE: int = 32
+    EMBEDDING_THREADS: int = 0
+    EMBEDDING_ONNX_DIR: str = "onnx_models"
+    EMBEDDING_PARITY_CHECK: bool = False
     # Default to Amazon Titan (Serverless, no waitlist) to avoid "AccessDenied" on Claude
     LLM_MODEL_ID: str = "amazon.titan-text-express-v1" 
+
+    # FAISS index: flat | ivf_flat | ivf_pq | hnsw. Uploads append to a flat index;
+    # compaction (or `python -m src.index_tools build`, which retrains every shard) retrains
+    # the store as this type. Stores too small to train it get a simpler one (see build_index).
+    FAISS_INDEX_TYPE: str = "flat"
+    FAISS_NLIST: int = 1024
+    FAISS_PQ_M: int = 16
+    FAISS_HNSW_M: int = 32
+    FAISS_NPROBE: int = 16
+    FAISS_EF_SEARCH: int = 64
+    FAISS_TRAIN_SAMPLE: int = 50_000
+
+    # Multi-worker serving: "writer" ingests and serves (the single-process default);
+    # "reader" workers map the store read-only and reload when the writer publishes,
+    # checking the manifest at most every INDEX_REFRESH_SECONDS.
+    INDEX_ROLE: str = "writer"
+    INDEX_REFRESH_SECONDS: float = 2.0
+    # Each published index version is a generation; superseded ones (and segments only
+    # they use) are deleted once older than the grace period and not among the newest kept
+    INDEX_KEEP_GENERATIONS: int = 3
+    INDEX_GC_GRACE_SECONDS: float = 300
+    # "source": every uploaded document gets its own store under VECTOR_DB_PATH/shards, opened on
+    # first use with at most INDEX_MAX_LOADED_SHARDS held in memory (least recently used evicted);
+    # unscoped queries search the shards on INDEX_FANOUT_WORKERS threads, past INDEX_MAX_FANOUT_SHARDS
+    # shards only those whose centroid is nearest the query. A text found in several documents is
+    # stored in each of their shards, and returned once. "none": a single store.
+    INDEX_SHARDING: str = "source"
+    INDEX_MAX_LOADED_SHARDS: int = 32
+    INDEX_MAX_FANOUT_SHARDS: int = 8
+    INDEX_FANOUT_WORKERS: int = 8
+
+    # Retrievals from concurrent audits are coalesced into batches of up to RETRIEVAL_BATCH_SIZE
+    # queries (1 disables), waiting at most RETRIEVAL_BATCH_WINDOW_MS for a batch to fill
+    RETRIEVAL_BATCH_SIZE: int = 32
+    RETRIEVAL_BATCH_WINDOW_MS: float = 2.0
+
+    # Retrieved chunks are merged where they overlap and packed into at most
+    # CONTEXT_TOKEN_BUDGET tokens (counted with the CONTEXT_TOKENIZER tiktoken encoding)
+    CONTEXT_TOKEN_BUDGET: int = 3000
+    CONTEXT_TOKENIZER: str = "cl100k_base"
+    # Quick tags of known sections (Budget, Timeline, ...) read at most SECTION_LOOKUP_K chunks of the section
+    SECTION_LOOKUP_K: int = 6
+
+    # Embedding cache (set EMBEDDING_CACHE_DIR to "" to disable)
+    EMBEDDING_CACHE_DIR: str = "embedding_cache"
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 200_000
     
+    # LLM concurrency: max in-flight calls per process and how long a call may wait for a slot
+    LLM_MAX_CONCURRENCY: int = 8
+    LLM_QUEUE_TIMEOUT_SECONDS: float = 30.0
+    # SageMaker batch transform: JSON Lines records audited per retrieval pass (their LLM calls
+    # then run LLM_MAX_CONCURRENCY at a time, waiting for a slot without timing out)
+    BATCH_TRANSFORM_WINDOW: int = 64
+
+    # Audit caches (retrieval results and LLM responses); set AUDIT_CACHE_DIR to "" to keep them in memory only
+    AUDIT_CACHE_DIR: str = "audit_cache"
+    RETRIEVAL_CACHE_MAX_ENTRIES: int = 1024
+    RETRIEVAL_CACHE_TTL_SECONDS: float = 3600
+    RESPONSE_CACHE_MAX_ENTRIES: int = 1024
+    RESPONSE_CACHE_TTL_SECONDS: float = 86400
+
+    # Startup: connect the LLM, load the store and warm up in a background thread (the app
+    # is live meanwhile and /health/ready reports 503), and run a dummy query before going ready
+    STARTUP_IN_BACKGROUND: bool = True
+    WARMUP_ON_STARTUP: bool = True
+
+    # Requests slower than METRICS_SLOW_REQUEST_MS are logged with a per-stage breakdown;
+    # the latest METRICS_SLOW_SAMPLE_SIZE are served on /metrics/slow
+    METRICS_SLOW_REQUEST_MS: float = 5000
+    METRICS_SLOW_SAMPLE_SIZE: int = 100
+
     # AWS Config (Optional if using local env vars or IAM roles)
     AWS_REGION: str = "us-east-1"
     
@@ -23,4 +113,4 @@ class Settings(BaseSettings):
 settings = Settings()
 
 # Ensure directories exist
-os.makedirs(settings.DATA_DIR, exist_ok=True)
+os.makedirs(settings.DATA_DIR, exist_ok=True)
\ No newline at end of file
@@ -0,0 +1,196 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_core.documents import Document
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Span:
+    """Contiguous text of one page, merged from one or more retrieved chunks."""
+    source: str
+    page: int
+    start: Optional[int]
+    text: str
+    rank: int
+    chunks: int = 1
+
+    @property
+    def end(self) -> Optional[int]:
+        return self.start + len(self.text) if self.start is not None else None
+
+
+@dataclass
+class PackedContext:
+    text: str
+    chunks: int
+    spans: int
+    tokens: int
+    # Tokens of the chunks as retrieved, joined the way format_docs used to
+    tokens_retrieved: int
+    truncated: bool = False
+    dropped_spans: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.tokens_retrieved - self.tokens)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "chunks": self.chunks,
+            "spans": self.spans,
+            "context_tokens": self.tokens,
+            "tokens_retrieved": self.tokens_retrieved,
+            "tokens_saved": self.tokens_saved,
+            "truncated": self.truncated,
+            "dropped_spans": self.dropped_spans,
+        }
+
+
+def _overlap(left: str, right: str, max_overlap: int, min_overlap: int) -> int:
+    """Length of the longest suffix of `left` that is a prefix of `right`."""
+    for size in range(min(len(left), len(right), max_overlap), min_overlap - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+class ContextPacker:
+    """
+    Turns retrieved chunks into the prompt context:
+    - chunks of the same source and page are merged, dropping the text that
+      consecutive chunks repeat (the splitter's chunk_overlap). Chunks carry
+      their offset in the page (start_index) when ingested with it; otherwise
+      the overlap is found by matching the end of one chunk to the start of another;
+    - the retrieval order decides what is kept when the token budget is hit:
+      merged spans are taken best-ranked first, the last one truncated to fit;
+    - the kept spans are emitted in document order (source, page, offset),
+      each under a short page header.
+    Tokens are counted with tiktoken (`encoding`); when it can't be loaded
+    (e.g. offline without a cached encoding), with a 4-characters-per-token estimate.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 3000,
+        encoding: str = "cl100k_base",
+        max_overlap: int = 400,
+        min_overlap: int = 20,
+        min_truncated_tokens: int = 64,
+    ):
+        self.max_tokens = max_tokens
+        self.encoding_name = encoding
+        self.max_overlap = max_overlap
+        self.min_overlap = min_overlap
+        self.min_truncated_tokens = min_truncated_tokens
+        self._encoding = None
+        self._encoding_failed = False
+
+    # ------------------------------------------------------------------
+    # Tokens
+    # ------------------------------------------------------------------
+
+    def _encoder(self):
+        if self._encoding is None and not self._encoding_failed:
+            try:
+                import tiktoken
+                self._encoding = tiktoken.get_encoding(self.encoding_name)
+            except Exception as e:
+                logger.warning(f"tiktoken encoding {self.encoding_name} unavailable, estimating tokens: {e}")
+                self._encoding_failed = True
+        return self._encoding
+
+    def count_tokens(self, text: str) -> int:
+        encoding = self._encoder()
+        if encoding is None:
+            return -(-len(text) // 4)
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        encoding = self._encoder()
+        if encoding is None:
+            return text[:max_tokens * 4]
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+    # ------------------------------------------------------------------
+    # Packing
+    # ------------------------------------------------------------------
+
+    def _merge(self, docs: List[Document]) -> List[_Span]:
+        spans: List[_Span] = []
+        by_page: Dict[Tuple[str, int], List[_Span]] = {}
+        for rank, doc in enumerate(docs):
+            source = str(doc.metadata.get("source", ""))
+            page = doc.metadata.get("page", 0)
+            span = _Span(source=source, page=page, start=doc.metadata.get("start_index"), text=doc.page_content, rank=rank)
+            if not self._absorb(by_page.setdefault((source, page), []), span):
+                by_page[(source, page)].append(span)
+                spans.append(span)
+        return spans
+
+    def _absorb(self, page_spans: List[_Span], new: _Span) -> bool:
+        """Merges `new` into a span of the same page it overlaps or touches. Returns whether it did."""
+        for span in page_spans:
+            if new.text in span.text:
+                span.chunks += 1
+                return True
+            if span.start is not None and new.start is not None:
+                if new.start <= span.end and new.end >= span.start:
+                    left, right = (span, new) if span.start <= new.start else (new, span)
+                    if right.end <= left.end:
+                        merged = left.text
+                    else:
+                        merged = left.text + right.text[left.end - right.start:]
+                    span.start, span.text = left.start, merged
+                    span.rank, span.chunks = min(span.rank, new.rank), span.chunks + 1
+                    return True
+                continue
+            after = _overlap(span.text, new.text, self.max_overlap, self.min_overlap)
+            before = _overlap(new.text, span.text, self.max_overlap, self.min_overlap) if not after else 0
+            if after or before:
+                if after:
+                    span.text = span.text + new.text[after:]
+                else:
+                    span.text = new.text + span.text[before:]
+                span.rank, span.chunks = min(span.rank, new.rank), span.chunks + 1
+                return True
+        return False
+
+    @staticmethod
+    def _header(span: _Span) -> str:
+        name = os.path.basename(span.source) if span.source else "document"
+        return f"[{name}, p. {span.page}]"
+
+    def pack(self, docs: List[Document]) -> PackedContext:
+        tokens_retrieved = self.count_tokens("\n\n".join(d.page_content for d in docs)) if docs else 0
+        spans = self._merge(docs)
+
+        kept: List[Tuple[_Span, str]] = []
+        used = 0
+        truncated = False
+        for span in sorted(spans, key=lambda s: s.rank):
+            block = f"{self._header(span)}\n{span.text}"
+            cost = self.count_tokens(block) + (2 if kept else 0)  # blank line between blocks
+            if used + cost <= self.max_tokens:
+                kept.append((span, block))
+                used += cost
+                continue
+            remaining = self.max_tokens - used
+            if remaining >= self.min_truncated_tokens:
+                kept.append((span, self.truncate(block, remaining - 2)))
+                truncated = True
+            break
+
+        kept.sort(key=lambda item: (item[0].source, item[0].page, item[0].start or 0, item[0].rank))
+        text = "\n\n".join(block for _, block in kept)
+        return PackedContext(
+            text=text,
+            chunks=len(docs),
+            spans=len(kept),
+            tokens=self.count_tokens(text) if text else 0,
+            tokens_retrieved=tokens_retrieved,
+            truncated=truncated,
+            dropped_spans=len(spans) - len(kept),
+        )
@@ -0,0 +1,248 @@
+from collections.abc import MutableMapping
+from typing import Collection, Dict, Iterator, List, Optional, Set, Union
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+import faiss
+import numpy as np
+import json
+import mmap
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.faiss"
+DATA_FILE = "docs.jsonl"
+OFFSETS_FILE = "docs_offsets.npy"
+IDS_FILE = "docs_ids.npy"
+# Ids compared per step when scanning the mapped id file
+SCAN_BLOCK = 1 << 16
+
+
+class MmapDocstore(Docstore):
+    """
+    Read-only docstore over an offset-indexed file, one record per FAISS position:
+    - docs.jsonl: concatenated {"page_content", "metadata"} JSON records
+    - docs_offsets.npy: int64 byte offsets, n + 1 entries
+    - docs_ids.npy: fixed-width chunk ids
+    All three are memory-mapped, so opening is constant time, records are only
+    decoded when a search returns them, and the OS page cache is shared by
+    every process that maps the same segment.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode="r")
+        self._ids = np.load(os.path.join(path, IDS_FILE), mmap_mode="r")
+        self._data: Union[mmap.mmap, bytes] = b""
+        if self._offsets[-1] > 0:
+            with open(os.path.join(path, DATA_FILE), "rb") as f:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # id -> position, only built if something looks a chunk up by id
+        self._positions: Optional[Dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def id_at(self, position: int) -> str:
+        return self._ids[position].decode("utf-8")
+
+    def get(self, position: int) -> Document:
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        record = json.loads(self._data[start:end])
+        return Document(page_content=record["page_content"], metadata=record["metadata"])
+
+    def position_of(self, doc_id: str) -> Optional[int]:
+        if self._positions is None:
+            self._positions = {self.id_at(p): p for p in range(len(self))}
+        return self._positions.get(doc_id)
+
+    def positions_of(self, doc_ids: Collection[str]) -> np.ndarray:
+        """
+        Positions of the given ids, found by scanning the mapped id file in
+        blocks, so a few lookups don't build the id index of the whole segment.
+        """
+        if not doc_ids or not len(self):
+            return np.empty(0, dtype=np.int64)
+        wanted = np.array([doc_id.encode("utf-8") for doc_id in doc_ids])
+        found = [
+            start + np.flatnonzero(np.isin(self._ids[start:start + SCAN_BLOCK], wanted))
+            for start in range(0, len(self), SCAN_BLOCK)
+        ]
+        return np.concatenate(found)
+
+    def search(self, search: str) -> Union[str, Document]:
+        position = self.position_of(search)
+        if position is None:
+            return f"ID {search} not found."
+        return self.get(position)
+
+    @staticmethod
+    def write(path: str, ids: List[str], docs: List[Document]) -> None:
+        os.makedirs(path, exist_ok=True)
+        offsets = np.zeros(len(docs) + 1, dtype=np.int64)
+        with open(os.path.join(path, DATA_FILE), "wb") as f:
+            for i, doc in enumerate(docs):
+                record = json.dumps(
+                    {"page_content": doc.page_content, "metadata": doc.metadata},
+                    ensure_ascii=False
+                ).encode("utf-8")
+                f.write(record)
+                offsets[i + 1] = offsets[i] + len(record)
+        np.save(os.path.join(path, OFFSETS_FILE), offsets)
+        width = max((len(i) for i in ids), default=1)
+        np.save(os.path.join(path, IDS_FILE), np.array([i.encode("utf-8") for i in ids], dtype=f"S{width}"))
+
+
+class LayeredDocstore(Docstore, AddableMixin):
+    """
+    A memory-mapped segment with an in-memory layer on top for chunks appended
+    since it was written, and a set of deleted ids masking the mapped records.
+    """
+
+    def __init__(self, base: Optional[MmapDocstore] = None):
+        self.base = base
+        self._added: Dict[str, Document] = {}
+        self._deleted: Set[str] = set()
+
+    def lookup(self, position: int, doc_id: str) -> Union[str, Document]:
+        """Fetches by FAISS position, which avoids building the id index of the base segment."""
+        if doc_id in self._deleted:
+            return f"ID {doc_id} not found."
+        if doc_id in self._added:
+            return self._added[doc_id]
+        if self.base is not None and position < len(self.base) and self.base.id_at(position) == doc_id:
+            return self.base.get(position)
+        return self.search(doc_id)
+
+    def search(self, search: str) -> Union[str, Document]:
+        if search in self._deleted:
+            return f"ID {search} not found."
+        if search in self._added:
+            return self._added[search]
+        if self.base is not None:
+            return self.base.search(search)
+        return f"ID {search} not found."
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        self._added.update(texts)
+        self._deleted.difference_update(texts)
+
+    def delete(self, ids: List) -> None:
+        for doc_id in ids:
+            self._added.pop(doc_id, None)
+            self._deleted.add(doc_id)
+
+
+class IdLog(list):
+    """Chunk ids in FAISS position order, appended to while a stream indexes batches."""
+
+    def id_at(self, position: int) -> str:
+        return self[position]
+
+
+class LazyIdMap(MutableMapping):
+    """
+    FAISS position -> chunk id, read from the mapped segment's id file and
+    overlaid with appended positions and removals, so loading a store does
+    not build a Python dict with one entry per chunk. Over an IdLog it covers
+    the ids logged when it was created, so later appends stay invisible.
+    """
+
+    def __init__(self, base: Optional[Union[MmapDocstore, IdLog]] = None):
+        self.base = base
+        self._base_len = len(base) if base is not None else 0
+        self._overlay: Dict[int, str] = {}
+        self._removed: Set[int] = set()
+
+    def __getitem__(self, position: int) -> str:
+        if position in self._overlay:
+            return self._overlay[position]
+        if 0 <= position < self._base_len and position not in self._removed:
+            return self.base.id_at(position)
+        raise KeyError(position)
+
+    def __contains__(self, position) -> bool:
+        if position in self._overlay:
+            return True
+        return isinstance(position, int) and 0 <= position < self._base_len and position not in self._removed
+
+    def __setitem__(self, position: int, doc_id: str) -> None:
+        self._overlay[position] = doc_id
+
+    def positions_of(self, doc_ids: Collection[str]) -> List[int]:
+        """Mapped positions holding the given ids, without reading every id of a mapped segment."""
+        found = [position for position, doc_id in self._overlay.items() if doc_id in doc_ids]
+        if isinstance(self.base, MmapDocstore):
+            base = (int(p) for p in self.base.positions_of(doc_ids) if p < self._base_len)
+        else:
+            base = (p for p in range(self._base_len) if self.base.id_at(p) in doc_ids)
+        found.extend(p for p in base if p not in self._removed and p not in self._overlay)
+        return found
+
+    def __delitem__(self, position: int) -> None:
+        if position in self._overlay:
+            del self._overlay[position]
+        elif 0 <= position < self._base_len and position not in self._removed:
+            self._removed.add(position)
+        else:
+            raise KeyError(position)
+
+    def __iter__(self) -> Iterator[int]:
+        for position in range(self._base_len):
+            if position not in self._removed and position not in self._overlay:
+                yield position
+        yield from self._overlay
+
+    def __len__(self) -> int:
+        shadowed = sum(1 for p in self._overlay if p < self._base_len and p not in self._removed)
+        return self._base_len - len(self._removed) + len(self._overlay) - shadowed
+
+
+def doc_at(store: FAISS, position: int) -> Document:
+    """The chunk stored at a FAISS position, without id lookups on mapped segments."""
+    doc_id = store.index_to_docstore_id[position]
+    if isinstance(store.docstore, LayeredDocstore):
+        doc = store.docstore.lookup(position, doc_id)
+    else:
+        doc = store.docstore.search(doc_id)
+    if not isinstance(doc, Document):
+        raise ValueError(f"Could not find document for id {doc_id}, got {doc}")
+    return doc
+
+
+def save_segment(store: FAISS, path: str) -> None:
+    """Writes the FAISS index and an offset-indexed docstore. Positions must have no gaps."""
+    ntotal = store.index.ntotal
+    ids = [store.index_to_docstore_id[p] for p in range(ntotal)]
+    docs = [doc_at(store, p) for p in range(ntotal)]
+    MmapDocstore.write(path, ids, docs)
+    faiss.write_index(store.index, os.path.join(path, INDEX_FILE))
+
+
+# Read-only mapping of the index file. IO_FLAG_MMAP maps IVF inverted lists;
+# IO_FLAG_MMAP_IFC (newer FAISS) also maps the codes of flat indexes.
+MMAP_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
+
+def load_segment(path: str, embeddings: Embeddings, read_only: bool = False) -> FAISS:
+    """
+    Opens a segment written by save_segment with a memory-mapped docstore.
+    With `read_only`, the FAISS index is memory-mapped as well, so its vectors are
+    shared between processes through the page cache; the index must then not be
+    added to. Segments written by FAISS.save_local (pickled docstore) are still
+    loaded the old way.
+    """
+    if not os.path.exists(os.path.join(path, OFFSETS_FILE)):
+        # allow_dangerous_deserialization is needed for local pickle files in newer versions
+        return FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+
+    base = MmapDocstore(path)
+    return FAISS(
+        embedding_function=embeddings,
+        index=faiss.read_index(os.path.join(path, INDEX_FILE), MMAP_FLAGS if read_only else 0),
+        docstore=LayeredDocstore(base),
+        index_to_docstore_id=LazyIdMap(base)
+    )
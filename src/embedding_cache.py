@@ -0,0 +1,230 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+from langchain_core.embeddings import Embeddings
+from src.metrics import CACHE_EVENTS
+from src.utils import clean_text
+import numpy as np
+import hashlib
+import json
+import os
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Raw 16-byte keys: a bytes ("S16") field would drop trailing NUL bytes on read
+KEY_DTYPE = np.dtype([("key", "V16"), ("slot", "<u4")])
+
+
+def _key_records(keys: Iterable[bytes], slots: Iterable[int], count: int) -> np.ndarray:
+    records = np.empty(count, dtype=KEY_DTYPE)
+    if count:
+        records["key"] = np.frombuffer(b"".join(keys), dtype="V16")
+        records["slot"] = np.fromiter(slots, dtype="<u4", count=count)
+    return records
+
+
+class EmbeddingCache:
+    """
+    Disk-backed, content-addressed cache of chunk embeddings.
+
+    Vectors live in a memory-mapped float32 array (`vectors.f32`) with one row
+    per slot. The key index (`keys.bin`) maps 16-byte digests of
+    (model name, normalized chunk text) to slots and is stored in LRU order,
+    so the least recently used entry is evicted first once `max_entries` is reached.
+
+    Each put_many appends only its own entries to a journal (`keys.log`),
+    replayed over the index on load, so writes cost the size of the batch
+    rather than of the cache. The index is rewritten (and the journal emptied)
+    once the journal outgrows both `compact_after` records and half the index,
+    which keeps the amortized cost per entry constant, and on save().
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, max_entries: int = 200_000, compact_after: int = 4096):
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.compact_after = compact_after
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[bytes, int]" = OrderedDict()
+        self._free_slots: List[int] = []
+        self._vectors: Optional[np.memmap] = None
+        self._dim: Optional[int] = None
+        self._journal_records = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name)
+
+    def key(self, text: str) -> bytes:
+        payload = f"{self.model_name}\0{clean_text(text)}".encode("utf-8")
+        return hashlib.blake2b(payload, digest_size=16).digest()
+
+    def _load(self) -> None:
+        meta_path = self._path("meta.json")
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("max_entries") != self.max_entries:
+            logger.info("Embedding cache capacity changed, starting with an empty cache.")
+            return
+
+        self._dim = meta["dim"]
+        self._vectors = np.memmap(
+            self._path("vectors.f32"), dtype=np.float32, mode="r+",
+            shape=(self.max_entries, self._dim)
+        )
+        for row in self._read_keys("keys.bin"):
+            self._entries[bytes(row["key"])] = int(row["slot"])
+        journal = self._read_keys("keys.log")
+        if len(journal):
+            # Later records win: a slot reused by an eviction drops the key that held it
+            owners = {slot: key for key, slot in self._entries.items()}
+            for row in journal:
+                key, slot = bytes(row["key"]), int(row["slot"])
+                previous = owners.get(slot)
+                if previous is not None and previous != key:
+                    self._entries.pop(previous, None)
+                if self._entries.get(key, slot) != slot:
+                    owners.pop(self._entries[key], None)
+                owners[slot] = key
+                self._entries[key] = slot
+                self._entries.move_to_end(key)
+            self._journal_records = len(journal)
+        used = set(self._entries.values())
+        self._free_slots = [s for s in range(self.max_entries - 1, -1, -1) if s not in used]
+        logger.info(f"Loaded embedding cache with {len(self._entries)} entries from {self.cache_dir}")
+
+    def _read_keys(self, name: str) -> np.ndarray:
+        try:
+            with open(self._path(name), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return np.empty(0, dtype=KEY_DTYPE)
+        # A record cut short by a crash mid-append is dropped
+        usable = len(data) - len(data) % KEY_DTYPE.itemsize
+        return np.frombuffer(data[:usable], dtype=KEY_DTYPE)
+
+    def _allocate(self, dim: int) -> None:
+        self._dim = dim
+        self._vectors = np.memmap(
+            self._path("vectors.f32"), dtype=np.float32, mode="w+",
+            shape=(self.max_entries, dim)
+        )
+        self._entries.clear()
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+        with open(self._path("meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"dim": dim, "max_entries": self.max_entries}, f)
+        self._compact()
+
+    def get_many(self, keys: List[bytes]) -> List[Optional[np.ndarray]]:
+        results: List[Optional[np.ndarray]] = []
+        with self._lock:
+            for key in keys:
+                slot = self._entries.get(key)
+                if slot is None:
+                    self.misses += 1
+                    results.append(None)
+                    continue
+                self._entries.move_to_end(key)
+                self.hits += 1
+                results.append(np.array(self._vectors[slot]))
+        return results
+
+    def put_many(self, keys: List[bytes], vectors: List[List[float]]) -> None:
+        if not keys:
+            return
+        with self._lock:
+            if self._vectors is None or len(vectors[0]) != self._dim:
+                self._allocate(len(vectors[0]))
+            written: List[bytes] = []
+            slots: List[int] = []
+            for key, vector in zip(keys, vectors):
+                slot = self._entries.get(key)
+                if slot is None:
+                    if not self._free_slots:
+                        _, slot = self._entries.popitem(last=False)
+                        self.evictions += 1
+                    else:
+                        slot = self._free_slots.pop()
+                    self._entries[key] = slot
+                else:
+                    self._entries.move_to_end(key)
+                self._vectors[slot] = vector
+                written.append(key)
+                slots.append(slot)
+            # Vectors first, so the journal never points at rows not yet written
+            self._vectors.flush()
+            with open(self._path("keys.log"), "ab") as f:
+                f.write(_key_records(written, slots, len(written)).tobytes())
+            self._journal_records += len(written)
+            if self._journal_records > max(self.compact_after, len(self._entries) // 2):
+                self._compact()
+
+    def _compact(self) -> None:
+        """Writes the whole index in LRU order and empties the journal. Callers hold the lock."""
+        tmp_path = self._path("keys.bin.tmp")
+        _key_records(self._entries.keys(), self._entries.values(), len(self._entries)).tofile(tmp_path)
+        os.replace(tmp_path, self._path("keys.bin"))
+        # Replaying a journal left by a crash here over the new index is harmless
+        with open(self._path("keys.log"), "wb"):
+            pass
+        self._journal_records = 0
+
+    def save(self) -> None:
+        """Persists the recency of hits as well, and leaves no journal to replay on the next load."""
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+                self._compact()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings model and serves repeated chunk texts from an EmbeddingCache.
+    Query embeddings are passed through unchanged.
+    """
+
+    def __init__(self, underlying: Embeddings, cache: EmbeddingCache):
+        self.underlying = underlying
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.cache.key(t) for t in texts]
+        cached = self.cache.get_many(keys)
+
+        # Embed each distinct missing text once, even if it repeats within the batch
+        missing: Dict[bytes, str] = {}
+        for key, text, vector in zip(keys, texts, cached):
+            if vector is None and key not in missing:
+                missing[key] = text
+
+        CACHE_EVENTS.labels("embedding", "miss").inc(len(missing))
+        CACHE_EVENTS.labels("embedding", "hit").inc(len(texts) - sum(v is None for v in cached))
+        computed: Dict[bytes, List[float]] = {}
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(list(computed.keys()), vectors)
+
+        return [
+            vector.tolist() if vector is not None else list(computed[key])
+            for key, vector in zip(keys, cached)
+        ]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
@@ -0,0 +1,271 @@
+from typing import Any, Callable, Dict, List, Optional
+from langchain_core.embeddings import Embeddings
+import numpy as np
+import json
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LazyEmbeddings(Embeddings):
+    """
+    Builds the embedding model on first use instead of at construction, so
+    creating an engine (and loading a store, which only needs the vectors)
+    doesn't import sentence-transformers or read model weights. `load` forces
+    it, e.g. in a warmup thread or before forking workers. Other attributes
+    are looked up on the loaded model.
+    """
+
+    def __init__(self, factory: Callable[[], Embeddings], name: str = ""):
+        self.factory = factory
+        self.name = name
+        self.load_seconds: Optional[float] = None
+        self._model: Optional[Embeddings] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def load(self) -> Embeddings:
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    started = time.perf_counter()
+                    model = self.factory()
+                    self.load_seconds = time.perf_counter() - started
+                    logger.info(f"Loaded embedding model {self.name} in {self.load_seconds:.2f}s")
+                    self._model = model
+        return self._model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.load().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.load().embed_query(text)
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for attributes not set in __init__
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx_int8")
+
+# Minimum cosine similarity to the PyTorch model a backend must reach on PARITY_TEXTS
+PARITY_THRESHOLDS = {"torch": 0.9999, "onnx": 0.999, "onnx_int8": 0.98}
+
+PARITY_TEXTS = [
+    "Objetivos do projeto: desenvolver um protótipo de sensor industrial.",
+    "Metodologia",
+    "O orçamento total previsto é de R$ 1.250.000,00, distribuído em três etapas de execução.",
+    "Technology readiness level 4: component validation in a laboratory environment.",
+    " ".join(["Cronograma de atividades com marcos trimestrais e entregas parciais."] * 12),
+]
+
+
+class EmbeddingParityError(RuntimeError):
+    """Raised when a backend's vectors drift too far from the reference model's."""
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Sentence embeddings computed with ONNX Runtime instead of PyTorch: the same
+    transformer exported to ONNX (optionally with int8 dynamically quantized
+    weights), followed by the mean pooling and L2 normalization of the
+    sentence-transformers model. Texts are tokenized once, sorted by token
+    count and batched longest first, so each batch is padded only to the
+    length of its own longest text.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        model_path: str,
+        batch_size: int = 32,
+        threads: Optional[int] = None,
+        max_length: int = 256,
+        normalize: bool = True,
+    ):
+        try:
+            import onnxruntime
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError("The ONNX embedding backends need onnxruntime and transformers (pip install onnxruntime)") from e
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.normalize = normalize
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def _run(self, batch: List[Dict[str, List[int]]]) -> np.ndarray:
+        width = max(len(item["input_ids"]) for item in batch)
+        feed = {}
+        for name in self.input_names:
+            pad = self.tokenizer.pad_token_id if name == "input_ids" else 0
+            feed[name] = np.array([item[name] + [pad] * (width - len(item[name])) for item in batch], dtype=np.int64)
+        hidden = self.session.run(None, feed)[0]
+        mask = feed["attention_mask"][:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.normalize:
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        encoded = self.tokenizer(list(texts), truncation=True, max_length=self.max_length)
+        items = [
+            {name: encoded[name][i] for name in self.input_names}
+            for i in range(len(texts))
+        ]
+        order = sorted(range(len(items)), key=lambda i: -len(items[i]["input_ids"]))
+        vectors: Optional[np.ndarray] = None
+        for start in range(0, len(order), self.batch_size):
+            rows = order[start:start + self.batch_size]
+            pooled = self._run([items[i] for i in rows])
+            if vectors is None:
+                vectors = np.empty((len(texts), pooled.shape[1]), dtype=np.float32)
+            vectors[rows] = pooled
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def hub_name(model_name: str) -> str:
+    """sentence-transformers accepts short names ("all-MiniLM-L6-v2"); transformers needs the org."""
+    return model_name if "/" in model_name or os.path.isdir(model_name) else f"sentence-transformers/{model_name}"
+
+
+def onnx_model_path(model_name: str, onnx_dir: str, quantized: bool) -> str:
+    """Exports (and quantizes) the model into `onnx_dir` on first use; returns the .onnx file to load."""
+    model_dir = os.path.join(onnx_dir, hub_name(model_name).replace("/", "__"))
+    fp32_path = os.path.join(model_dir, "model.onnx")
+    int8_path = os.path.join(model_dir, "model.int8.onnx")
+    if not os.path.exists(fp32_path):
+        os.makedirs(model_dir, exist_ok=True)
+        export_onnx(hub_name(model_name), fp32_path)
+    if quantized and not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        logger.info(f"Quantizing {fp32_path} to int8...")
+        quantize_dynamic(fp32_path, int8_path + ".tmp", weight_type=QuantType.QInt8)
+        os.replace(int8_path + ".tmp", int8_path)
+    return int8_path if quantized else fp32_path
+
+
+def export_onnx(model_name: str, path: str, opset: int = 14) -> None:
+    """Exports the transformer of a sentence-transformers model (token embeddings out) to ONNX."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    logger.info(f"Exporting {model_name} to {path}...")
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    sample = tokenizer(["export"], return_tensors="pt")
+    names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    axes = {name: {0: "batch", 1: "sequence"} for name in names + ["last_hidden_state"]}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in names),
+            path + ".tmp",
+            input_names=names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=axes,
+            opset_version=opset,
+        )
+    os.replace(path + ".tmp", path)
+
+
+def cap_torch_threads(threads: Optional[int]) -> None:
+    """Caps PyTorch's intra-op pool, which otherwise uses every core (and oversubscribes next to other workers)."""
+    if threads:
+        import torch
+
+        torch.set_num_threads(threads)
+
+
+def torch_embeddings(model_name: str, batch_size: int = 32, threads: Optional[int] = None) -> Embeddings:
+    """The reference backend: sentence-transformers on PyTorch (which already batches by length)."""
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    cap_torch_threads(threads)
+    return HuggingFaceEmbeddings(model_name=model_name, encode_kwargs={"batch_size": batch_size})
+
+
+def parity_check(
+    candidate: Embeddings,
+    reference: Embeddings,
+    min_cosine: float,
+    texts: Optional[List[str]] = None,
+) -> Dict[str, float]:
+    """
+    Cosine similarity between `candidate`'s and `reference`'s vectors for the
+    same texts. Raises EmbeddingParityError when any falls below `min_cosine`.
+    """
+    texts = texts or PARITY_TEXTS
+    a = np.asarray(candidate.embed_documents(texts), dtype=np.float32)
+    b = np.asarray(reference.embed_documents(texts), dtype=np.float32)
+    cosine = (a * b).sum(axis=1) / np.maximum(np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1), 1e-12)
+    result = {"min_cosine": float(cosine.min()), "mean_cosine": float(cosine.mean())}
+    if result["min_cosine"] < min_cosine:
+        raise EmbeddingParityError(f"Embedding parity {result['min_cosine']:.4f} below {min_cosine} on {len(texts)} texts")
+    return result
+
+
+def build_embeddings(
+    model_name: str,
+    backend: str = "torch",
+    batch_size: int = 32,
+    threads: Optional[int] = None,
+    onnx_dir: str = "onnx_models",
+) -> Embeddings:
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {EMBEDDING_BACKENDS}")
+    if backend == "torch":
+        return torch_embeddings(model_name, batch_size=batch_size, threads=threads)
+    path = onnx_model_path(model_name, onnx_dir, quantized=backend == "onnx_int8")
+    return OnnxEmbeddings(hub_name(model_name), path, batch_size=batch_size, threads=threads)
+
+
+if __name__ == "__main__":
+    # Exports a backend ahead of time (e.g. while building the image) and reports parity and latency:
+    #   python -m src.embeddings --backend onnx_int8
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export an embedding backend and compare it with the PyTorch model.")
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--backend", choices=EMBEDDING_BACKENDS, default="onnx_int8")
+    parser.add_argument("--onnx-dir", default="onnx_models")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    reference = torch_embeddings(args.model, batch_size=args.batch_size, threads=args.threads)
+    candidate = build_embeddings(args.model, args.backend, args.batch_size, args.threads, args.onnx_dir)
+    report: Dict[str, Any] = {"backend": args.backend, **parity_check(candidate, reference, PARITY_THRESHOLDS[args.backend])}
+    corpus = PARITY_TEXTS * 40
+    for name, model in (("torch", reference), (args.backend, candidate)):
+        model.embed_documents(corpus[:8])
+        started = time.perf_counter()
+        model.embed_documents(corpus)
+        report[f"{name}_docs_per_s"] = len(corpus) / (time.perf_counter() - started)
+        started = time.perf_counter()
+        for text in PARITY_TEXTS:
+            model.embed_query(text)
+        report[f"{name}_query_ms"] = (time.perf_counter() - started) * 1000 / len(PARITY_TEXTS)
+    print(json.dumps(report, indent=2))
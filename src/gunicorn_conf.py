@@ -0,0 +1,43 @@
+"""
+Multi-worker serving of the audit API:
+
+    gunicorn src.api:app -c src/gunicorn_conf.py
+
+Workers run with INDEX_ROLE=reader: they memory-map the vector store read-only
+and reload it when the writer publishes a new manifest. Uploads go to a single
+writer process, e.g. `INDEX_ROLE=writer uvicorn src.api:app --port 8001`,
+pointed at the same VECTOR_DB_PATH.
+
+The app is preloaded in the master, which also creates the engine (see
+src.api.preload) before forking, so the embedding model weights and the mapped
+index are shared by all workers instead of copied into each one. Nothing runs
+inference in the master, so PyTorch thread pools are only created after fork.
+"""
+import multiprocessing
+import os
+
+os.environ.setdefault("INDEX_ROLE", "reader")
+# HF tokenizers warn (and may deadlock) when their thread pool exists before fork
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = 120
+
+
+def when_ready(server):
+    # Runs in the master after the app is imported and before any worker forks
+    from src.api import preload
+
+    preload()
+
+
+def child_exit(server, worker):
+    # With PROMETHEUS_MULTIPROC_DIR set, /metrics aggregates every worker's samples;
+    # drop the live gauges of workers that are gone
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
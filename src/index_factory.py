@@ -0,0 +1,134 @@
+from dataclasses import dataclass
+from typing import Optional
+import faiss
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+# FAISS warns below ~39 training points per IVF list
+MIN_POINTS_PER_LIST = 39
+
+
+@dataclass
+class IndexSpec:
+    """
+    Which FAISS index RAGEngine builds when it (re)trains the store, and the
+    default search-time knobs. Flat is exact; IVF/HNSW trade recall for speed and
+    IVF-PQ also compresses vectors to `pq_m` bytes each.
+    """
+    index_type: str = "flat"
+    nlist: int = 1024
+    pq_m: int = 16
+    pq_bits: int = 8
+    hnsw_m: int = 32
+    ef_construction: int = 200
+    nprobe: int = 16
+    ef_search: int = 64
+    train_sample: int = 50_000
+
+    def __post_init__(self):
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type {self.index_type!r}, expected one of {INDEX_TYPES}")
+
+    @classmethod
+    def from_settings(cls, settings) -> "IndexSpec":
+        return cls(
+            index_type=settings.FAISS_INDEX_TYPE,
+            nlist=settings.FAISS_NLIST,
+            pq_m=settings.FAISS_PQ_M,
+            hnsw_m=settings.FAISS_HNSW_M,
+            nprobe=settings.FAISS_NPROBE,
+            ef_search=settings.FAISS_EF_SEARCH,
+            train_sample=settings.FAISS_TRAIN_SAMPLE
+        )
+
+
+def index_kind(index: faiss.Index) -> str:
+    """Reverse of build_index: the INDEX_TYPES name for an existing index."""
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def build_index(spec: IndexSpec, vectors: np.ndarray, seed: int = 0) -> faiss.Index:
+    """
+    Builds an index of `spec.index_type` holding `vectors`. IVF variants are
+    trained on a random sample of at most `spec.train_sample` vectors. Falls
+    back to a simpler type when there are too few vectors to train.
+    """
+    n, dim = vectors.shape
+    index_type = spec.index_type
+
+    nlist = min(spec.nlist, n // MIN_POINTS_PER_LIST)
+    if index_type == "ivf_pq" and (n < 2 ** spec.pq_bits or dim % spec.pq_m):
+        logger.warning(f"Cannot train IVF-PQ (m={spec.pq_m}) on {n} vectors of dim {dim}, using IVF-Flat.")
+        index_type = "ivf_flat"
+    if index_type in ("ivf_flat", "ivf_pq") and nlist < 2:
+        logger.warning(f"Too few vectors ({n}) to train an IVF index, using a flat index.")
+        index_type = "flat"
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, spec.hnsw_m)
+        index.hnsw.efConstruction = spec.ef_construction
+    else:
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf_pq":
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, spec.pq_m, spec.pq_bits)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(n, size=min(n, spec.train_sample), replace=False)]
+        logger.info(f"Training {index_type} index (nlist={nlist}) on {len(sample)} vectors...")
+        index.train(sample)
+
+    index.add(vectors)
+    prepare_index(index, spec)
+    return index
+
+
+def reserve(index: faiss.IndexFlat, n: int) -> None:
+    """
+    Allocates room for `n` vectors in a flat index, so adds up to that size
+    write past the vectors already held without moving them: searches and
+    EmbeddingMatrix views reading those keep working meanwhile. Growing the
+    std::vector and shrinking it back keeps its capacity.
+    """
+    size = index.codes.size()
+    if n * index.code_size > size:
+        index.codes.resize(n * index.code_size)
+        index.codes.resize(size)
+
+
+def prepare_index(index: faiss.Index, spec: IndexSpec) -> None:
+    """Applies default search knobs and enables reconstruct() (needed for MMR) on IVF indexes."""
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = spec.nprobe
+        if index.direct_map.type == faiss.DirectMap.NoMap:
+            index.make_direct_map()
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = spec.ef_search
+
+
+def search_params(
+    index: faiss.Index,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+) -> Optional[faiss.SearchParameters]:
+    """
+    Per-query overrides passed to index.search(..., params=...). Unlike setting
+    index.nprobe, this is safe when several threads search the same index.
+    """
+    if nprobe is not None and isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=nprobe)
+    if ef_search is not None and isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search)
+    return None
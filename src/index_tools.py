@@ -0,0 +1,148 @@
+"""
+Offline tooling for the FAISS store, on each shard when INDEX_SHARDING="source".
+
+    python -m src.index_tools build
+        Retrains every store as FAISS_INDEX_TYPE and compacts it into one segment.
+
+    python -m src.index_tools recall --k 10 --queries 200 --nprobe 8 16 32 --ef-search 32 64 128
+        Reports recall@k and per-query latency of each store's index against
+        exact (flat) search over the same vectors, for each search setting.
+"""
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from src.config import settings
+from src.docstore import doc_at
+from src.index_factory import index_kind, search_params
+from src.rag_engine import RAGEngine
+from src.shards import ShardedRAGEngine, build_engine
+import argparse
+import json
+import time
+import faiss
+import numpy as np
+
+
+def measure_recall(
+    engine: RAGEngine,
+    k: int = 10,
+    num_queries: int = 200,
+    nprobes: Optional[List[int]] = None,
+    ef_searches: Optional[List[int]] = None,
+    seed: int = 0,
+) -> Optional[Dict]:
+    """
+    Uses a random sample of indexed chunks as queries. Ground truth comes from an
+    exact flat index over the chunks' embeddings (served by the embedding cache
+    when enabled), so lossy indexes like IVF-PQ are measured against true vectors.
+    Every part of the store is searched and the hits merged by distance, as
+    queries do, so segments added since the last compaction count too. Returns
+    None for a store without live chunks.
+    """
+    if engine.snapshot is None:
+        try:
+            engine.load_vector_store()
+        except FileNotFoundError:
+            return None
+    parts = engine._parts()
+
+    ids: List[str] = []
+    texts: List[str] = []
+    for part in parts:
+        for position in sorted(part.index_to_docstore_id):
+            ids.append(part.index_to_docstore_id[position])
+            texts.append(doc_at(part, position).page_content)
+    if not ids:
+        return None
+    normalize = parts[0]._normalize_L2
+    vectors = np.asarray(engine.embeddings.embed_documents(texts), dtype=np.float32)
+    if normalize:
+        faiss.normalize_L2(vectors)
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(texts), size=min(num_queries, len(texts)), replace=False)
+    queries = np.asarray(engine.embed_queries([texts[i] for i in sample]), dtype=np.float32)
+    if normalize:
+        faiss.normalize_L2(queries)
+
+    _, truth = exact.search(queries, k)
+    truth_ids = [{ids[j] for j in row if j != -1} for row in truth]
+
+    kinds = [index_kind(part.index) for part in parts]
+    settings_to_try: List[Dict] = [{}]
+    if any(kind.startswith("ivf") for kind in kinds):
+        settings_to_try = [{"nprobe": n} for n in (nprobes or [1, 4, 16, 64])]
+    elif "hnsw" in kinds:
+        settings_to_try = [{"ef_search": ef} for ef in (ef_searches or [16, 64, 256])]
+
+    runs = []
+    for knobs in settings_to_try:
+        started = time.perf_counter()
+        found: List[List[Tuple[float, str]]] = [[] for _ in queries]
+        for part in parts:
+            id_map = part.index_to_docstore_id
+            distances, positions = part.index.search(queries, k, params=search_params(part.index, **knobs))
+            for row, (row_distances, row_positions) in enumerate(zip(distances, positions)):
+                found[row].extend((float(d), id_map[int(p)]) for d, p in zip(row_distances, row_positions) if int(p) in id_map)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        hits = 0
+        for row, expected in zip(found, truth_ids):
+            got = {doc_id for _, doc_id in sorted(row)[:k]}
+            hits += len(got & expected)
+        runs.append({
+            **knobs,
+            f"recall@{k}": hits / max(1, sum(len(t) for t in truth_ids)),
+            "ms_per_query": elapsed_ms / len(queries),
+        })
+
+    return {"index_type": kinds[0], "parts": len(parts), "chunks": len(ids), "queries": len(queries), "k": k, "runs": runs}
+
+
+def stores(engine: Union[RAGEngine, ShardedRAGEngine]) -> Iterator[Tuple[Optional[str], RAGEngine]]:
+    """(source, engine) of every shard of a sharded store, or (None, engine) for a single one."""
+    if isinstance(engine, ShardedRAGEngine):
+        yield from engine.stores()
+    else:
+        yield None, engine
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("build", help="Retrain the store as FAISS_INDEX_TYPE")
+
+    recall = commands.add_parser("recall", help="Measure recall@k against exact search")
+    recall.add_argument("--k", type=int, default=10)
+    recall.add_argument("--queries", type=int, default=200)
+    recall.add_argument("--nprobe", type=int, nargs="*")
+    recall.add_argument("--ef-search", type=int, nargs="*")
+
+    args = parser.parse_args(argv)
+    engine = build_engine(settings)
+    engine.load_vector_store()
+
+    if args.command == "build":
+        engine.rebuild_index()
+        built: Counter = Counter()
+        chunks = 0
+        for _, store in stores(engine):
+            if store.vector_store is None:
+                continue  # nothing left to index in this store
+            built[index_kind(store.vector_store.index)] += 1
+            chunks += store.vector_store.index.ntotal
+        # Stores too small to train FAISS_INDEX_TYPE are built as a simpler type
+        print(json.dumps({"index_type": settings.FAISS_INDEX_TYPE, "stores": sum(built.values()), "chunks": chunks, "built": dict(built)}))
+    else:
+        reports = [
+            {"source": source, **report}
+            for source, store in stores(engine)
+            if (report := measure_recall(store, args.k, args.queries, args.nprobe, args.ef_search)) is not None
+        ]
+        print(json.dumps({"stores": reports}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
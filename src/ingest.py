@@ -1,27 +1,71 @@
-import pdfplumber
-from typing import List
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from src.extraction import open_document
+from src.metrics import CHUNKS, PAGES, span
+from src.sections import SectionTracker
 import logging
+import multiprocessing
+import os
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def _extract_page_range(file_path: str, start: int, end: int, backend: str = "auto") -> List[Tuple[int, str, str]]:
+    """
+    Extracts (page, text, extractor) for pages [start, end). Runs inside a
+    worker process, so it opens its own handle to the PDF.
+    """
+    doc = open_document(file_path, backend)
+    try:
+        return [(i, *doc.extract(i)) for i in range(start, end)]
+    finally:
+        doc.close()
+
+def _worker_context():
+    """
+    Start method of the extraction workers. Ingestion runs on job threads next
+    to prefetch, batching and torch threads, and forking a multithreaded process
+    can copy locks held at that moment into the child, where nothing releases
+    them. forkserver (spawn where unavailable) starts workers from a clean process.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
 class IngestionEngine:
     """
     Engine responsible for ingesting PDF documents and chunking them 
     for RAG processing.
     """
     
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+    def __init__(
+        self,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        max_workers: Optional[int] = None,
+        parallel_min_pages: int = 32,
+        extraction_backend: str = "auto",
+    ):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        # max_workers=None uses every core; 1 disables parallel extraction
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.parallel_min_pages = parallel_min_pages
+        # See src.extraction.open_document: "auto", "pypdfium2" or "pdfplumber"
+        self.extraction_backend = extraction_backend
+        # Progress of the current file, updated while iter_pages/iter_chunks run
+        self.pages_processed = 0
+        self.chunks_processed = 0
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=self.chunk_size,
             chunk_overlap=self.chunk_overlap,
             separators=["\n\n", "\n", ". ", " ", ""],
             length_function=len,
+            # Offset of each chunk in its page, so overlapping chunks can be merged at query time
+            add_start_index=True,
         )
 
     def load_pdf(self, file_path: str) -> List[Document]:
@@ -29,39 +73,118 @@ class IngestionEngine:
         Loads a PDF file and returns a list of LangChain Documents,
         one per page, with metadata.
         """
-        documents = []
         try:
-            with pdfplumber.open(file_path) as pdf:
-                for i, page in enumerate(pdf.pages):
-                    text = page.extract_text()
-                    if text:
-                        # Clean up some common PDF artifacts if necessary
-                        text = text.strip()
-                        
-                        metadata = {
-                            "source": file_path,
-                            "page": i + 1,
-                            "total_pages": len(pdf.pages)
-                        }
-                        documents.append(Document(page_content=text, metadata=metadata))
-            
+            documents = list(self.iter_pages(file_path))
             logger.info(f"Successfully loaded {len(documents)} pages from {file_path}")
             return documents
         except Exception as e:
             logger.error(f"Error loading PDF {file_path}: {e}")
             raise
 
+    def iter_pages(self, file_path: str) -> Iterator[Document]:
+        """
+        Yields one Document per non-empty page, in page order, extracting pages
+        only as the consumer asks for them.
+        """
+        self.pages_processed = 0
+        doc = open_document(file_path, self.extraction_backend)
+        try:
+            total_pages = doc.page_count
+            if self.max_workers > 1 and total_pages >= self.parallel_min_pages:
+                pages = self._iter_parallel(file_path, total_pages)
+            else:
+                pages = self._iter_serial(doc)
+
+            for i, text, extractor in pages:
+                self.pages_processed += 1
+                PAGES.inc()
+                # Clean up some common PDF artifacts if necessary
+                text = text.strip()
+                if text:
+                    metadata = {
+                        "source": file_path,
+                        "page": i + 1,
+                        "total_pages": total_pages,
+                        "extractor": extractor
+                    }
+                    yield Document(page_content=text, metadata=metadata)
+        finally:
+            doc.close()
+
+    def iter_chunks(self, file_path: str) -> Iterator[Document]:
+        """
+        Streaming Load -> Chunk: yields the chunks of each page as soon as
+        the page is extracted, so only a bounded window of pages is in memory.
+        Chunks are tagged with their section (see src.sections.SectionTracker).
+        """
+        self.chunks_processed = 0
+        sections = SectionTracker()
+        for page in self.iter_pages(file_path):
+            with span("chunk"):
+                chunks = self._split_page(page, sections)
+            CHUNKS.labels("chunked").inc(len(chunks))
+            for chunk in chunks:
+                self.chunks_processed += 1
+                yield chunk
+
+    def _split_page(self, page: Document, sections: SectionTracker) -> List[Document]:
+        chunks = self.text_splitter.split_documents([page])
+        sections.tag(page.page_content, chunks)
+        return chunks
+
+    def _iter_serial(self, doc) -> Iterator[Tuple[int, str, str]]:
+        for i in range(doc.page_count):
+            with span("extract_page"):
+                text, extractor = doc.extract(i)
+            yield i, text, extractor
+
+    def _iter_parallel(self, file_path: str, total_pages: int) -> Iterator[Tuple[int, str, str]]:
+        """
+        Shards the page range across a process pool. Shards are smaller than
+        total_pages / workers so uneven pages (tables, scans) balance out, and
+        at most two shards per worker are in flight: when the consumer falls
+        behind, extraction pauses instead of buffering the whole file.
+        """
+        workers = min(self.max_workers, total_pages)
+        shard_size = max(1, -(-total_pages // (workers * 4)))
+        shards = [(start, min(start + shard_size, total_pages)) for start in range(0, total_pages, shard_size)]
+
+        logger.info(f"Extracting {total_pages} pages with {workers} workers ({len(shards)} shards)...")
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=_worker_context())
+        try:
+            in_flight: Deque[Future] = deque()
+            next_shard = 0
+            while next_shard < len(shards) or in_flight:
+                while next_shard < len(shards) and len(in_flight) < workers * 2:
+                    start, end = shards[next_shard]
+                    in_flight.append(executor.submit(_extract_page_range, file_path, start, end, self.extraction_backend))
+                    next_shard += 1
+                # Consume in submission order, which keeps pages in order
+                with span("extract_wait"):
+                    shard = in_flight.popleft().result()
+                for page in shard:
+                    yield page
+        finally:
+            # Closed early (failed or cancelled ingest): drop the shards not started yet
+            executor.shutdown(wait=True, cancel_futures=True)
+
     def chunk_documents(self, documents: List[Document]) -> List[Document]:
         """
-        Splits documents into smaller semantic chunks.
+        Splits documents into smaller semantic chunks, tagged with their section.
+        Pages of a document are expected in page order.
         """
-        chunks = self.text_splitter.split_documents(documents)
+        chunks: List[Document] = []
+        trackers: Dict[str, SectionTracker] = {}
+        for page in documents:
+            source = page.metadata.get("source", "")
+            chunks.extend(self._split_page(page, trackers.setdefault(source, SectionTracker())))
         logger.info(f"Split {len(documents)} pages into {len(chunks)} chunks.")
         return chunks
 
     def process_file(self, file_path: str) -> List[Document]:
         """
         End-to-end processing: Load -> Chunk.
+        Use iter_chunks for large files to avoid holding every page at once.
         """
         raw_docs = self.load_pdf(file_path)
         return self.chunk_documents(raw_docs)
\ No newline at end of file
@@ -0,0 +1,147 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+import threading
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once cancellation has been requested."""
+
+
+class QueueFull(Exception):
+    """Raised when the job queue already holds the maximum number of pending jobs."""
+
+
+@dataclass
+class IngestJob:
+    filename: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "queued"  # queued | running | succeeded | failed | cancelled
+    pages_processed: int = 0
+    chunks_processed: int = 0
+    chunks_added: int = 0
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    cancel_requested: threading.Event = field(default_factory=threading.Event, repr=False)
+    future: Optional[Future] = field(default=None, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    def check_cancelled(self) -> None:
+        if self.cancel_requested.is_set():
+            raise JobCancelled(f"Job {self.id} cancelled")
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = None
+        if self.started_at:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "pages_processed": self.pages_processed,
+            "chunks_processed": self.chunks_processed,
+            "chunks_added": self.chunks_added,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "elapsed_seconds": elapsed,
+            "pages_per_second": self.pages_processed / elapsed if elapsed else None,
+            "chunks_per_second": self.chunks_processed / elapsed if elapsed else None,
+        }
+
+
+class JobManager:
+    """
+    Runs ingestion jobs on a bounded thread pool so uploads never block the
+    event loop. At most `max_concurrent` jobs run at once and at most
+    `max_queued` wait behind them; finished jobs are kept for `retention_seconds`.
+    """
+
+    def __init__(self, max_concurrent: int = 2, max_queued: int = 16, retention_seconds: float = 3600):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="ingest")
+        self._jobs: Dict[str, IngestJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, filename: str, work: Callable[[IngestJob], None]) -> IngestJob:
+        """
+        Queues `work(job)`. The callable should update the job's progress counters
+        and call job.check_cancelled() between batches.
+        """
+        with self._lock:
+            self._prune()
+            pending = sum(1 for j in self._jobs.values() if j.status == "queued")
+            if pending >= self.max_queued:
+                raise QueueFull(f"{pending} ingestion jobs already queued")
+            job = IngestJob(filename=filename)
+            self._jobs[job.id] = job
+            job.future = self._executor.submit(self._run, job, work)
+        return job
+
+    def _run(self, job: IngestJob, work: Callable[[IngestJob], None]) -> None:
+        if job.cancel_requested.is_set():
+            job.finished_at = time.time()
+            job.status = "cancelled"
+            return
+
+        job.started_at = time.time()
+        job.status = "running"
+        status = "failed"
+        try:
+            work(job)
+            status = "succeeded"
+        except JobCancelled:
+            status = "cancelled"
+            logger.info(f"Ingestion job {job.id} ({job.filename}) cancelled.")
+        except Exception as e:
+            job.error = str(e)
+            logger.exception(f"Ingestion job {job.id} ({job.filename}) failed")
+        finally:
+            # Finished fields first: pollers treat the status as final once it is
+            job.finished_at = time.time()
+            job.status = status
+
+    def active(self, filename: str) -> Optional[IngestJob]:
+        """The queued or running job for `filename`, if there is one."""
+        with self._lock:
+            return next((j for j in self._jobs.values() if j.filename == filename and not j.done), None)
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[IngestJob]:
+        return sorted(self._jobs.values(), key=lambda j: j.created_at, reverse=True)
+
+    def cancel(self, job_id: str) -> Optional[IngestJob]:
+        job = self._jobs.get(job_id)
+        if job is None or job.done:
+            return job
+        job.cancel_requested.set()
+        if job.future is not None and job.future.cancel():
+            job.finished_at = time.time()
+            job.status = "cancelled"
+        return job
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.retention_seconds
+        expired = [i for i, j in self._jobs.items() if j.done and (j.finished_at or 0) < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def shutdown(self) -> None:
+        for job in self._jobs.values():
+            job.cancel_requested.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
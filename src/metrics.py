@@ -0,0 +1,130 @@
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+import json
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Stages run from sub-millisecond (prompt rendering) to tens of seconds (LLM calls)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+REQUEST_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Duration of one pipeline stage", ["stage"], buckets=STAGE_BUCKETS)
+REQUEST_SECONDS = Histogram("rag_request_seconds", "Duration of a traced request", ["kind"], buckets=REQUEST_BUCKETS)
+CACHE_EVENTS = Counter("rag_cache_events_total", "Cache lookups", ["cache", "result"])
+TOKENS = Counter("rag_tokens_total", "Tokens: context sent, context saved by packing, generated output", ["kind"])
+CHUNKS = Counter("rag_chunks_total", "Chunks by pipeline step", ["step"])
+PAGES = Counter("rag_pages_total", "PDF pages extracted")
+RETRIEVALS = Counter("rag_retrievals_total", "Retrievals by route: section lookup or vector search", ["route"])
+# livesum: with several gunicorn workers (PROMETHEUS_MULTIPROC_DIR set), live processes are summed
+IN_FLIGHT = Gauge("rag_in_flight", "Operations in progress", ["kind"], multiprocess_mode="livesum")
+
+
+@dataclass
+class Trace:
+    """Stage timings of one request (an audit, an ingest job), collected by `span`."""
+    kind: str
+    attrs: Dict[str, Any]
+    started: float = field(default_factory=time.perf_counter)
+    spans: List[Tuple[str, float]] = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, stage: str, seconds: float) -> None:
+        # Stages of one request may run on executor threads and concurrent tasks
+        with self._lock:
+            self.spans.append((stage, seconds * 1000))
+
+    def to_dict(self, total_ms: float) -> Dict[str, Any]:
+        stages: Dict[str, float] = {}
+        for stage, ms in self.spans:
+            stages[stage] = stages.get(stage, 0.0) + ms
+        return {
+            "kind": self.kind,
+            "total_ms": round(total_ms, 2),
+            "stages_ms": {stage: round(ms, 2) for stage, ms in stages.items()},
+            "spans": len(self.spans),
+            **self.attrs,
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("rag_trace", default=None)
+_slow_lock = threading.Lock()
+_slow_traces: Deque[Dict[str, Any]] = deque(maxlen=100)
+_slow_threshold_ms = 5000.0
+
+
+def configure(slow_request_ms: float = 5000.0, slow_sample_size: int = 100) -> None:
+    """Requests slower than `slow_request_ms` are logged and the latest `slow_sample_size` kept for /metrics/slow."""
+    global _slow_traces, _slow_threshold_ms
+    with _slow_lock:
+        _slow_threshold_ms = slow_request_ms
+        _slow_traces = deque(_slow_traces, maxlen=slow_sample_size)
+
+
+def observe(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    current = _current_trace.get()
+    if current is not None:
+        current.add(stage, seconds)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Times a stage into rag_stage_seconds and, inside `trace`, into the request's breakdown."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+@contextmanager
+def trace(kind: str, **attrs: Any) -> Iterator[Trace]:
+    """
+    Collects the spans of one request. The trace is held in a context variable,
+    so spans in tasks and threads started with a copy of the context (asyncio
+    tasks, contextvars.copy_context().run) are attributed to it as well.
+    """
+    current = Trace(kind=kind, attrs=attrs)
+    token = _current_trace.set(current)
+    IN_FLIGHT.labels(kind).inc()
+    try:
+        yield current
+    finally:
+        IN_FLIGHT.labels(kind).dec()
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # Finished in another context (e.g. an abandoned streaming generator)
+            pass
+        elapsed = time.perf_counter() - current.started
+        REQUEST_SECONDS.labels(kind).observe(elapsed)
+        if elapsed * 1000 >= _slow_threshold_ms:
+            sample = current.to_dict(elapsed * 1000)
+            with _slow_lock:
+                _slow_traces.append(sample)
+            logger.warning(f"Slow {kind}: {json.dumps(sample, default=str)}")
+
+
+def slow_requests() -> List[Dict[str, Any]]:
+    """The most recent slow requests, newest first."""
+    with _slow_lock:
+        return list(reversed(_slow_traces))
+
+
+def render() -> Tuple[bytes, str]:
+    """Prometheus exposition of this process, or of all workers when PROMETHEUS_MULTIPROC_DIR is set."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
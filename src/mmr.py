@@ -0,0 +1,101 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+import faiss
+import numpy as np
+import os
+
+# Metadata equality per key (a list value matches any of its items), or a predicate on the metadata
+MetadataFilter = Union[Dict[str, Any], Callable[[Dict[str, Any]], bool]]
+
+
+class EmbeddingMatrix:
+    """
+    Unit-length rows of the vectors held by one FAISS index, for the cosine
+    similarities MMR needs. Flat and HNSW indexes store raw vectors contiguously,
+    so those are read in place (no copy, and still shared when the index is
+    memory-mapped) with inverse norms computed once; other index types are
+    reconstructed and normalized once. Only valid while nothing is added to the
+    index, which holds for the parts of a published snapshot.
+    """
+
+    def __init__(self, index: faiss.Index):
+        self.index = index  # keeps the memory the in-place view points into alive
+        flat = _flat_storage(index)
+        self._inv_norms: Optional[np.ndarray] = None
+        if flat is not None:
+            self._vectors = faiss.rev_swig_ptr(flat.get_xb(), flat.ntotal * flat.d).reshape(flat.ntotal, flat.d)
+            squared = np.einsum("ij,ij->i", self._vectors, self._vectors)
+            self._inv_norms = (1.0 / np.sqrt(np.maximum(squared, 1e-24))).astype(np.float32)
+        else:
+            self._vectors = index.reconstruct_n(0, index.ntotal)
+            faiss.normalize_L2(self._vectors)
+
+    def rows(self, positions: np.ndarray) -> np.ndarray:
+        rows = self._vectors[positions]
+        if self._inv_norms is not None:
+            rows *= self._inv_norms[positions, None]
+        return rows
+
+
+def _flat_storage(index: faiss.Index) -> Optional[faiss.IndexFlat]:
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    return index if isinstance(index, faiss.IndexFlat) else None
+
+
+def mmr(query: np.ndarray, candidates: np.ndarray, k: int, lambda_mult: float = 0.5) -> List[int]:
+    """
+    Maximal marginal relevance over unit-length `candidates`, selecting like
+    LangChain's maximal_marginal_relevance (cosine similarity, most relevant
+    first). Each candidate's similarity to the selected set is kept as a running
+    maximum, so every step is one matrix-vector product instead of a Python loop.
+    Returns indices into `candidates` in selection order.
+    """
+    k = min(k, len(candidates))
+    if k <= 0:
+        return []
+    relevance = candidates @ (query / max(float(np.linalg.norm(query)), 1e-12))
+    first = int(np.argmax(relevance))
+    selected = [first]
+    chosen = np.zeros(len(candidates), dtype=bool)
+    chosen[first] = True
+    redundancy = candidates @ candidates[first]
+    while len(selected) < k:
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[chosen] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        chosen[best] = True
+        np.maximum(redundancy, candidates @ candidates[best], out=redundancy)
+    return selected
+
+
+def metadata_filter(spec: MetadataFilter) -> Callable[[Dict[str, Any]], bool]:
+    """Turns a filter spec into a predicate on chunk metadata."""
+    if callable(spec):
+        return spec
+
+    def accept(metadata: Dict[str, Any]) -> bool:
+        for key, expected in spec.items():
+            value = metadata.get(key)
+            if isinstance(expected, (list, tuple, set)):
+                if value not in expected:
+                    return False
+            elif value != expected:
+                return False
+        return True
+
+    return accept
+
+
+def scope_filter(documents: Sequence[str], spec: Optional[MetadataFilter] = None) -> Callable[[Dict[str, Any]], bool]:
+    """A predicate accepting chunks of `documents` (source path or file name) that also pass `spec`."""
+    wanted = set(documents)
+    extra = metadata_filter(spec) if spec else None
+
+    def accept(metadata: Dict[str, Any]) -> bool:
+        source = str(metadata.get("source", ""))
+        if source not in wanted and os.path.basename(source) not in wanted:
+            return False
+        return extra is None or extra(metadata)
+
+    return accept
@@ -1,61 +1,1294 @@
-from typing import List, Optional
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from dataclasses import dataclass
+from typing import Any, Callable, Collection, Dict, Iterable, List, Optional, Sequence, Tuple
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
 from langchain_core.documents import Document
-from langchain_core.vectorstores import VectorStoreRetriever
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from src.batching import QueryBatcher
+from src.docstore import IdLog, LazyIdMap, doc_at, load_segment, save_segment
+from src.embedding_cache import CachedEmbeddings, EmbeddingCache
+from src.embeddings import PARITY_THRESHOLDS, LazyEmbeddings, build_embeddings, parity_check
+from src import embeddings as embeddings_module
+from src.index_factory import IndexSpec, build_index, index_kind, prepare_index, reserve, search_params
+from src.metrics import CHUNKS, observe, span
+from src.mmr import EmbeddingMatrix, MetadataFilter, metadata_filter, mmr, scope_filter
+from src.utils import batched, clean_text
+import faiss
+import numpy as np
+import hashlib
+import heapq
+import json
 import os
+import shutil
+import threading
+import time
+import uuid
+import weakref
 import logging
 
 logger = logging.getLogger(__name__)
 
+SEGMENTS_DIR = "segments"
+GENERATIONS_DIR = "generations"
+# Names the published generation; replaced atomically to publish a new one
+CURRENT_NAME = "CURRENT"
+# Single manifest written before generations existed
+MANIFEST_NAME = "manifest.json"
+# Segment name used for stores written by the old create_vector_store (index files at the root).
+LEGACY_SEGMENT = "."
+# Live parts searched per query before the small ones are folded into one
+MAX_LIVE_PARTS = 8
+
+
+def content_hash(text: str) -> str:
+    """Hash of the whitespace-normalized chunk text, used to skip duplicate chunks."""
+    return hashlib.sha256(clean_text(text).encode("utf-8")).hexdigest()
+
+
+def _atomic_write(path: str, text: str) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class ReadOnlyIndexError(RuntimeError):
+    """Raised when a read-only engine (a serving worker) is asked to modify the store."""
+
+
+@dataclass(frozen=True)
+class IndexSnapshot:
+    """
+    What queries search: the stores ("parts") of one index version. The engine
+    publishes a new snapshot with a single attribute assignment, so a query
+    that already took one finishes on it without locks while ingest moves on.
+    Parts never change what they hold once published (a streaming ingest adds
+    past the positions its published part maps); deletes only unmap positions.
+    """
+    version: str
+    parts: Tuple[FAISS, ...]
+
+    @property
+    def size(self) -> int:
+        """Number of searchable chunks."""
+        return sum(len(p.index_to_docstore_id) for p in self.parts)
+
+
+class EngineRetriever(BaseRetriever):
+    """
+    MMR retriever backed by RAGEngine.retrieve, so it always searches the
+    engine's current store, supports per-query nprobe/efSearch and shares
+    batches with concurrent callers.
+    """
+    engine: Any
+    search_kwargs: Dict[str, Any]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.engine.retrieve(query, **self.search_kwargs)
+
+
 class RAGEngine:
-    def __init__(self, embedding_model_name: str, vector_store_path: str):
+    def __init__(
+        self,
+        embedding_model_name: str,
+        vector_store_path: str,
+        embedding_cache_dir: Optional[str] = None,
+        embedding_cache_max_entries: int = 200_000,
+        index_spec: Optional[IndexSpec] = None,
+        read_only: bool = False,
+        refresh_interval: float = 2.0,
+        keep_generations: int = 3,
+        gc_grace_seconds: float = 300,
+        query_batch_size: int = 32,
+        query_batch_window_ms: float = 2.0,
+        embedding_backend: str = "torch",
+        embedding_batch_size: int = 32,
+        embedding_threads: Optional[int] = None,
+        onnx_dir: str = "onnx_models",
+        embedding_parity_check: bool = False,
+        embeddings_from: Optional["RAGEngine"] = None,
+    ):
         self.embedding_model_name = embedding_model_name
+        # "torch" (sentence-transformers), "onnx" or "onnx_int8" (see src.embeddings)
+        self.embedding_backend = embedding_backend
+        self.embedding_batch_size = embedding_batch_size
+        self.embedding_threads = embedding_threads
+        self.onnx_dir = onnx_dir
+        self.embedding_parity_check = embedding_parity_check
         self.vector_store_path = vector_store_path
-        self.embeddings = HuggingFaceEmbeddings(model_name=self.embedding_model_name)
-        self.vector_store: Optional[FAISS] = None
+        self.index_spec = index_spec or IndexSpec()
+        # Read-only engines map the store instead of loading it and follow the writer's manifest
+        self.read_only = read_only
+        self.refresh_interval = refresh_interval
+        # Superseded generations (and the segments only they use) are deleted once they are
+        # neither among the newest `keep_generations` nor younger than `gc_grace_seconds`
+        self.keep_generations = keep_generations
+        self.gc_grace_seconds = gc_grace_seconds
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        # The model is loaded on the first embedding (or by warmup/load_model), not here
+        self.model = LazyEmbeddings(self._load_embeddings, name=f"{embedding_model_name} ({embedding_backend})")
+        self.embeddings = self.model
+        # Queries are embedded with the bare model; only chunk embeddings are cached
+        self.query_embeddings = self.embeddings
+        if embeddings_from is not None:
+            # A shard (see src.shards): all shards share one model and embedding cache
+            self.model, self.embeddings = embeddings_from.model, embeddings_from.embeddings
+            self.query_embeddings, self.embedding_cache = embeddings_from.query_embeddings, embeddings_from.embedding_cache
+        elif embedding_cache_dir:
+            self.embedding_cache = EmbeddingCache(
+                embedding_cache_dir,
+                # Backends differ slightly, so each keeps its own cache entries
+                model_name=self.embedding_model_name if embedding_backend == "torch" else f"{self.embedding_model_name}:{embedding_backend}",
+                max_entries=embedding_cache_max_entries
+            )
+            self.embeddings = CachedEmbeddings(self.embeddings, self.embedding_cache)
+        # Coalesces single-query retrievals from concurrent callers (disabled with a batch size of 1)
+        self.query_batcher: Optional[QueryBatcher] = None
+        if query_batch_size > 1:
+            self.query_batcher = QueryBatcher(self.batch_retrieve, max_batch=query_batch_size, window_ms=query_batch_window_ms)
+        self._snapshot: Optional[IndexSnapshot] = None
+        # Normalized embeddings per snapshot part for MMR, dropped with the part
+        self._matrices: "weakref.WeakKeyDictionary[FAISS, EmbeddingMatrix]" = weakref.WeakKeyDictionary()
+        self._matrix_lock = threading.Lock()
+        # Chunk id -> position per snapshot part, for section lookups
+        self._positions: "weakref.WeakKeyDictionary[FAISS, Dict[str, int]]" = weakref.WeakKeyDictionary()
+        self._manifest: Optional[Dict] = None
+        # (mtime, inode) of the CURRENT pointer the loaded store was built from
+        self._loaded_stamp: Optional[Tuple[int, int]] = None
+        self._last_refresh_check = 0.0
+        self._refresh_lock = threading.Lock()
+        # Serializes manifest and index mutations between concurrent ingestion jobs
+        self._write_lock = threading.RLock()
+        self._active_streams = 0
+        # The published parts of running streams, replaced batch by batch
+        self._streaming: List[FAISS] = []
+        # Live-index changes not yet reflected in the manifest version (streamed batches)
+        self._live_mutations = 0
+
+    @classmethod
+    def from_settings(
+        cls,
+        settings,
+        vector_store_path: Optional[str] = None,
+        read_only: Optional[bool] = None,
+    ) -> "RAGEngine":
+        """
+        Builds an engine configured from `src.config.Settings`. `read_only` defaults
+        to INDEX_ROLE == "reader"; readers never embed chunks, so they skip the
+        embedding cache (and don't contend with the writer for its files).
+        """
+        if read_only is None:
+            read_only = settings.INDEX_ROLE == "reader"
+        return cls(
+            embedding_model_name=settings.EMBEDDING_MODEL_NAME,
+            vector_store_path=vector_store_path or settings.VECTOR_DB_PATH,
+            embedding_cache_dir=None if read_only else settings.EMBEDDING_CACHE_DIR,
+            embedding_cache_max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+            index_spec=IndexSpec.from_settings(settings),
+            read_only=read_only,
+            refresh_interval=settings.INDEX_REFRESH_SECONDS,
+            keep_generations=settings.INDEX_KEEP_GENERATIONS,
+            gc_grace_seconds=settings.INDEX_GC_GRACE_SECONDS,
+            query_batch_size=settings.RETRIEVAL_BATCH_SIZE,
+            query_batch_window_ms=settings.RETRIEVAL_BATCH_WINDOW_MS,
+            embedding_backend=settings.EMBEDDING_BACKEND,
+            embedding_batch_size=settings.EMBEDDING_BATCH_SIZE,
+            embedding_threads=settings.EMBEDDING_THREADS or None,
+            onnx_dir=settings.EMBEDDING_ONNX_DIR,
+            embedding_parity_check=settings.EMBEDDING_PARITY_CHECK
+        )
+
+    # ------------------------------------------------------------------
+    # Manifest
+    # ------------------------------------------------------------------
+    # The store is a list of immutable segments (one per add_documents call)
+    # plus a manifest that records which segments are live, the content hash
+    # of every indexed chunk, the chunk ids per source and per section (see
+    # src.sections) and tombstoned ids.
+    # Each manifest version is written as its own generation file and then
+    # published by atomically replacing CURRENT, so readers only ever see
+    # complete generations. Segments are shared between generations and
+    # deleted once no retained generation lists them.
+
+    def _current_path(self) -> str:
+        return os.path.join(self.vector_store_path, CURRENT_NAME)
+
+    def _generations_path(self) -> str:
+        return os.path.join(self.vector_store_path, GENERATIONS_DIR)
+
+    def _empty_manifest(self) -> Dict:
+        return {"version": 0, "segments": [], "hashes": {}, "sources": {}, "sections": {}, "tombstones": []}
+
+    def _read_manifest(self) -> Dict:
+        if self._manifest is None:
+            self._manifest = self._load_manifest()
+        return self._manifest
+
+    @staticmethod
+    def _index_sections(manifest: Dict, doc_id: str, metadata: Dict[str, Any]) -> None:
+        # Manifests written before sections were indexed have no "sections" entry
+        sections = manifest.setdefault("sections", {})
+        for key in metadata.get("section_keys", ()):
+            sections.setdefault(key, []).append(doc_id)
+
+    def _load_manifest(self) -> Dict:
+        """The published generation, or a manifest for a store in an older layout."""
+        if os.path.exists(self._current_path()):
+            with open(self._current_path(), "r", encoding="utf-8") as f:
+                generation = f.read().strip()
+            with open(os.path.join(self._generations_path(), generation), "r", encoding="utf-8") as f:
+                return self._scope_hashes(json.load(f))
+        legacy_manifest = os.path.join(self.vector_store_path, MANIFEST_NAME)
+        if os.path.exists(legacy_manifest):
+            with open(legacy_manifest, "r", encoding="utf-8") as f:
+                return self._scope_hashes(json.load(f))
+        if os.path.exists(os.path.join(self.vector_store_path, "index.faiss")):
+            return self._manifest_from_legacy()
+        return self._empty_manifest()
+
+    @staticmethod
+    def _scope_hashes(manifest: Dict) -> Dict:
+        """
+        Manifests written before duplicates were detected per source map each
+        hash straight to a chunk id; file those under the source of the chunk.
+        """
+        hashes = manifest["hashes"]
+        if any(isinstance(doc_id, str) for doc_id in hashes.values()):
+            owner = {doc_id: source for source, ids in manifest["sources"].items() for doc_id in ids}
+            scoped: Dict[str, Dict[str, str]] = {}
+            for digest, doc_id in hashes.items():
+                if doc_id in owner:
+                    scoped.setdefault(owner[doc_id], {})[digest] = doc_id
+            manifest["hashes"] = scoped
+        return manifest
+
+    def _manifest_stamp(self) -> Optional[Tuple[int, int]]:
+        """Identifies the published generation; _write_manifest's os.replace always changes it."""
+        for name in (CURRENT_NAME, MANIFEST_NAME):
+            try:
+                stat = os.stat(os.path.join(self.vector_store_path, name))
+            except FileNotFoundError:
+                continue
+            return (stat.st_mtime_ns, stat.st_ino)
+        return None
+
+    def _manifest_from_legacy(self) -> Dict:
+        """Builds a manifest for a store saved before segments existed."""
+        logger.info(f"Migrating legacy vector store at {self.vector_store_path}...")
+        legacy = FAISS.load_local(
+            self.vector_store_path,
+            self.embeddings,
+            allow_dangerous_deserialization=True
+        )
+        manifest = self._empty_manifest()
+        manifest["segments"].append(LEGACY_SEGMENT)
+        for doc_id in legacy.index_to_docstore_id.values():
+            doc = legacy.docstore.search(doc_id)
+            if not isinstance(doc, Document):
+                continue
+            source = doc.metadata.get("source", "")
+            manifest["hashes"].setdefault(source, {})[content_hash(doc.page_content)] = doc_id
+            manifest["sources"].setdefault(source, []).append(doc_id)
+            self._index_sections(manifest, doc_id, doc.metadata)
+        return manifest
+
+    @property
+    def index_version(self) -> str:
+        """
+        Changes whenever the searchable content changes: the manifest version,
+        plus the number of streamed batches indexed since it was last written.
+        Read-only workers report the published version they have loaded, so all
+        workers that picked up the writer's latest generation agree on it.
+        """
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot.version
+        return f"{self._read_manifest()['version']}.0"
+
+    def current_version(self) -> str:
+        """
+        index_version, after picking up a newly published generation on read-only
+        engines (rate-limited like the query path), for callers that cache by
+        version and may not search at all.
+        """
+        if self.read_only:
+            self._maybe_refresh()
+        return self.index_version
+
+    def _write_manifest(self) -> None:
+        """Writes the manifest as the next generation and points CURRENT at it."""
+        manifest = self._read_manifest()
+        manifest["version"] += 1
+        self._live_mutations = 0
+        generation = f"{manifest['version']:012d}.json"
+        os.makedirs(self._generations_path(), exist_ok=True)
+        _atomic_write(os.path.join(self._generations_path(), generation), json.dumps(manifest))
+        _atomic_write(self._current_path(), generation)
+        self._collect_garbage()
+
+    def _collect_garbage(self) -> None:
+        """
+        Deletes generations that are neither among the newest `keep_generations`
+        nor younger than the grace period (a reader may still be loading them),
+        then segments that no remaining generation uses. Segments are unlinked,
+        so workers that already mapped them keep reading until they move on.
+        """
+        now = time.time()
+        names = sorted(n for n in os.listdir(self._generations_path()) if n.endswith(".json"))
+        keep = names[-max(self.keep_generations, 1):]
+        referenced = set()
+        for name in names:
+            path = os.path.join(self._generations_path(), name)
+            if name not in keep and now - os.path.getmtime(path) > self.gc_grace_seconds:
+                os.remove(path)
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    referenced.update(json.load(f)["segments"])
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read generation {name}, keeping all segments: {e}")
+                return
+
+        segments_root = os.path.join(self.vector_store_path, SEGMENTS_DIR)
+        if os.path.isdir(segments_root):
+            for name in os.listdir(segments_root):
+                segment = os.path.join(SEGMENTS_DIR, name)
+                path = self._segment_path(segment)
+                if segment not in referenced and now - os.path.getmtime(path) > self.gc_grace_seconds:
+                    shutil.rmtree(path, ignore_errors=True)
+                    logger.info(f"Removed unused segment {segment}.")
+
+        # Files of the layouts that predate generations
+        stale = [MANIFEST_NAME]
+        if LEGACY_SEGMENT not in referenced:
+            stale += ["index.faiss", "index.pkl"]
+        for name in stale:
+            path = os.path.join(self.vector_store_path, name)
+            if os.path.exists(path) and now - os.path.getmtime(path) > self.gc_grace_seconds:
+                os.remove(path)
+
+    def _segment_path(self, segment: str) -> str:
+        return os.path.join(self.vector_store_path, segment)
+
+    def _check_writable(self) -> None:
+        if self.read_only:
+            raise ReadOnlyIndexError(
+                f"Vector store at {self.vector_store_path} is open read-only; writes go through the writer process."
+            )
+
+    # ------------------------------------------------------------------
+    # Snapshots
+    # ------------------------------------------------------------------
+
+    @property
+    def snapshot(self) -> Optional[IndexSnapshot]:
+        return self._snapshot
+
+    @property
+    def vector_store(self) -> Optional[FAISS]:
+        """
+        The base part of the current snapshot. Right after load_vector_store()
+        on a single-segment store, or after compact(), this is the whole store.
+        """
+        snapshot = self._snapshot
+        return snapshot.parts[0] if snapshot is not None and snapshot.parts else None
+
+    def _parts(self) -> List[FAISS]:
+        return list(self._snapshot.parts) if self._snapshot is not None else []
+
+    def _is_streaming(self, part: FAISS) -> bool:
+        return any(part is view for view in self._streaming)
+
+    def _replace_part(self, old: Optional[FAISS], new: FAISS) -> List[FAISS]:
+        """The current parts with `old` swapped for `new` (appended when `old` isn't among them)."""
+        parts = self._parts()
+        for i, part in enumerate(parts):
+            if part is old:
+                parts[i] = new
+                return parts
+        return parts + [new]
+
+    def _publish(self, parts: Sequence[FAISS]) -> None:
+        """Makes `parts` the searchable store. Callers hold the write lock."""
+        parts = list(parts)
+        finished = [p for p in parts if not self._is_streaming(p)]
+        if len(parts) > MAX_LIVE_PARTS and len(finished) > 2:
+            # Keep the per-query fan-out bounded: fold the committed parts after the base into one.
+            # Running streams keep their single part. The folded copy is built off to the side;
+            # queries on the old snapshot are unaffected.
+            merged = self._merge(finished[1:], IndexSpec())
+            parts = finished[:1] + ([merged] if merged is not None else []) + [p for p in parts if self._is_streaming(p)]
+        version = f"{self._read_manifest()['version']}.{self._live_mutations}"
+        self._snapshot = IndexSnapshot(version=version, parts=tuple(parts))
+
+    # ------------------------------------------------------------------
+    # Building
+    # ------------------------------------------------------------------
 
     def create_vector_store(self, documents: List[Document]) -> None:
         """
-        Creates a new FAISS vector store from documents and saves it to disk.
+        Creates a new FAISS vector store from documents and saves it to disk,
+        replacing whatever was indexed before. Other processes keep reading the
+        previous generation until the new one is published.
         """
+        self._check_writable()
         if not documents:
             logger.warning("No documents to ingest.")
             return
 
-        logger.info(f"Creating vector store with {len(documents)} chunks...")
-        self.vector_store = FAISS.from_documents(documents, self.embeddings)
-        self.vector_store.save_local(self.vector_store_path)
+        with self._write_lock:
+            manifest = self._empty_manifest()
+            # Keep numbering generations upwards so readers see a new version
+            manifest["version"] = self._read_manifest()["version"]
+            self._manifest = manifest
+            self._live_mutations = 0
+            self._publish([])
+
+            logger.info(f"Creating vector store with {len(documents)} chunks...")
+            self.add_documents(documents)
+            if self.index_spec.index_type != "flat":
+                self.compact()
         logger.info(f"Vector store saved to {self.vector_store_path}")
 
+    def add_documents(self, documents: List[Document]) -> int:
+        """
+        Embeds and appends documents to the store, skipping chunks whose content
+        hash is already indexed for their source (the same text in two sources
+        is stored twice, so deleting one leaves the other whole). Only the new
+        chunks are written to disk.
+        Returns the number of chunks actually added.
+        """
+        return self.add_document_stream(documents, batch_size=max(len(documents), 1))
+
+    def add_document_stream(
+        self,
+        chunks: Iterable[Document],
+        batch_size: int = 64,
+        on_batch: Optional[Callable[[int], None]] = None,
+        replace_source: Optional[str] = None,
+    ) -> int:
+        """
+        Consumes chunks lazily, embedding and indexing them in fixed-size batches
+        so the first chunks are searchable before the rest of the file is read.
+        The stream appends to one flat index whose capacity doubles when full,
+        and publishes a part that maps the positions indexed so far after every
+        batch; growing copies the index, so parts published before keep theirs.
+        Other processes see the chunks once everything consumed is written as a
+        single new segment at the end, even if the stream fails half-way, and
+        the part is then replaced by that segment as loaded from disk.
+        `on_batch` receives the running count of added chunks.
+
+        With `replace_source`, the stream is a new version of that source: its
+        current chunks stay searchable (and don't count as duplicates) until
+        the stream completes, then are removed in the generation that commits
+        the new ones. If the stream fails, nothing it added is kept.
+        """
+        self._check_writable()
+        with self._write_lock:
+            if self._snapshot is None and self._read_manifest()["segments"]:
+                self.load_vector_store()
+            manifest = self._read_manifest()
+            replaced = set(manifest["sources"].get(replace_source, ())) if replace_source is not None else set()
+            self._active_streams += 1
+
+        # The stream's index and docstore; `view` is the part currently published for it
+        segment: Optional[FAISS] = None
+        view: Optional[FAISS] = None
+        ids = IdLog()
+        capacity = 0
+        added: List[Tuple[str, str]] = []  # (chunk id, source)
+        # (source, hash) -> the id it mapped to before this stream, to undo a failed replacement
+        previous: Dict[Tuple[str, str], Optional[str]] = {}
+        skipped = 0
+        completed = False
+        try:
+            for batch in batched(chunks, batch_size):
+                with self._write_lock:
+                    new_docs = self._unindexed(batch, replaced)
+                skipped += len(batch) - len(new_docs)
+                if not new_docs:
+                    continue
+
+                # Embedding runs outside the lock so concurrent ingests overlap
+                with span("embed_documents"):
+                    vectors = self.embeddings.embed_documents([d.page_content for d in new_docs])
+
+                with self._write_lock, span("index_add"):
+                    # Another ingest may have indexed some of these chunks meanwhile
+                    fresh = set(id(d) for d in self._unindexed(new_docs, replaced))
+                    pairs = [(d, v) for d, v in zip(new_docs, vectors) if id(d) in fresh]
+                    skipped += len(new_docs) - len(pairs)
+                    if not pairs:
+                        continue
+
+                    matrix = np.array([v for _, v in pairs], dtype=np.float32)
+                    new_ids = [str(uuid.uuid4()) for _ in pairs]
+
+                    if segment is None:
+                        segment = FAISS(
+                            embedding_function=self.embeddings,
+                            index=faiss.IndexFlatL2(matrix.shape[1]),
+                            docstore=InMemoryDocstore(),
+                            index_to_docstore_id={}
+                        )
+                    needed = segment.index.ntotal + len(pairs)
+                    if needed > capacity:
+                        if view is not None:
+                            # Copy-on-write: the published part keeps reading the old buffer
+                            segment.index = faiss.clone_index(segment.index)
+                        capacity = max(2 * needed, batch_size)
+                        reserve(segment.index, capacity)
+                    segment.index.add(matrix)
+                    segment.docstore.add(dict(zip(new_ids, (d for d, _ in pairs))))
+                    ids.extend(new_ids)
+
+                    published = FAISS(
+                        embedding_function=self.embeddings,
+                        index=segment.index,
+                        docstore=segment.docstore,
+                        index_to_docstore_id=LazyIdMap(ids)
+                    )
+                    self._live_mutations += 1
+                    parts = self._replace_part(view, published)
+                    self._streaming = [p for p in self._streaming if p is not view] + [published]
+                    view = published
+                    self._publish(parts)
+                    for (doc, _), doc_id in zip(pairs, new_ids):
+                        digest, source = doc.metadata["content_hash"], doc.metadata.get("source", "")
+                        hashes = manifest["hashes"].setdefault(source, {})
+                        previous.setdefault((source, digest), hashes.get(digest))
+                        hashes[digest] = doc_id
+                        self._index_sections(manifest, doc_id, doc.metadata)
+                        added.append((doc_id, source))
+                if on_batch:
+                    on_batch(len(added))
+            completed = True
+        finally:
+            with self._write_lock, span("commit_segment"):
+                self._active_streams -= 1
+                self._streaming = [p for p in self._streaming if p is not view]
+                if replace_source is not None and not completed:
+                    self._discard_stream(view, added, previous)
+                else:
+                    self._commit_segment(view, added, replace_source)
+
+        CHUNKS.labels("indexed").inc(len(added))
+        CHUNKS.labels("duplicate").inc(skipped)
+        if skipped:
+            logger.info(f"Skipped {skipped} chunks already present in the index.")
+        return len(added)
+
+    def _unindexed(self, docs: List[Document], replaced: Collection[str] = ()) -> List[Document]:
+        """
+        Returns the docs whose content hash is not indexed yet for their
+        source, or only as one of the `replaced` chunk ids, tagging each with
+        its hash.
+        """
+        manifest = self._read_manifest()
+        result: List[Document] = []
+        seen = set()
+        for doc in docs:
+            digest = doc.metadata.get("content_hash") or content_hash(doc.page_content)
+            key = (doc.metadata.get("source", ""), digest)
+            indexed = manifest["hashes"].get(key[0], {}).get(digest)
+            if (indexed is not None and indexed not in replaced) or key in seen:
+                continue
+            seen.add(key)
+            doc.metadata["content_hash"] = digest
+            result.append(doc)
+        return result
+
+    # ------------------------------------------------------------------
+    # Part maintenance
+    # ------------------------------------------------------------------
+    # LangChain's FAISS.add_embeddings/delete assume positions 0..n-1 map to
+    # docstore ids with no gaps and mutate the index in place, which is unsafe
+    # while other threads search it. Published parts are therefore never added
+    # to: deletes unmap positions (search skips unmapped positions) and
+    # merging or compaction builds new parts from the live chunks instead.
+    # The one exception is a stream's index, which only grows into capacity
+    # reserved beforehand and past the positions its published part maps.
+
+    @staticmethod
+    def _index_remove(store: FAISS, ids: Iterable[str]) -> None:
+        removed = set(ids)
+        id_map = store.index_to_docstore_id
+        if isinstance(id_map, LazyIdMap):
+            # Keeps the id map of a mapped segment lazy (loads apply every tombstone)
+            positions = id_map.positions_of(removed)
+        else:
+            positions = [p for p, doc_id in id_map.items() if doc_id in removed]
+        if not positions:
+            return
+        present = [store.index_to_docstore_id[p] for p in positions]
+        for position in positions:
+            del store.index_to_docstore_id[position]
+        store.docstore.delete(present)
+
+    @staticmethod
+    def _soft_deleted(store: FAISS) -> int:
+        return store.index.ntotal - len(store.index_to_docstore_id)
+
+    def _merge(self, parts: Sequence[FAISS], spec: IndexSpec) -> Optional[FAISS]:
+        """
+        A new store of type `spec` holding the live chunks of `parts`, which are
+        left untouched. Returns None when they hold no live chunks.
+        """
+        ids: List[str] = []
+        docs: List[Document] = []
+        blocks: List[np.ndarray] = []
+        for part in parts:
+            positions = sorted(part.index_to_docstore_id)
+            if not positions:
+                continue
+            part_docs = [doc_at(part, p) for p in positions]
+            if index_kind(part.index) == "ivf_pq":
+                # PQ codes are lossy, so go back to the embeddings (cached when the cache is on)
+                vectors = np.asarray(self.embeddings.embed_documents([d.page_content for d in part_docs]), dtype=np.float32)
+                if part._normalize_L2:
+                    faiss.normalize_L2(vectors)
+            else:
+                vectors = part.index.reconstruct_n(0, part.index.ntotal)[positions]
+            ids.extend(part.index_to_docstore_id[p] for p in positions)
+            docs.extend(part_docs)
+            blocks.append(vectors)
+        if not ids:
+            return None
+
+        like = parts[0]
+        return FAISS(
+            embedding_function=self.embeddings,
+            index=build_index(spec, np.vstack(blocks)),
+            docstore=InMemoryDocstore(dict(zip(ids, docs))),
+            index_to_docstore_id=dict(enumerate(ids)),
+            normalize_L2=like._normalize_L2,
+            distance_strategy=like.distance_strategy
+        )
+
+    def _commit_segment(self, view: Optional[FAISS], added: List[Tuple[str, str]], replace_source: Optional[str] = None) -> None:
+        """
+        Saves a stream's part as a segment and serves the segment, read back
+        from disk, in its place. The chunks `replace_source` had before the
+        stream are removed in the same generation.
+        """
+        manifest = self._read_manifest()
+        replaced = manifest["sources"].pop(replace_source, []) if replace_source is not None else []
+        if view is None and not replaced:
+            return
+        if replaced:
+            self._remove_ids(replaced)
+        parts = self._parts()
+        if view is not None:
+            segment_name = os.path.join(SEGMENTS_DIR, uuid.uuid4().hex)
+            save_segment(view, self._segment_path(segment_name))
+            parts = self._replace_part(view, load_segment(self._segment_path(segment_name), self.embeddings))
+            manifest["segments"].append(segment_name)
+            for doc_id, source in added:
+                manifest["sources"].setdefault(source, []).append(doc_id)
+            logger.info(f"Added {len(added)} chunks in segment {segment_name}.")
+        self._write_manifest()
+        self._publish(parts)
+        if replaced:
+            logger.info(f"Replaced {len(replaced)} chunks of {replace_source}.")
+            self._maybe_compact()
+
+    def _discard_stream(self, view: Optional[FAISS], added: List[Tuple[str, str]], previous: Dict[Tuple[str, str], Optional[str]]) -> None:
+        """Unpublishes a failed stream's part and restores the hashes and sections it changed."""
+        if view is None:
+            return
+        manifest = self._read_manifest()
+        dropped = set(doc_id for doc_id, _ in added)
+        for (source, digest), doc_id in previous.items():
+            hashes = manifest["hashes"].setdefault(source, {})
+            if doc_id is None:
+                hashes.pop(digest, None)
+            else:
+                hashes[digest] = doc_id
+        manifest["hashes"] = {source: hashes for source, hashes in manifest["hashes"].items() if hashes}
+        manifest["sections"] = {
+            key: kept
+            for key, ids_in_section in manifest.get("sections", {}).items()
+            if (kept := [i for i in ids_in_section if i not in dropped])
+        }
+        self._live_mutations += 1
+        self._publish([p for p in self._parts() if p is not view])
+        logger.info(f"Discarded {len(added)} chunks of a failed stream.")
+
+    def _remove_ids(self, ids: List[str]) -> None:
+        """Drops chunk ids from the manifest indexes and the parts, tombstoning them. Callers write the manifest."""
+        manifest = self._read_manifest()
+        removed = set(ids)
+        manifest["hashes"] = {
+            source: kept
+            for source, hashes in manifest["hashes"].items()
+            if (kept := {h: i for h, i in hashes.items() if i not in removed})
+        }
+        manifest["sections"] = {
+            key: kept
+            for key, ids_in_section in manifest.get("sections", {}).items()
+            if (kept := [i for i in ids_in_section if i not in removed])
+        }
+        manifest["tombstones"].extend(ids)
+        for part in self._parts():
+            self._index_remove(part, removed)
+
+    def _maybe_compact(self) -> None:
+        # Compaction would also persist chunks of streams that haven't committed yet
+        manifest = self._read_manifest()
+        live = sum(len(hashes) for hashes in manifest["hashes"].values())
+        if len(manifest["tombstones"]) > live and not self._active_streams:
+            self.compact()
+
+    def delete_source(self, source: str) -> int:
+        """
+        Removes every chunk that was ingested from `source`.
+        Returns the number of chunks removed.
+        """
+        self._check_writable()
+        with self._write_lock:
+            manifest = self._read_manifest()
+            ids = manifest["sources"].pop(source, [])
+            if not ids:
+                return 0
+
+            self._remove_ids(ids)
+            self._write_manifest()
+            self._publish(self._parts())
+            logger.info(f"Removed {len(ids)} chunks for source {source}.")
+            self._maybe_compact()
+            return len(ids)
+
+    def compact(self) -> None:
+        """
+        Rewrites all live segments into a single one and drops tombstones.
+        The store is retrained as `index_spec.index_type` when its index is of
+        another type or still holds soft-deleted vectors. The new store is built
+        off to the side and published as a new generation; the old segments are
+        garbage-collected once no retained generation uses them.
+        """
+        self._compact(rebuild=False)
+
+    def rebuild_index(self) -> None:
+        """
+        Retrains the store as `index_spec.index_type` from the live chunks and
+        persists it as a single segment. Vectors come from the embedding cache
+        when it's enabled, so this mostly costs training and adding.
+        """
+        self._compact(rebuild=True)
+
+    def _compact(self, rebuild: bool) -> None:
+        self._check_writable()
+        with self._write_lock:
+            if self._active_streams:
+                logger.warning("Not compacting while ingestion streams are running.")
+                return
+            if self._snapshot is None and self._read_manifest()["segments"]:
+                self.load_vector_store()
+            manifest = self._read_manifest()
+
+            parts = self._parts()
+            store = parts[0] if len(parts) == 1 else None
+            if (
+                store is not None
+                and not rebuild
+                and index_kind(store.index) == self.index_spec.index_type
+                and not self._soft_deleted(store)
+            ):
+                if manifest["segments"] != [LEGACY_SEGMENT]:
+                    return  # already a single segment of the right type
+            elif parts:
+                chunks = sum(len(p.index_to_docstore_id) for p in parts)
+                logger.info(f"Rebuilding {chunks} chunks as a {self.index_spec.index_type} index...")
+                store = self._merge(parts, self.index_spec)
+
+            old_segments = len(manifest["segments"])
+            manifest["segments"] = []
+            if store is not None and store.index.ntotal > 0:
+                segment_name = os.path.join(SEGMENTS_DIR, uuid.uuid4().hex)
+                save_segment(store, self._segment_path(segment_name))
+                manifest["segments"].append(segment_name)
+            manifest["tombstones"] = []
+            self._write_manifest()
+            self._publish([store] if store is not None else [])
+            logger.info(f"Compacted {old_segments} segments.")
+
+    # ------------------------------------------------------------------
+    # Loading / retrieval
+    # ------------------------------------------------------------------
+
     def load_vector_store(self) -> None:
         """
-        Loads an existing FAISS vector store from disk.
+        Loads the published generation from disk and swaps it in as the current
+        snapshot; queries already running finish on the previous one.
+
+        Read-only engines memory-map the first segment (normally the compacted
+        bulk of the store) instead of reading it, so every worker on the host
+        shares one copy through the page cache. Segments published after it are
+        small and are folded into one in-memory part searched alongside it.
         """
         if not os.path.exists(self.vector_store_path):
             raise FileNotFoundError(f"Vector store not found at {self.vector_store_path}")
-            
-        logger.info(f"Loading vector store from {self.vector_store_path}...")
-        # allow_dangerous_deserialization is needed for local pickle files in newer versions
-        self.vector_store = FAISS.load_local(
-            self.vector_store_path, 
-            self.embeddings, 
-            allow_dangerous_deserialization=True
-        )
 
-    def get_retriever(self, k: int = 15, fetch_k: int = 50) -> VectorStoreRetriever:
+        with self._write_lock:
+            stamp = self._manifest_stamp()
+            manifest = self._load_manifest()
+            segments = manifest["segments"]
+            if not segments:
+                if self._snapshot is None:
+                    raise FileNotFoundError(f"Vector store at {self.vector_store_path} is empty")
+                # The writer deleted everything: stop serving what was loaded before
+                self._manifest = manifest
+                self._live_mutations = 0
+                self._loaded_stamp = stamp
+                self._publish([])
+                return
+
+            logger.info(f"Loading vector store from {self.vector_store_path} ({len(segments)} segments)...")
+            loaded = [
+                load_segment(self._segment_path(segment), self.embeddings, read_only=self.read_only and i == 0)
+                for i, segment in enumerate(segments)
+            ]
+            # The first segment may be a trained IVF/HNSW index written by compact()
+            prepare_index(loaded[0].index, self.index_spec)
+            parts = loaded[:1]
+            if len(loaded) == 2:
+                parts.append(loaded[1])
+            elif len(loaded) > 2:
+                merged = self._merge(loaded[1:], IndexSpec())
+                if merged is not None:
+                    parts.append(merged)
+
+            if manifest["tombstones"]:
+                for part in parts:
+                    self._index_remove(part, manifest["tombstones"])
+
+            self._manifest = manifest
+            self._live_mutations = 0
+            self._loaded_stamp = stamp
+            self._publish(parts)
+
+    def refresh(self) -> bool:
+        """
+        Reloads the store if CURRENT was replaced since it was loaded, i.e. the
+        writer published a new generation. Returns whether it reloaded.
+        """
+        stamp = self._manifest_stamp()
+        if stamp is None or stamp == self._loaded_stamp:
+            return False
+        self.load_vector_store()
+        logger.info(f"Picked up index version {self.index_version}.")
+        return True
+
+    def _maybe_refresh(self) -> None:
+        """Rate-limited refresh() for read-only engines, called on the query path."""
+        now = time.monotonic()
+        if now - self._last_refresh_check < self.refresh_interval:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return  # another query is already reloading; keep serving the current version
+        try:
+            self._last_refresh_check = now
+            self.refresh()
+        except (OSError, ValueError) as e:
+            # e.g. a generation was collected between reading CURRENT and opening it
+            logger.warning(f"Index refresh failed, still serving version {self.index_version}: {e}")
+        finally:
+            self._refresh_lock.release()
+
+    def get_retriever(
+        self,
+        k: int = 15,
+        fetch_k: int = 50,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filter: Optional[Dict[str, Any]] = None,
+        max_fetch_k: Optional[int] = None,
+    ) -> BaseRetriever:
         """
         Returns a retriever using Maximum Marginal Relevance (MMR).
         Increased k to ensure we capture enough context for a full audit.
+        nprobe/ef_search override the index defaults for IVF/HNSW stores;
+        `filter` restricts results by chunk metadata (see batch_retrieve).
         """
-        if not self.vector_store:
+        if self._snapshot is None:
             self.load_vector_store()
-            
-        return self.vector_store.as_retriever(
-            search_type="mmr",
+
+        return EngineRetriever(
+            engine=self,
             search_kwargs={
                 "k": k,
                 "fetch_k": fetch_k,
-                "lambda_mult": 0.7 # Increased slightly to favor relevance a bit more while keeping diversity
+                "lambda_mult": 0.7, # Increased slightly to favor relevance a bit more while keeping diversity
+                "nprobe": nprobe,
+                "ef_search": ef_search,
+                "filter": filter,
+                "max_fetch_k": max_fetch_k,
             }
         )
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        Embeds several queries in a single model batch. HuggingFaceEmbeddings.embed_query
+        is embed_documents on one text, so this yields the same vectors as one call per query.
+        The embedding cache is bypassed: queries rarely repeat verbatim as chunk text.
+        """
+        return self.query_embeddings.embed_documents(queries)
+
+    def _load_embeddings(self) -> Embeddings:
+        model = build_embeddings(
+            self.embedding_model_name,
+            backend=self.embedding_backend,
+            batch_size=self.embedding_batch_size,
+            threads=self.embedding_threads,
+            onnx_dir=self.onnx_dir
+        )
+        if self.embedding_parity_check and self.embedding_backend != "torch":
+            # Loads the PyTorch model once to compare; raises EmbeddingParityError on drift
+            reference = embeddings_module.torch_embeddings(self.embedding_model_name, threads=self.embedding_threads)
+            report = parity_check(model, reference, PARITY_THRESHOLDS[self.embedding_backend])
+            logger.info(f"Embedding backend {self.embedding_backend} parity: {report}")
+        return model
+
+    def load_model(self) -> None:
+        """Loads the embedding model now rather than on the first embedding."""
+        self.model.load()
+
+    def warmup(self) -> Dict[str, float]:
+        """
+        Runs a dummy query through embedding, search and MMR, so the first real
+        request doesn't pay for the model load, thread pool start-up, cold index
+        pages or the normalized embedding matrices. Returns seconds per step.
+        """
+        timings: Dict[str, float] = {}
+        started = time.perf_counter()
+        self.load_model()
+        timings["model_load_s"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        self.embed_queries(["warmup"])
+        timings["embed_s"] = time.perf_counter() - started
+
+        if self._snapshot is not None and self._snapshot.size:
+            started = time.perf_counter()
+            self.batch_retrieve(["warmup"], k=1)
+            timings["search_s"] = time.perf_counter() - started
+        return timings
+
+    def retrieve(self, query: str, **search_kwargs: Any) -> List[Document]:
+        """
+        MMR retrieval for one query. With the query batcher enabled, the query
+        is embedded and searched together with whatever other queries arrive
+        within the batching window; takes batch_retrieve's keyword arguments.
+        """
+        if self.query_batcher is None:
+            return self.batch_retrieve([query], **search_kwargs)[0]
+        return self.query_batcher.retrieve(query, **search_kwargs)
+
+    def batch_retrieve(
+        self,
+        queries: List[str],
+        k: int = 15,
+        fetch_k: int = 50,
+        lambda_mult: float = 0.7,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filter: Optional[MetadataFilter] = None,
+        max_fetch_k: Optional[int] = None,
+        documents: Optional[Sequence[str]] = None,
+    ) -> List[List[Document]]:
+        """
+        MMR retrieval for several queries at once: one embedding batch, one
+        FAISS search per part over the whole query matrix, candidates merged by
+        distance, then a vectorized MMR per query over cached normalized chunk
+        embeddings. Chunks shared between queries are materialized only once.
+        Everything runs against the snapshot that is current when the call
+        starts, even if a new one is published meanwhile.
+
+        `filter` (metadata equality per key, a list value matching any of its
+        items, or a predicate on the metadata) drops candidates before MMR.
+        fetch_k adapts: queries left with fewer than fetch_k candidates after
+        filtering and deletes are searched again with twice the depth, up to
+        `max_fetch_k` (default 4 * fetch_k). `documents` keeps the chunks of
+        those sources only (full path or file name), on top of `filter`.
+        """
+        results = self.batch_retrieve_with_scores(
+            queries, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult, nprobe=nprobe, ef_search=ef_search,
+            filter=filter, max_fetch_k=max_fetch_k, documents=documents
+        )
+        return [[doc for doc, _ in hits] for hits in results]
+
+    def batch_retrieve_with_scores(
+        self,
+        queries: List[str],
+        k: int = 15,
+        fetch_k: int = 50,
+        lambda_mult: float = 0.7,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filter: Optional[MetadataFilter] = None,
+        max_fetch_k: Optional[int] = None,
+        documents: Optional[Sequence[str]] = None,
+        vectors: Optional[np.ndarray] = None,
+    ) -> List[List[Tuple[Document, float]]]:
+        """
+        batch_retrieve, with the cosine similarity of each selected chunk to its
+        query. `vectors` are the query embeddings when the caller already has them.
+        """
+        searched = self._search_candidates(queries, fetch_k, nprobe, ef_search, filter, max_fetch_k, documents, vectors)
+        if searched is None:
+            return [[] for _ in queries]
+        parts, vectors, candidates, docs_by_key = searched
+
+        mmr_started = time.perf_counter()
+        results: List[List[Tuple[Document, float]]] = []
+        for query_vector, hits in zip(vectors, candidates):
+            if not hits:
+                results.append([])
+                continue
+            matrix = self._candidate_matrix(parts, hits, vectors.shape[1])
+            selected = mmr(query_vector, matrix, k=k, lambda_mult=lambda_mult)
+            scores = matrix[selected] @ (query_vector / max(float(np.linalg.norm(query_vector)), 1e-12))
+            docs = [(self._doc_for(parts, hits[choice], docs_by_key), float(score)) for choice, score in zip(selected, scores)]
+            # None: deleted while this query ran
+            results.append([(doc, score) for doc, score in docs if doc is not None])
+        observe("mmr", time.perf_counter() - mmr_started)
+
+        logger.debug(f"Batch retrieval: {len(queries)} queries, {len(docs_by_key)} chunks materialized.")
+        return results
+
+    def batch_candidates(
+        self,
+        queries: List[str],
+        fetch_k: int = 50,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filter: Optional[MetadataFilter] = None,
+        max_fetch_k: Optional[int] = None,
+        documents: Optional[Sequence[str]] = None,
+        vectors: Optional[np.ndarray] = None,
+    ) -> List[Tuple[List[Document], np.ndarray]]:
+        """
+        The MMR candidates of batch_retrieve before selection, for callers that
+        run MMR over the candidates of several stores: per query, up to fetch_k
+        chunks nearest first and their unit-length embeddings, one row each.
+        """
+        searched = self._search_candidates(queries, fetch_k, nprobe, ef_search, filter, max_fetch_k, documents, vectors)
+        if searched is None:
+            return [([], np.empty((0, 0), dtype=np.float32)) for _ in queries]
+        parts, vectors, candidates, docs_by_key = searched
+
+        results: List[Tuple[List[Document], np.ndarray]] = []
+        for hits in candidates:
+            # None: deleted while this query ran
+            hits = [hit for hit in hits if self._doc_for(parts, hit, docs_by_key) is not None]
+            results.append(([docs_by_key[hit[1:]] for hit in hits], self._candidate_matrix(parts, hits, vectors.shape[1])))
+        return results
+
+    def _search_candidates(
+        self,
+        queries: List[str],
+        fetch_k: int,
+        nprobe: Optional[int],
+        ef_search: Optional[int],
+        filter: Optional[MetadataFilter],
+        max_fetch_k: Optional[int],
+        documents: Optional[Sequence[str]],
+        vectors: Optional[np.ndarray],
+    ) -> Optional[Tuple[Sequence[FAISS], np.ndarray, List[List[Tuple[float, int, int]]], Dict[Tuple[int, int], Optional[Document]]]]:
+        """
+        Searches the current snapshot for each query's candidates: (parts,
+        query vectors, hits per query, chunks materialized so far), or None
+        when the store is empty.
+        """
+        if self.read_only:
+            self._maybe_refresh()
+        if self._snapshot is None:
+            self.load_vector_store()
+        parts = self._snapshot.parts
+        if not parts:
+            return None
+
+        if vectors is None:
+            with span("embed_query"):
+                vectors = np.array(self.embed_queries(queries), dtype=np.float32)
+        else:
+            # A copy: normalized in place below, and the caller may share it between stores
+            vectors = np.array(vectors, dtype=np.float32)
+        if parts[0]._normalize_L2:
+            faiss.normalize_L2(vectors)
+        search_started = time.perf_counter()
+
+        if documents:
+            filter = scope_filter(documents, filter)
+        accept = metadata_filter(filter) if filter else None
+        limit = min(max_fetch_k or fetch_k * 4, sum(p.index.ntotal for p in parts))
+        depth = min(fetch_k * 2 if accept else fetch_k, limit)
+        docs_by_key: Dict[Tuple[int, int], Optional[Document]] = {}
+        candidates: List[List[Tuple[float, int, int]]] = [[] for _ in queries]
+        pending = list(range(len(queries)))
+        while pending:
+            retry: List[int] = []
+            for row, hits in zip(pending, self._search_parts(parts, vectors[pending], depth, nprobe, ef_search)):
+                if len(parts) > 1:
+                    hits = heapq.nsmallest(depth, hits)
+                if accept is not None:
+                    hits = [
+                        hit for hit in hits
+                        if (doc := self._doc_for(parts, hit, docs_by_key)) is not None and accept(doc.metadata)
+                    ]
+                candidates[row] = hits[:fetch_k]
+                if len(hits) < fetch_k and depth < limit:
+                    retry.append(row)
+            pending = retry
+            depth = min(depth * 2, limit)
+        observe("faiss_search", time.perf_counter() - search_started)
+        return parts, vectors, candidates, docs_by_key
+
+    @staticmethod
+    def _search_parts(
+        parts: Sequence[FAISS],
+        vectors: np.ndarray,
+        depth: int,
+        nprobe: Optional[int],
+        ef_search: Optional[int],
+    ) -> List[List[Tuple[float, int, int]]]:
+        """(distance, part, position) hits per query row; inner-product scores are negated so smaller is better."""
+        hits: List[List[Tuple[float, int, int]]] = [[] for _ in range(len(vectors))]
+        for part_no, part in enumerate(parts):
+            params = search_params(part.index, nprobe=nprobe, ef_search=ef_search)
+            distances, indices = part.index.search(vectors, depth, params=params)
+            sign = -1.0 if part.index.metric_type == faiss.METRIC_INNER_PRODUCT else 1.0
+            for row, (row_distances, row_indices) in enumerate(zip(distances, indices)):
+                for distance, i in zip(row_distances, row_indices):
+                    # -1 pads short result lists; unmapped positions are soft-deleted chunks
+                    if i != -1 and int(i) in part.index_to_docstore_id:
+                        hits[row].append((sign * float(distance), part_no, int(i)))
+        return hits
+
+    @staticmethod
+    def _doc_for(
+        parts: Sequence[FAISS],
+        hit: Tuple[float, int, int],
+        docs_by_key: Dict[Tuple[int, int], Optional[Document]],
+    ) -> Optional[Document]:
+        key = hit[1:]
+        if key not in docs_by_key:
+            try:
+                docs_by_key[key] = doc_at(parts[key[0]], key[1])
+            except (KeyError, ValueError):
+                docs_by_key[key] = None
+        return docs_by_key[key]
+
+    def _candidate_matrix(self, parts: Sequence[FAISS], hits: List[Tuple[float, int, int]], dim: int) -> np.ndarray:
+        """Normalized embeddings of the hits, one row per hit."""
+        matrix = np.empty((len(hits), dim), dtype=np.float32)
+        for part_no in {part_no for _, part_no, _ in hits}:
+            rows = [i for i, (_, p, _) in enumerate(hits) if p == part_no]
+            positions = np.array([hits[i][2] for i in rows], dtype=np.int64)
+            matrix[rows] = self._embedding_matrix(parts[part_no]).rows(positions)
+        return matrix
+
+    def _embedding_matrix(self, part: FAISS) -> EmbeddingMatrix:
+        matrix = self._matrices.get(part)
+        if matrix is None:
+            with self._matrix_lock:
+                matrix = self._matrices.get(part)
+                if matrix is None:
+                    matrix = self._matrices[part] = EmbeddingMatrix(part.index)
+        return matrix
+
+    def centroid(self) -> Optional[np.ndarray]:
+        """Mean of the unit-length embeddings of the live chunks (None when empty), for routing queries between stores."""
+        if self._snapshot is None:
+            self.load_vector_store()
+        total = None
+        count = 0
+        for part in self._snapshot.parts:
+            positions = np.fromiter(part.index_to_docstore_id, dtype=np.int64)
+            if len(positions):
+                rows = self._embedding_matrix(part).rows(positions).sum(axis=0)
+                total = rows if total is None else total + rows
+                count += len(positions)
+        return None if total is None else total / count
+
+    # ------------------------------------------------------------------
+    # Section lookups
+    # ------------------------------------------------------------------
+    # Ingest tags chunks with the canonical sections they belong to (see
+    # src.sections) and the manifest keeps the chunk ids per section, so
+    # questions about a known section (the budget, the timeline) read those
+    # chunks directly instead of searching the whole store.
+
+    def section_ids(self, sections: Sequence[str]) -> List[str]:
+        """Ids of the chunks indexed under any of `sections`, in ingest order."""
+        index = self._read_manifest().get("sections", {})
+        return list(dict.fromkeys(doc_id for key in sections for doc_id in list(index.get(key, ()))))
+
+    def sources(self) -> Dict[str, int]:
+        """Number of indexed chunks per source, from the manifest."""
+        return {source: len(ids) for source, ids in self._read_manifest()["sources"].items()}
+
+    def section_retrieve(
+        self,
+        query: str,
+        sections: Sequence[str],
+        k: int = 8,
+        lambda_mult: float = 0.7,
+        filter: Optional[MetadataFilter] = None,
+        documents: Optional[Sequence[str]] = None,
+    ) -> List[Document]:
+        """
+        Retrieval restricted to the chunks of `sections`, found through the
+        section index rather than the ANN search. When at most `k` chunks
+        remain after `filter` and `documents` (see batch_retrieve) they are all
+        returned in document order, without embedding the query; otherwise MMR
+        picks `k` of them by exact similarity to the query. Returns [] when no
+        indexed chunk belongs to the sections.
+        """
+        if self.read_only:
+            self._maybe_refresh()
+        if self._snapshot is None:
+            self.load_vector_store()
+        parts = self._snapshot.parts
+        if documents:
+            filter = scope_filter(documents, filter)
+        accept = metadata_filter(filter) if filter else None
+
+        docs_by_key: Dict[Tuple[int, int], Optional[Document]] = {}
+        hits: List[Tuple[float, int, int]] = []
+        for doc_id in self.section_ids(sections):
+            for part_no, part in enumerate(parts):
+                position = self._positions_of(part).get(doc_id)
+                # Not in this part, or unmapped: deleted since the section ids were read
+                if position is None or part.index_to_docstore_id.get(position) != doc_id:
+                    continue
+                hit = (0.0, part_no, position)
+                doc = self._doc_for(parts, hit, docs_by_key)
+                if doc is not None and (accept is None or accept(doc.metadata)):
+                    hits.append(hit)
+                break
+
+        if len(hits) <= k:
+            docs = [docs_by_key[hit[1:]] for hit in hits]
+            return sorted(docs, key=lambda d: (
+                str(d.metadata.get("source", "")), d.metadata.get("page", 0), d.metadata.get("start_index", 0)
+            ))
+
+        with span("embed_query"):
+            vector = np.array(self.embed_queries([query]), dtype=np.float32)[0]
+        with span("mmr"):
+            selected = mmr(vector, self._candidate_matrix(parts, hits, len(vector)), k=k, lambda_mult=lambda_mult)
+        return [docs_by_key[hits[choice][1:]] for choice in selected]
+
+    def _positions_of(self, part: FAISS) -> Dict[str, int]:
+        positions = self._positions.get(part)
+        if positions is None:
+            with self._matrix_lock:
+                positions = self._positions.get(part)
+                if positions is None:
+                    positions = self._positions[part] = {doc_id: p for p, doc_id in part.index_to_docstore_id.items()}
+        return positions
@@ -1,19 +1,27 @@
+
 import os
+import sys
 import json
+import asyncio
+import argparse
 import logging
-from typing import Any, Dict
+from itertools import islice
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Union
 
 # Import our core modules
 # Note: In SageMaker, you might need to adjust python path or package structure
-from src.ingest import IngestionEngine
-from src.rag_engine import RAGEngine
-from src.auditor import AuditorAgent
+from src.shards import build_engine
+from src.auditor import DEFAULT_SYSTEM_PROMPT, AuditorAgent, LLMConcurrencyLimiter
+from src.context_packer import ContextPacker
 from src.config import settings
-from langchain_community.chat_models import ChatBedrock
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+JSON = "application/json"
+# Content types SageMaker batch transform jobs use for one record per line
+JSON_LINES = ("application/jsonlines", "application/x-jsonlines", "application/jsonl")
+
 # Global variables to hold loaded models
 rag_engine = None
 auditor_agent = None
@@ -24,74 +32,202 @@ def model_fn(model_dir: str) -> Dict[str, Any]:
     This runs once when the container starts.
     """
     global rag_engine, auditor_agent
-    
+
     logger.info("Loading models...")
-    
+
     # 1. Initialize RAG Engine
     # In a real scenario, the vector store might be downloaded from S3 to model_dir
     vector_db_path = os.path.join(model_dir, settings.VECTOR_DB_PATH)
-    
+
     # If not found in model_dir (local test), use config path
     if not os.path.exists(vector_db_path):
         vector_db_path = settings.VECTOR_DB_PATH
 
-    rag_engine = RAGEngine(
-        embedding_model_name=settings.EMBEDDING_MODEL_NAME,
-        vector_store_path=vector_db_path
-    )
-    
+    # The endpoint only serves the packaged store: map it read-only so every model
+    # server worker on the instance shares one copy through the page cache, and
+    # follow new versions if a writer publishes into the same path.
+    rag_engine = build_engine(settings, vector_store_path=vector_db_path, read_only=True)
+
     # 2. Initialize LLM (e.g., Bedrock)
     # Ensure AWS credentials are available via IAM Role
+    from langchain_aws import ChatBedrock
+
     llm = ChatBedrock(
         model_id=settings.LLM_MODEL_ID,
+        region_name=settings.AWS_REGION,
         model_kwargs={"temperature": 0.0}
     )
-    
+
     # 3. Initialize Auditor
-    auditor_agent = AuditorAgent(llm=llm, retriever=rag_engine.get_retriever())
-    
+    # Batch transform hands over whole files of records: they queue for an LLM slot
+    # for as long as it takes instead of failing after LLM_QUEUE_TIMEOUT_SECONDS
+    auditor_agent = AuditorAgent(
+        llm=llm,
+        retriever=rag_engine.get_retriever(),
+        limiter=LLMConcurrencyLimiter(max_in_flight=settings.LLM_MAX_CONCURRENCY, queue_timeout=None),
+        batch_retrieve=lambda queries, documents=None: rag_engine.batch_retrieve(queries, k=10, documents=documents),
+        packer=ContextPacker(max_tokens=settings.CONTEXT_TOKEN_BUDGET, encoding=settings.CONTEXT_TOKENIZER),
+        section_retrieve=lambda query, sections, documents=None: rag_engine.section_retrieve(
+            query, sections, k=settings.SECTION_LOOKUP_K, documents=documents
+        )
+    )
+
     logger.info("Models loaded successfully.")
-    return {"auditor": auditor_agent}
+    # One event loop for the process, reused by every batch
+    return {"auditor": auditor_agent, "loop": asyncio.new_event_loop()}
 
-def input_fn(request_body: Any, request_content_type: str) -> Dict:
+def input_fn(request_body: Any, request_content_type: str) -> Union[Dict, List]:
     """
-    Parse the input request.
+    Parse the input request: one audit (application/json) or, from batch
+    transform jobs, one audit per line (application/jsonlines). Lines are
+    parsed in predict_fn, so a malformed one fails its record only.
     """
-    if request_content_type == 'application/json':
+    content_type = request_content_type.split(";")[0].strip()
+    if isinstance(request_body, (bytes, bytearray)):
+        request_body = request_body.decode("utf-8")
+    if content_type == JSON:
         return json.loads(request_body)
+    elif content_type in JSON_LINES:
+        return [line for line in request_body.splitlines() if line.strip()]
     else:
         raise ValueError(f"Unsupported content type: {request_content_type}")
 
-def predict_fn(input_data: Dict, model: Dict) -> Dict:
+def parse_record(raw: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    One audit: {"query": ..., "system_prompt": ..., "tag": ..., "documents": [...], "id": ...}.
+    Only "query" is required; "id" is echoed back to match results to records.
+    Raises ValueError on anything else.
+    """
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e}")
+    if not isinstance(raw, dict):
+        raise ValueError("Record must be a JSON object")
+    query = raw.get("query")
+    if not isinstance(query, str) or not query.strip():
+        raise ValueError('Record needs a non-empty "query" string')
+    documents = raw.get("documents")
+    if documents is not None and (not isinstance(documents, list) or not all(isinstance(d, str) for d in documents)):
+        raise ValueError('"documents" must be a list of file names')
+    return {
+        "id": raw.get("id"),
+        "query": query,
+        "system_prompt": raw.get("system_prompt") or DEFAULT_SYSTEM_PROMPT,
+        "tag": raw.get("tag"),
+        "documents": documents,
+    }
+
+async def audit_records(
+    auditor: AuditorAgent, records: Iterable[Union[str, Dict[str, Any]]], window: Optional[int] = None
+) -> AsyncIterator[Dict[str, Any]]:
     """
-    Run the inference logic.
+    Audits JSON Lines records (or parsed objects), yielding one result per
+    record in input order as each window of `window` records completes. Every
+    window is one AuditorAgent.abatch_audit: its queries are embedded and
+    searched together, then the LLM calls run concurrently under the limiter.
+    Invalid records and failed audits yield {"error": ...} without stopping
+    the others.
+    """
+    window = window or settings.BATCH_TRANSFORM_WINDOW
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, window))
+        if not chunk:
+            return
+        results: List[Optional[Dict[str, Any]]] = [None] * len(chunk)
+        valid = []
+        for i, raw in enumerate(chunk):
+            try:
+                if isinstance(raw, str):
+                    raw = json.loads(raw)
+                valid.append((i, parse_record(raw)))
+            except json.JSONDecodeError as e:
+                results[i] = {"id": None, "query": None, "result": None, "error": f"Invalid JSON: {e}"}
+            except ValueError as e:
+                # Still echo the id, so the failed record can be found and resubmitted
+                record_id = raw.get("id") if isinstance(raw, dict) else None
+                results[i] = {"id": record_id, "query": None, "result": None, "error": str(e)}
+
+        if valid:
+            try:
+                batch = await auditor.abatch_audit(
+                    [(record["query"], record["system_prompt"]) for _, record in valid],
+                    tags=[record["tag"] for _, record in valid],
+                    documents=[record["documents"] for _, record in valid]
+                )
+                items = batch["items"]
+            except Exception as e:
+                # Retrieval failed for the whole window
+                logger.warning(f"Batch transform window failed: {e}")
+                items = [{"query": record["query"], "result": None, "error": str(e)} for _, record in valid]
+            for (i, record), item in zip(valid, items):
+                results[i] = {"id": record["id"], **item}
+
+        for result in results:
+            yield result
+
+def predict_fn(input_data: Union[Dict, List], model: Dict) -> Union[Dict, List[Dict]]:
+    """
+    Run the inference logic: one audit for a JSON object, a list of results
+    (see audit_records) for a list of records.
     """
     auditor = model['auditor']
-    
+
+    if isinstance(input_data, list):
+        logger.info(f"Running batch audit of {len(input_data)} records")
+
+        async def collect() -> List[Dict]:
+            return [result async for result in audit_records(auditor, input_data)]
+
+        return model["loop"].run_until_complete(collect())
+
     # Option A: Input is raw text or a query
-    query = input_data.get("query", "Audit this project.")
-    
-    # Option B: Input is a document to ingest on the fly (slower, but possible)
-    # if "document_text" in input_data: ...
-    
-    logger.info(f"Running audit for query: {query}")
-    result = auditor.audit_project(query)
-    
-    return result.dict()
-
-def output_fn(prediction: Dict, response_content_type: str) -> Any:
+    record = parse_record({"query": "Audit this project.", **input_data} if isinstance(input_data, dict) else input_data)
+    logger.info(f"Running audit for query: {record['query']}")
+    return auditor.audit_project(record["query"], record["system_prompt"], record["tag"], record["documents"])
+
+def output_fn(prediction: Union[Dict, List], response_content_type: str) -> Any:
     """
-    Format the output.
+    Format the output: JSON, or one JSON object per line in input order
+    (batch transform joins them with AssembleWith=Line).
     """
-    if response_content_type == 'application/json':
-        return json.dumps(prediction)
+    content_type = response_content_type.split(";")[0].strip()
+    if content_type == JSON:
+        return json.dumps(prediction, default=str)
+    elif content_type in JSON_LINES:
+        records = prediction if isinstance(prediction, list) else [prediction]
+        return "".join(json.dumps(record, default=str) + "\n" for record in records)
     else:
         raise ValueError(f"Unsupported content type: {response_content_type}")
 
 if __name__ == "__main__":
-    # Local testing block
-    print("Simulating SageMaker execution...")
+    parser = argparse.ArgumentParser(description="Run the SageMaker handlers locally.")
+    parser.add_argument("--input", help="JSON Lines file of audits to run as a batch transform (- for stdin)")
+    parser.add_argument("--output", help="where to write the JSON Lines results (default: stdout)")
+    args = parser.parse_args()
+
     # Mock model_dir
     model = model_fn(".")
-    result = predict_fn({"query": "Analyze the uploaded PUR."}, model)
-    print(result)
+    if args.input is None:
+        print("Simulating SageMaker execution...")
+        result = predict_fn({"query": "Analyze the uploaded PUR."}, model)
+        print(result)
+    else:
+        source = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+        sink = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+
+        async def transform() -> None:
+            # Results are written as each window completes, so long files stream through
+            async for result in audit_records(model["auditor"], (line for line in source if line.strip())):
+                sink.write(json.dumps(result, default=str) + "\n")
+                sink.flush()
+
+        try:
+            model["loop"].run_until_complete(transform())
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if sink is not sys.stdout:
+                sink.close()
@@ -0,0 +1,161 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+from langchain_core.documents import Document
+import re
+import unicodedata
+
+# Canonical sections of a project plan (PUR) and the heading titles that open them,
+# lowercase and without accents. A heading matches a title it equals or starts with.
+SECTION_TITLES: Dict[str, Tuple[str, ...]] = {
+    "resumo": ("resumo", "resumo executivo", "sumario executivo", "apresentacao", "summary", "abstract"),
+    "objetivos": ("objetivo", "objetivos", "objetivo geral", "objetivos especificos", "objectives", "goals"),
+    "justificativa": ("justificativa", "motivacao", "justification"),
+    "metodologia": ("metodologia", "metodos", "procedimentos metodologicos", "methodology"),
+    "cronograma": ("cronograma", "prazos", "etapas e prazos", "timeline", "schedule"),
+    "orcamento": ("orcamento", "custos", "recursos financeiros", "plano de aplicacao", "investimentos", "budget"),
+    "riscos": ("riscos", "analise de riscos", "gestao de riscos", "risks"),
+    "equipe": ("equipe", "equipe tecnica", "equipe executora", "team"),
+    "resultados": ("resultados", "resultados esperados", "impactos", "expected results"),
+}
+
+# Quick tags answered from known sections instead of a corpus-wide search
+TAG_SECTIONS: Dict[str, Tuple[str, ...]] = {
+    "budget": ("orcamento",),
+    "timeline": ("cronograma",),
+    "risks": ("riscos",),
+    "methodology": ("metodologia",),
+    "objectives": ("objetivos",),
+    "team": ("equipe",),
+    "results": ("resultados",),
+}
+
+# "3", "3.1", "3.1.2." or "III." before the title
+_NUMBERING = re.compile(r"^\s*((?:\d{1,2}\.)*\d{1,2}\.?|[IVX]{1,5}\.)\s+(?=\S)")
+_WORD = re.compile(r"[^\W\d_]+")
+_MAX_HEADING_CHARS = 80
+_MAX_HEADING_WORDS = 10
+
+
+def normalize(text: str) -> str:
+    """Lowercase, accents stripped, whitespace collapsed and trailing punctuation removed."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return " ".join(text.split()).strip(" :.-–")
+
+
+def section_key(title: str) -> Optional[str]:
+    """The canonical section a heading title opens ("4. Orçamento Detalhado" -> "orcamento"), if any."""
+    title = normalize(_NUMBERING.sub("", title))
+    best: Tuple[int, Optional[str]] = (0, None)
+    for key, titles in SECTION_TITLES.items():
+        for known in titles:
+            if len(known) > best[0] and (title == known or title.startswith(known + " ")):
+                best = (len(known), key)
+    return best[1]
+
+
+def sections_for_tag(tag: str) -> Tuple[str, ...]:
+    """
+    Sections that answer a quick tag: a name in TAG_SECTIONS ("Budget") or a
+    section title ("Cronograma"). Matches the whole tag only, so free-text
+    queries that merely mention a section are not routed to it.
+    """
+    name = normalize(tag)
+    if name in TAG_SECTIONS:
+        return TAG_SECTIONS[name]
+    return tuple(key for key, titles in SECTION_TITLES.items() if name in titles)
+
+
+@dataclass(frozen=True)
+class Heading:
+    offset: int
+    level: int
+    title: str
+    key: Optional[str]
+
+    @property
+    def name(self) -> str:
+        """The title without its numbering, normalized."""
+        return normalize(_NUMBERING.sub("", self.title))
+
+
+def _is_title_case(title: str) -> bool:
+    words = [w for w in _WORD.findall(title) if len(w) > 3]
+    return bool(words) and all(w[0].isupper() for w in words)
+
+
+def find_headings(text: str) -> List[Heading]:
+    """
+    Heading lines of a page, with their offset in `text`. A heading is a short
+    line without final punctuation that is either a known section title
+    (see SECTION_TITLES) or numbered ("3.1 ...") and in title or upper case,
+    which keeps numbered list items in sentences out. The level is the depth
+    of the numbering (1 when unnumbered).
+    """
+    headings = []
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        stripped = line.strip()
+        start = offset + len(line) - len(line.lstrip())
+        offset += len(line)
+        if not stripped or len(stripped) > _MAX_HEADING_CHARS or stripped[-1] in ".,;":
+            continue
+        numbering = _NUMBERING.match(stripped)
+        title = stripped[numbering.end():] if numbering else stripped
+        words = _WORD.findall(title)
+        if not words or len(title.split()) > _MAX_HEADING_WORDS or sum(c.isdigit() for c in title) > 4:
+            continue
+        key = section_key(title)
+        if numbering:
+            level = numbering.group(1).rstrip(".").count(".") + 1
+            if key is None and not _is_title_case(title):
+                continue
+        elif key is not None and (normalize(title) in SECTION_TITLES[key] or title.isupper()):
+            level = 1
+        else:
+            continue
+        headings.append(Heading(offset=start, level=level, title=stripped, key=key))
+    return headings
+
+
+class SectionTracker:
+    """
+    Follows the heading structure through the pages of one document and tags
+    chunks with where they sit in it:
+    - "section": the heading path at the start of the chunk ("3. Metodologia > 3.2 Ensaios");
+    - "section_keys": the canonical sections of that path, plus those of
+      headings inside the chunk, which holds the start of their text.
+    Chunks need their offset in the page (start_index). Pages must be given
+    in order, since a section continues onto the following pages.
+    """
+
+    def __init__(self):
+        self.path: List[Heading] = []
+
+    def _enter(self, heading: Heading) -> None:
+        while self.path and self.path[-1].level >= heading.level:
+            self.path.pop()
+        self.path.append(heading)
+
+    def tag(self, page_text: str, chunks: Sequence[Document]) -> None:
+        # (offset, path from that offset on), starting with the path carried over from the last page
+        marks: List[Tuple[int, Tuple[Heading, ...]]] = [(0, tuple(self.path))]
+        for heading in find_headings(page_text):
+            self._enter(heading)
+            marks.append((heading.offset, tuple(self.path)))
+
+        for chunk in chunks:
+            start = max(chunk.metadata.get("start_index", 0), 0)
+            end = start + len(chunk.page_content)
+            path = marks[0][1]
+            keys: List[str] = []
+            for offset, mark_path in marks:
+                if offset <= start:
+                    path = mark_path
+                elif offset < end and mark_path[-1].key:
+                    keys.append(mark_path[-1].key)
+            keys = [h.key for h in path if h.key] + keys
+            if path:
+                chunk.metadata["section"] = " > ".join(h.title for h in path)
+            if keys:
+                chunk.metadata["section_keys"] = list(dict.fromkeys(keys))
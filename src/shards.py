@@ -0,0 +1,671 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar, Union
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from src.batching import QueryBatcher
+from src.mmr import MetadataFilter, mmr
+from src.metrics import span
+from src.rag_engine import EngineRetriever, RAGEngine, _atomic_write
+import numpy as np
+import contextvars
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+SHARDS_DIR = "shards"
+# In each shard directory: the source the shard holds
+SOURCE_NAME = "SOURCE"
+# In each shard directory: the mean unit-length embedding of its chunks (JSON list), for routing unscoped queries
+CENTROID_NAME = "CENTROID"
+# In SHARDS_DIR: a counter the writer bumps (atomically replacing the file) on every published change
+VERSION_NAME = "VERSION"
+
+
+def shard_key(source: str) -> str:
+    """Directory name of the shard of `source`: its file name, plus a hash of the full path."""
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", os.path.basename(source))[:60] or "source"
+    return f"{name}-{hashlib.sha1(source.encode('utf-8')).hexdigest()[:10]}"
+
+
+def _matches(source: str, documents: Sequence[str]) -> bool:
+    return source in documents or os.path.basename(source) in documents
+
+
+class ShardedRAGEngine:
+    """
+    Keeps every source document in its own store ("shard"): a complete
+    RAGEngine under <vector_store_path>/shards/<key>, with its own generations,
+    compaction and section index, all sharing one embedding model and cache.
+
+    - Queries scoped to `documents` search only their shards, so their cost
+      follows the size of those documents rather than of the archive.
+    - Unscoped queries are embedded once and searched in parallel
+      (`fanout_workers` threads) on every shard, or, past `max_fanout_shards`
+      shards, on the `max_fanout_shards` whose centroid is nearest each query
+      (plus shards without a centroid yet, and the unsharded store). MMR then
+      runs once over the candidates of all the shards searched, so picks stay
+      diverse across documents.
+    - A chunk is stored once per shard: the same text in two documents is
+      indexed in both. Retrieval drops the copies, keeping the closest, so
+      results hold each text once as with a single store.
+    - Shards are opened on first use and at most `max_loaded_shards` are held,
+      least recently used evicted first (shards being written are kept).
+    - A store written before sharding (at vector_store_path itself) is still
+      searched alongside the shards, and files re-uploaded move to their shard.
+
+    Exposes the parts of RAGEngine the API uses, so it can stand in for one.
+    Read-only engines follow the writer through the VERSION file, checked at
+    most every `refresh_interval` seconds on the query path.
+    """
+
+    def __init__(
+        self,
+        root: RAGEngine,
+        max_loaded_shards: int = 32,
+        max_fanout_shards: int = 8,
+        fanout_workers: int = 8,
+        query_batch_size: int = 32,
+        query_batch_window_ms: float = 2.0,
+    ):
+        self.root = root
+        self.vector_store_path = root.vector_store_path
+        self.read_only = root.read_only
+        self.refresh_interval = root.refresh_interval
+        self.max_loaded_shards = max_loaded_shards
+        self.max_fanout_shards = max_fanout_shards
+        self.model = root.model
+        self.embeddings = root.embeddings
+        self.embedding_cache = root.embedding_cache
+        self.query_batcher: Optional[QueryBatcher] = None
+        if query_batch_size > 1:
+            self.query_batcher = QueryBatcher(self.batch_retrieve, max_batch=query_batch_size, window_ms=query_batch_window_ms)
+        self._shards_path = os.path.join(self.vector_store_path, SHARDS_DIR)
+        self._executor = ThreadPoolExecutor(max_workers=fanout_workers, thread_name_prefix="shard-search")
+        # source -> shard key
+        self._catalog: Dict[str, str] = {}
+        # shard key -> centroid, for shards that have one
+        self._centroids: Dict[str, np.ndarray] = {}
+        self._loaded: "OrderedDict[str, RAGEngine]" = OrderedDict()
+        # Shards with ingestion or deletes in progress, never evicted
+        self._writing: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self._opened = False
+        self._has_root = False
+        self._published = 0
+        self._live_mutations = 0
+        self._loaded_stamp: Optional[Tuple[int, int]] = None
+        self._last_refresh_check = 0.0
+        self._refresh_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings, vector_store_path: Optional[str] = None, read_only: Optional[bool] = None) -> "ShardedRAGEngine":
+        return cls(
+            RAGEngine.from_settings(settings, vector_store_path=vector_store_path, read_only=read_only),
+            max_loaded_shards=settings.INDEX_MAX_LOADED_SHARDS,
+            max_fanout_shards=settings.INDEX_MAX_FANOUT_SHARDS,
+            fanout_workers=settings.INDEX_FANOUT_WORKERS,
+            query_batch_size=settings.RETRIEVAL_BATCH_SIZE,
+            query_batch_window_ms=settings.RETRIEVAL_BATCH_WINDOW_MS
+        )
+
+    # ------------------------------------------------------------------
+    # Catalog
+    # ------------------------------------------------------------------
+
+    def _version_path(self) -> str:
+        return os.path.join(self._shards_path, VERSION_NAME)
+
+    def _version_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self._version_path())
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_ino)
+
+    def _scan(self) -> Tuple[Dict[str, str], Dict[str, np.ndarray]]:
+        catalog: Dict[str, str] = {}
+        centroids: Dict[str, np.ndarray] = {}
+        if not os.path.isdir(self._shards_path):
+            return catalog, centroids
+        for key in os.listdir(self._shards_path):
+            try:
+                with open(os.path.join(self._shards_path, key, SOURCE_NAME), "r", encoding="utf-8") as f:
+                    catalog[f.read()] = key
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            try:
+                with open(os.path.join(self._shards_path, key, CENTROID_NAME), "r", encoding="utf-8") as f:
+                    centroids[key] = np.array(json.load(f), dtype=np.float32)
+            except (FileNotFoundError, ValueError):
+                pass  # written before routing, or mid-write: always searched
+        return catalog, centroids
+
+    def _save_centroid(self, key: str, engine: RAGEngine) -> None:
+        """Records the centroid of a shard after a write; a shard with nothing published has none."""
+        with self._lock:
+            if key not in self._catalog.values():
+                self._centroids.pop(key, None)
+                return
+        try:
+            centroid = engine.centroid()
+        except FileNotFoundError:
+            centroid = None
+        path = os.path.join(self._shards_path, key, CENTROID_NAME)
+        with self._lock:
+            if centroid is None:
+                self._centroids.pop(key, None)
+                if os.path.exists(path):
+                    os.remove(path)
+            else:
+                self._centroids[key] = centroid.astype(np.float32)
+                _atomic_write(path, json.dumps(centroid.tolist()))
+
+    def _publish(self) -> None:
+        """Bumps VERSION, telling readers to rescan the catalog and reload the shards they hold."""
+        with self._lock:
+            self._published += 1
+            self._live_mutations = 0
+            os.makedirs(self._shards_path, exist_ok=True)
+            _atomic_write(self._version_path(), str(self._published))
+
+    @property
+    def index_version(self) -> str:
+        """Changes with every published change, and with every batch streamed into a shard since."""
+        return f"{self._published}.{self._live_mutations}"
+
+    def current_version(self) -> str:
+        """index_version, after picking up a published change on read-only engines; see RAGEngine.current_version."""
+        if self.read_only:
+            self._maybe_refresh()
+        return self.index_version
+
+    def shards(self) -> Dict[str, str]:
+        """Shard key per source."""
+        with self._lock:
+            return dict(self._catalog)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "shards": len(self._catalog),
+                "loaded": len(self._loaded),
+                "max_loaded": self.max_loaded_shards,
+                "unsharded_store": self._has_root,
+            }
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    def load_vector_store(self) -> None:
+        """
+        Reads the shard catalog and opens the unsharded store if there is one.
+        Shards themselves are opened when first searched; those already open
+        reload the generation published since. Raises FileNotFoundError when
+        there is nothing to search.
+        """
+        if not os.path.exists(self.vector_store_path):
+            raise FileNotFoundError(f"Vector store not found at {self.vector_store_path}")
+
+        with self._lock:
+            stamp = self._version_stamp()
+            try:
+                with open(self._version_path(), "r", encoding="utf-8") as f:
+                    self._published = int(f.read().strip() or 0)
+            except FileNotFoundError:
+                self._published = 0
+            self._catalog, self._centroids = self._scan()
+            try:
+                self.root.load_vector_store()
+                self._has_root = True
+            except FileNotFoundError:
+                self._has_root = False
+            for key in list(self._loaded):
+                if key not in self._catalog.values():
+                    del self._loaded[key]
+                elif key not in self._writing:
+                    self._loaded[key].refresh()
+            self._live_mutations = 0
+            self._loaded_stamp = stamp
+            self._opened = True
+            if not self._catalog and not self._has_root:
+                raise FileNotFoundError(f"Vector store at {self.vector_store_path} is empty")
+
+    def refresh(self) -> bool:
+        """Reloads if the writer published a change since the catalog was read. Returns whether it did."""
+        stamp = self._version_stamp()
+        if stamp is None or stamp == self._loaded_stamp:
+            return False
+        self.load_vector_store()
+        logger.info(f"Picked up index version {self.index_version} ({len(self._catalog)} shards).")
+        return True
+
+    def _maybe_refresh(self) -> None:
+        """Rate-limited refresh() for read-only engines, called on the query path."""
+        now = time.monotonic()
+        if now - self._last_refresh_check < self.refresh_interval:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_refresh_check = now
+            self.refresh()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Index refresh failed, still serving version {self.index_version}: {e}")
+        finally:
+            self._refresh_lock.release()
+
+    def _ensure_open(self) -> None:
+        if self.read_only:
+            self._maybe_refresh()
+        if not self._opened:
+            self.load_vector_store()
+
+    def _open_shard(self, key: str) -> RAGEngine:
+        root = self.root
+        return RAGEngine(
+            embedding_model_name=root.embedding_model_name,
+            vector_store_path=os.path.join(self._shards_path, key),
+            index_spec=root.index_spec,
+            read_only=root.read_only,
+            refresh_interval=root.refresh_interval,
+            keep_generations=root.keep_generations,
+            gc_grace_seconds=root.gc_grace_seconds,
+            # Queries are batched (and embedded) once, by this engine
+            query_batch_size=1,
+            embeddings_from=root
+        )
+
+    def _shard(self, key: str) -> RAGEngine:
+        """The engine of a shard, opened if it isn't held, evicting the least recently used beyond the limit."""
+        with self._lock:
+            engine = self._loaded.get(key)
+            if engine is not None:
+                self._loaded.move_to_end(key)
+                return engine
+        # Opened outside the lock so shards load in parallel; a concurrent open of the same shard is discarded
+        opened = self._open_shard(key)
+        with self._lock:
+            engine = self._loaded.setdefault(key, opened)
+            self._loaded.move_to_end(key)
+            evictable = [k for k in self._loaded if k not in self._writing and k != key]
+            for old in evictable[:max(0, len(self._loaded) - self.max_loaded_shards)]:
+                # Queries still running on it finish; its memory goes with the last reference
+                del self._loaded[old]
+            return engine
+
+    def load_model(self) -> None:
+        self.root.load_model()
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        return self.root.embed_queries(queries)
+
+    def warmup(self) -> Dict[str, float]:
+        """Loads the model and runs a dummy query; shards stay unopened until first searched."""
+        return self.root.warmup()
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def _pin(self, source: str) -> Tuple[str, RAGEngine]:
+        """Creates the shard of `source` if needed and keeps it loaded until _unpin."""
+        key = shard_key(source)
+        with self._lock:
+            self._writing[key] = self._writing.get(key, 0) + 1
+            path = os.path.join(self._shards_path, key)
+            if self._catalog.get(source) != key:
+                os.makedirs(path, exist_ok=True)
+                _atomic_write(os.path.join(path, SOURCE_NAME), source)
+                self._catalog[source] = key
+        return key, self._shard(key)
+
+    def _unpin(self, key: str) -> None:
+        with self._lock:
+            self._writing[key] -= 1
+            if not self._writing[key]:
+                del self._writing[key]
+
+    def add_document_stream(
+        self,
+        chunks: Iterable[Document],
+        batch_size: int = 64,
+        on_batch: Optional[Callable[[int], None]] = None,
+        replace_source: Optional[str] = None,
+    ) -> int:
+        """
+        RAGEngine.add_document_stream into the shard of each chunk's source
+        (consecutive chunks of a source go in as one stream). Returns the
+        number of chunks added. With `replace_source`, its shard swaps in the
+        new version on success, and its chunks in the unsharded store go too.
+        """
+        self.root._check_writable()
+        if not self._opened:
+            try:
+                self.load_vector_store()
+            except FileNotFoundError:
+                self._opened = True  # nothing indexed yet
+
+        added = 0
+        for source, run in groupby(chunks, key=lambda chunk: chunk.metadata.get("source", "")):
+            key, engine = self._pin(source)
+
+            def shard_batch(count: int, offset: int = added) -> None:
+                with self._lock:
+                    self._live_mutations += 1
+                if on_batch:
+                    on_batch(offset + count)
+
+            replace = replace_source if source == replace_source else None
+            try:
+                added += engine.add_document_stream(run, batch_size=batch_size, on_batch=shard_batch, replace_source=replace)
+                if replace is not None and self._has_root and replace in self.root.sources():
+                    self.root.delete_source(replace)
+            finally:
+                self._unpin(key)
+                with self._lock:
+                    if key not in self._writing and not engine.sources():
+                        self._drop(source, key)  # nothing to index in this source
+                # Batches committed before a failure count too
+                self._save_centroid(key, engine)
+                self._publish()
+        return added
+
+    def add_documents(self, documents: List[Document]) -> int:
+        return self.add_document_stream(documents, batch_size=max(len(documents), 1))
+
+    def delete_source(self, source: str) -> int:
+        """Removes every chunk of `source`: its shard, and its chunks in the unsharded store. Returns how many."""
+        self.root._check_writable()
+        if not self._opened:
+            try:
+                self.load_vector_store()
+            except FileNotFoundError:
+                self._opened = True
+
+        removed = 0
+        if self._has_root and source in self.root.sources():
+            removed += self.root.delete_source(source)
+        with self._lock:
+            key = self._catalog.get(source)
+            writing = key in self._writing
+            if key is not None and not writing:
+                engine = self._loaded.get(key) or self._open_shard(key)
+                removed += engine.sources().get(source, 0)
+                self._drop(source, key)
+        if writing:
+            # Being ingested right now: delete inside the shard instead of dropping it
+            engine = self._shard(key)
+            removed += engine.delete_source(source)
+            self._save_centroid(key, engine)
+        if removed or key is not None:
+            self._publish()
+            logger.info(f"Removed {removed} chunks for source {source}.")
+        return removed
+
+    def _drop(self, source: str, key: str) -> None:
+        """Forgets a shard and deletes its directory. Callers hold the lock."""
+        self._loaded.pop(key, None)
+        self._catalog.pop(source, None)
+        self._centroids.pop(key, None)
+        # Readers that mapped the shard keep reading the unlinked files until they rescan
+        shutil.rmtree(os.path.join(self._shards_path, key), ignore_errors=True)
+
+    def compact(self) -> None:
+        """Compacts every shard (opening each in turn) and the unsharded store."""
+        self._each_store(RAGEngine.compact)
+
+    def rebuild_index(self) -> None:
+        """
+        RAGEngine.rebuild_index on every shard (opening each in turn) and the
+        unsharded store: each is retrained as `index_spec.index_type`, or a
+        simpler type when it holds too few chunks to train one.
+        """
+        self._each_store(RAGEngine.rebuild_index)
+
+    def _each_store(self, operation: Callable[[RAGEngine], None]) -> None:
+        if self._has_root:
+            operation(self.root)
+        for source in list(self.shards()):
+            key, engine = self._pin(source)
+            try:
+                operation(engine)
+                # Also fills in the centroid of shards written before routing
+                self._save_centroid(key, engine)
+            finally:
+                self._unpin(key)
+        self._publish()
+
+    def stores(self) -> Iterator[Tuple[Optional[str], RAGEngine]]:
+        """(source, engine) per shard, opened in turn, after (None, unsharded store) if there is one."""
+        self._ensure_open()
+        if self._has_root:
+            yield None, self.root
+        for source, key in sorted(self.shards().items()):
+            yield source, self._shard(key)
+
+    # ------------------------------------------------------------------
+    # Retrieval
+    # ------------------------------------------------------------------
+
+    def _targets(self, documents: Optional[Sequence[str]]) -> List[Optional[str]]:
+        """Shard keys to search (None: the unsharded store)."""
+        with self._lock:
+            catalog = dict(self._catalog)
+        if documents:
+            keys = [key for source, key in catalog.items() if _matches(source, documents)]
+            root = self._has_root and any(_matches(source, documents) for source in self.root.sources())
+        else:
+            keys = list(catalog.values())
+            root = self._has_root
+        return ([None] if root else []) + keys
+
+    def _route(self, targets: List[Optional[str]], vectors: np.ndarray) -> Dict[Optional[str], List[int]]:
+        """
+        The query rows each target searches: all of them, unless there are
+        more than `max_fanout_shards` shards with a centroid, in which case
+        each row goes to the `max_fanout_shards` nearest. The unsharded store
+        and shards without a centroid get every row.
+        """
+        with self._lock:
+            centroids = dict(self._centroids)
+        routed = [key for key in targets if key in centroids]
+        every = list(range(len(vectors)))
+        if len(routed) <= self.max_fanout_shards:
+            return {target: every for target in targets}
+
+        rows: Dict[Optional[str], List[int]] = {target: every for target in targets if target not in centroids}
+        units = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        similarities = units @ np.stack([centroids[key] for key in routed]).T
+        nearest = np.argpartition(-similarities, self.max_fanout_shards - 1, axis=1)[:, :self.max_fanout_shards]
+        for row, picks in enumerate(nearest):
+            for pick in picks:
+                rows.setdefault(routed[pick], []).append(row)
+        return rows
+
+    def _fan_out(self, targets: List[Optional[str]], search: Callable[[RAGEngine, Optional[str]], T], empty: T) -> List[T]:
+        """Runs `search(engine, target)` on every target, in parallel when there are several."""
+
+        def run(target: Optional[str]) -> T:
+            engine = self.root if target is None else self._shard(target)
+            try:
+                return search(engine, target)
+            except FileNotFoundError:
+                # A shard whose first generation isn't published yet
+                return empty
+
+        if len(targets) == 1:
+            return [run(targets[0])]
+        # Each task gets its own copy of the context, so spans land in the caller's trace
+        futures = [self._executor.submit(contextvars.copy_context().run, run, target) for target in targets]
+        return [future.result() for future in futures]
+
+    def get_retriever(
+        self,
+        k: int = 15,
+        fetch_k: int = 50,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filter: Optional[Dict[str, Any]] = None,
+        max_fetch_k: Optional[int] = None,
+    ) -> BaseRetriever:
+        """MMR retriever over all shards; see RAGEngine.get_retriever."""
+        self._ensure_open()
+        return EngineRetriever(
+            engine=self,
+            search_kwargs={
+                "k": k,
+                "fetch_k": fetch_k,
+                "lambda_mult": 0.7,
+                "nprobe": nprobe,
+                "ef_search": ef_search,
+                "filter": filter,
+                "max_fetch_k": max_fetch_k,
+            }
+        )
+
+    def retrieve(self, query: str, **search_kwargs: Any) -> List[Document]:
+        if self.query_batcher is None:
+            return self.batch_retrieve([query], **search_kwargs)[0]
+        return self.query_batcher.retrieve(query, **search_kwargs)
+
+    def batch_retrieve(self, queries: List[str], **search_kwargs: Any) -> List[List[Document]]:
+        """RAGEngine.batch_retrieve over the shards of `documents` (all shards when not given)."""
+        return [[doc for doc, _ in hits] for hits in self.batch_retrieve_with_scores(queries, **search_kwargs)]
+
+    def batch_retrieve_with_scores(
+        self,
+        queries: List[str],
+        k: int = 15,
+        fetch_k: int = 50,
+        lambda_mult: float = 0.7,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filter: Optional[MetadataFilter] = None,
+        max_fetch_k: Optional[int] = None,
+        documents: Optional[Sequence[str]] = None,
+        vectors: Optional[np.ndarray] = None,
+    ) -> List[List[Tuple[Document, float]]]:
+        self._ensure_open()
+        targets = self._targets(documents)
+        if not targets:
+            return [[] for _ in queries]
+        if vectors is None:
+            with span("embed_query"):
+                vectors = np.array(self.embed_queries(queries), dtype=np.float32)
+        routes = self._route(targets, vectors) if not documents else {target: list(range(len(queries))) for target in targets}
+        targets = list(routes)
+
+        if len(targets) == 1:
+            # One store: its own MMR is already the whole selection
+            with span("shard_search"):
+                return self._fan_out(targets, lambda engine, target: engine.batch_retrieve_with_scores(
+                    queries, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult, nprobe=nprobe, ef_search=ef_search,
+                    filter=filter, max_fetch_k=max_fetch_k, documents=documents if target is None else None,
+                    vectors=vectors
+                ), [[] for _ in queries])[0]
+
+        def search(engine: RAGEngine, target: Optional[str]) -> List[Tuple[List[Document], np.ndarray]]:
+            rows = routes[target]
+            return engine.batch_candidates(
+                [queries[row] for row in rows], fetch_k=fetch_k, nprobe=nprobe, ef_search=ef_search,
+                filter=filter, max_fetch_k=max_fetch_k,
+                # A shard holds one source; only the unsharded store needs the scope as a filter
+                documents=documents if target is None else None,
+                vectors=vectors[rows]
+            )
+
+        with span("shard_search"):
+            per_target = self._fan_out(targets, search, [([], np.empty((0, 0), dtype=np.float32)) for _ in queries])
+        per_row: List[List[Tuple[List[Document], np.ndarray]]] = [[] for _ in queries]
+        for target, results in zip(targets, per_target):
+            for row, found in zip(routes[target], results):
+                if found[0]:
+                    per_row[row].append(found)
+        with span("shard_merge"):
+            return [self._merge(vectors[row], found, k, fetch_k, lambda_mult) for row, found in enumerate(per_row)]
+
+    @staticmethod
+    def _merge(
+        query: np.ndarray,
+        found: List[Tuple[List[Document], np.ndarray]],
+        k: int,
+        fetch_k: int,
+        lambda_mult: float,
+    ) -> List[Tuple[Document, float]]:
+        """
+        MMR over the candidates several stores found for one query: the
+        `fetch_k` most similar, each text once (the same chunk can be stored
+        in several shards), then the selection RAGEngine makes within a store.
+        """
+        if not found:
+            return []
+        docs = [doc for store_docs, _ in found for doc in store_docs]
+        matrix = np.concatenate([rows for _, rows in found])
+        unit_query = query / max(float(np.linalg.norm(query)), 1e-12)
+        similarities = matrix @ unit_query
+        keep: List[int] = []
+        seen = set()
+        for i in np.argsort(-similarities, kind="stable"):
+            digest = docs[i].metadata.get("content_hash") or docs[i].page_content
+            if digest not in seen:
+                seen.add(digest)
+                keep.append(int(i))
+                if len(keep) == fetch_k:
+                    break
+        matrix = matrix[keep]
+        selected = mmr(unit_query, matrix, k=k, lambda_mult=lambda_mult)
+        return [(docs[keep[i]], float(similarities[keep[i]])) for i in selected]
+
+    def section_retrieve(
+        self,
+        query: str,
+        sections: Sequence[str],
+        k: int = 8,
+        lambda_mult: float = 0.7,
+        filter: Optional[MetadataFilter] = None,
+        documents: Optional[Sequence[str]] = None,
+    ) -> List[Document]:
+        """
+        RAGEngine.section_retrieve on the shards of `documents` (when not
+        given, all of them, or those routed to as in batch_retrieve). With
+        several shards, their picks are taken in turn up to `k`, so every
+        document is represented.
+        """
+        self._ensure_open()
+        targets = self._targets(documents)
+        if not documents and len(targets) > self.max_fanout_shards:
+            vector = np.array(self.embed_queries([query]), dtype=np.float32)
+            targets = list(self._route(targets, vector))
+
+        def search(engine: RAGEngine, target: Optional[str]) -> List[Document]:
+            return engine.section_retrieve(
+                query, sections, k=k, lambda_mult=lambda_mult, filter=filter,
+                documents=documents if target is None else None
+            )
+
+        per_shard = [docs for docs in self._fan_out(targets, search, []) if docs]
+        merged: List[Document] = []
+        for rank in range(k):
+            for docs in per_shard:
+                if rank < len(docs) and len(merged) < k:
+                    merged.append(docs[rank])
+        return merged
+
+
+def build_engine(settings, vector_store_path: Optional[str] = None, read_only: Optional[bool] = None) -> Union[RAGEngine, ShardedRAGEngine]:
+    """The engine INDEX_SHARDING asks for: one store per source ("source") or a single store ("none")."""
+    if settings.INDEX_SHARDING == "source":
+        return ShardedRAGEngine.from_settings(settings, vector_store_path=vector_store_path, read_only=read_only)
+    return RAGEngine.from_settings(settings, vector_store_path=vector_store_path, read_only=read_only)
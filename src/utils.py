@@ -1,17 +1,97 @@
+from contextvars import copy_context
+from itertools import islice
+from queue import Full, Queue
+from threading import Event, Thread
+from typing import Iterable, Iterator, List, TypeVar
+
+T = TypeVar("T")
+
 def clean_text(text: str) -> str:
     """Cleans the input text by removing unnecessary whitespace and special characters."""
     return ' '.join(text.split())
 
 def extract_sections(text: str, section_titles: list) -> dict:
-    """Extracts specified sections from the text based on section titles."""
+    """
+    Extracts specified sections from the text based on section titles: the text
+    under each heading (see src.sections.find_headings) whose title matches,
+    ignoring case, accents and numbering, up to the next heading of the same or a higher level.
+    """
+    from src.sections import find_headings, normalize, section_key
+
+    wanted = {normalize(title): title for title in section_titles}
+    wanted_keys = {section_key(title): title for title in section_titles if section_key(title)}
+    headings = find_headings(text)
     sections = {}
-    for title in section_titles:
-        start_index = text.find(title)
-        if start_index != -1:
-            end_index = text.find('\n', start_index)
-            sections[title] = text[start_index:end_index].strip()
+    for i, heading in enumerate(headings):
+        title = wanted.get(heading.name) or wanted_keys.get(heading.key)
+        if title is None or title in sections:
+            continue
+        end = next((h.offset for h in headings[i + 1:] if h.level <= heading.level), len(text))
+        sections[title] = text[heading.offset + len(heading.title):end].strip()
     return sections
 
 def log_message(message: str) -> None:
     """Logs a message to the console."""
-    print(f"[LOG] {message}")
\ No newline at end of file
+    print(f"[LOG] {message}")
+
+def batched(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Yields lists of up to `size` items, pulling from `iterable` only as needed."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+_DONE = object()
+# How often a producer blocked on a full buffer checks whether the consumer is gone
+_PUT_POLL_SECONDS = 0.1
+
+def prefetch(iterable: Iterable[T], max_items: int) -> Iterator[T]:
+    """
+    Runs `iterable` in a background thread, keeping at most `max_items` ready.
+    The producer blocks once the buffer is full, so a slow consumer holds
+    back the producer instead of letting items pile up in memory.
+    When the consumer stops early (an error, a cancelled job, close()), the
+    producer stops at its next item and closes `iterable`, releasing what it
+    holds (open PDFs, extraction worker pools).
+    """
+    buffer: Queue = Queue(maxsize=max_items)
+    stop = Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=_PUT_POLL_SECONDS)
+                return True
+            except Full:
+                continue
+        return False
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(e)
+        finally:
+            # Closed from this thread, the one running it
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+            put(_DONE)
+
+    # The producer runs in a copy of the consumer's context, e.g. to time its work into the same trace
+    Thread(target=copy_context().run, args=(produce,), daemon=True).start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
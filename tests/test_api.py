@@ -0,0 +1,259 @@
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import src.api as api
+import src.embeddings as embeddings_module
+from benchmarks.fakes import AUDIT_REPLY, fake_chat_model
+from benchmarks.synthetic import write_pdf
+from src.caches import AuditCaches, TTLCache
+from src.jobs import JobManager
+from src.rag_engine import RAGEngine
+from tests.test_rag_engine import FakeEmbeddings
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(embeddings_module, "torch_embeddings", FakeEmbeddings)
+    return RAGEngine(embedding_model_name="fake", vector_store_path=str(tmp_path / "store"), query_batch_size=1)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, engine):
+    """The app on a fresh engine, fake LLM and in-memory caches; the startup hook (Bedrock) doesn't run."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(api.state, "rag_engine", engine)
+    monkeypatch.setattr(api.state, "llm", fake_chat_model())
+    monkeypatch.setattr(api.state, "retriever", None)
+    monkeypatch.setattr(api.state, "auditor", None)
+    monkeypatch.setattr(api.state, "ready", True)
+    monkeypatch.setattr(api.state, "jobs", JobManager(max_concurrent=1, max_queued=4))
+    monkeypatch.setattr(api.state, "audit_caches", AuditCaches(TTLCache(), TTLCache(), index_version=lambda: engine.index_version))
+    return TestClient(api.app)
+
+
+def _poll(client, job_id, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] in ("succeeded", "failed", "cancelled"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def test_upload_is_accepted_and_polled_to_completion(client, tmp_path, engine):
+    pdf = write_pdf(str(tmp_path / "source.pdf"), pages=4)
+    with open(pdf, "rb") as f:
+        response = client.post("/upload", files={"file": ("plan.pdf", f, "application/pdf")})
+
+    assert response.status_code == 202
+    accepted = response.json()
+    assert accepted["filename"] == "plan.pdf"
+    assert accepted["status"] in ("queued", "running")
+
+    job = _poll(client, accepted["job_id"])
+    assert job["status"] == "succeeded", job["error"]
+    assert job["pages_processed"] == 4
+    assert job["chunks_added"] == job["chunks_processed"] > 0
+    assert job["elapsed_seconds"] is not None
+    assert engine.sources() == {"data/plan.pdf": job["chunks_added"]}
+    assert [j["job_id"] for j in client.get("/jobs").json()] == [accepted["job_id"]]
+    # The first ingest makes the app able to audit
+    assert api.state.auditor is not None
+
+
+def test_failed_ingest_is_reported_on_the_job(client):
+    response = client.post("/upload", files={"file": ("broken.pdf", b"not a pdf", "application/pdf")})
+    assert response.status_code == 202
+
+    job = _poll(client, response.json()["job_id"])
+    assert job["status"] == "failed"
+    assert job["error"]
+    assert job["chunks_added"] == 0
+
+
+def test_failed_reupload_keeps_the_previous_version(client, tmp_path, engine, monkeypatch):
+    monkeypatch.setattr(api.settings, "INGEST_BATCH_SIZE", 4)
+    pdf = write_pdf(str(tmp_path / "source.pdf"), pages=4)
+    with open(pdf, "rb") as f:
+        first = _poll(client, client.post("/upload", files={"file": ("plan.pdf", f, "application/pdf")}).json()["job_id"])
+    assert first["status"] == "succeeded", first["error"]
+    indexed = engine.sources()["data/plan.pdf"]
+    assert indexed > 8
+
+    embed = engine.embeddings.embed_documents
+    calls = []
+
+    def failing_embed(texts):
+        calls.append(texts)
+        if len(calls) == 3:
+            raise RuntimeError("boom")
+        return embed(texts)
+
+    monkeypatch.setattr(engine.embeddings, "embed_documents", failing_embed)
+    with open(pdf, "rb") as f:
+        failed = _poll(client, client.post("/upload", files={"file": ("plan.pdf", f, "application/pdf")}).json()["job_id"])
+    assert failed["status"] == "failed" and failed["error"] == "boom"
+    # The old version is still there, whole, and nothing of the new one is served
+    assert engine.sources() == {"data/plan.pdf": indexed}
+    assert engine.snapshot.size == indexed
+
+    monkeypatch.setattr(engine.embeddings, "embed_documents", embed)
+    with open(pdf, "rb") as f:
+        replaced = _poll(client, client.post("/upload", files={"file": ("plan.pdf", f, "application/pdf")}).json()["job_id"])
+    assert replaced["status"] == "succeeded", replaced["error"]
+    assert engine.sources() == {"data/plan.pdf": indexed}
+    assert engine.snapshot.size == indexed
+
+
+def test_upload_of_a_file_being_ingested_is_refused(client, monkeypatch):
+    import threading
+
+    release = threading.Event()
+    monkeypatch.setattr(api, "_ingest_file", lambda job, path: release.wait(5))
+
+    first = client.post("/upload", files={"file": ("plan.pdf", b"%PDF one", "application/pdf")})
+    assert first.status_code == 202
+    second = client.post("/upload", files={"file": ("plan.pdf", b"%PDF two", "application/pdf")})
+    assert second.status_code == 409
+    assert first.json()["job_id"] in second.json()["detail"]
+    # The running job's file was left alone; other files are accepted
+    with open("data/plan.pdf", "rb") as f:
+        assert f.read() == b"%PDF one"
+    assert client.post("/upload", files={"file": ("other.pdf", b"%PDF", "application/pdf")}).status_code == 202
+
+    release.set()
+    assert _poll(client, first.json()["job_id"])["status"] == "succeeded"
+    assert client.post("/upload", files={"file": ("plan.pdf", b"%PDF three", "application/pdf")}).status_code == 202
+
+
+def test_unknown_jobs_are_404(client):
+    assert client.get("/jobs/missing").status_code == 404
+    assert client.delete("/jobs/missing").status_code == 404
+
+
+def test_read_only_workers_refuse_uploads(client, engine, monkeypatch):
+    monkeypatch.setattr(engine, "read_only", True)
+    response = client.post("/upload", files={"file": ("plan.pdf", b"%PDF", "application/pdf")})
+    assert response.status_code == 503
+
+
+def test_reader_loads_its_first_index_off_the_event_loop(client, engine, monkeypatch):
+    import threading
+
+    _index(engine)
+    monkeypatch.setattr(api.state, "auditor", None)
+    monkeypatch.setattr(engine, "read_only", True)
+    loaded_on = []
+
+    def refresh():
+        loaded_on.append(threading.current_thread().name)
+        return True
+
+    monkeypatch.setattr(engine, "refresh", refresh)
+    response = client.post("/audit", json={"query": "Qual o orçamento?"})
+
+    assert response.status_code == 200, response.text
+    assert api.state.auditor is not None
+    assert loaded_on[0].startswith("AnyIO worker thread")
+
+
+def _index(engine):
+    from langchain_core.documents import Document
+
+    engine.add_documents([
+        Document(page_content=f"Orçamento total do projeto: R$ {i}.000.000", metadata={"source": "data/plan.pdf", "page": i + 1})
+        for i in range(3)
+    ])
+    api._set_retriever()
+
+
+def _events(response):
+    """(event, data) pairs of an SSE body, checking each frame is well formed."""
+    events = []
+    for frame in response.text.split("\n\n"):
+        if not frame:
+            continue
+        event_line, data_line = frame.split("\n")
+        assert event_line.startswith("event: ") and data_line.startswith("data: ")
+        events.append((event_line[len("event: "):], json.loads(data_line[len("data: "):])))
+    return events
+
+
+def test_stream_emits_retrieval_tokens_then_result(client, engine):
+    _index(engine)
+    with client.stream("POST", "/audit/stream", json={"query": "Qual o orçamento?", "system_prompt": "Extract the budget."}) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        response.read()
+    events = _events(response)
+
+    names = [name for name, _ in events]
+    assert names[0] == "retrieval" and names[-1] == "result"
+    assert set(names[1:-1]) == {"token"}
+    assert events[0][1]["chunks"] == 3
+    # The deltas add up to the JSON object the result parses
+    streamed = "".join(data["delta"] for name, data in events if name == "token")
+    assert json.loads(streamed) == events[-1][1] == json.loads(AUDIT_REPLY)
+
+
+def test_stream_reports_an_llm_failure_as_an_error_event(client, engine, monkeypatch):
+    _index(engine)
+    failing = FakeListChatModel(responses=[AUDIT_REPLY], error_on_chunk_number=5)
+    monkeypatch.setattr(api.state.auditor, "llm", failing)
+
+    with client.stream("POST", "/audit/stream", json={"query": "Qual o orçamento?"}) as response:
+        response.read()
+    events = _events(response)
+
+    names = [name for name, _ in events]
+    assert names[0] == "retrieval"
+    assert names[1:-1] == ["token"] * (len(names) - 2)
+    assert names[-1] == "error"
+    assert events[-1][1]["detail"].startswith("Audit failed")
+    # The slot held by the failed generation was given back
+    assert api.state.llm_limiter.in_flight == 0
+
+
+def test_batch_audit_retrieves_every_item_in_one_pass(client, engine, monkeypatch):
+    _index(engine)
+    calls = []
+    batch_retrieve = engine.batch_retrieve
+
+    def spy(queries, **kwargs):
+        calls.append((list(queries), kwargs.get("documents")))
+        return batch_retrieve(queries, **kwargs)
+
+    monkeypatch.setattr(engine, "batch_retrieve", spy)
+    response = client.post("/audit/batch", json={"items": [
+        {"query": "Qual o orçamento?", "tag": "Budget"},
+        {"query": "Qual o cronograma?"},
+        {"query": "Quais os riscos?"},
+    ]})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [item["query"] for item in body["items"]] == ["Qual o orçamento?", "Qual o cronograma?", "Quais os riscos?"]
+    assert all(item["error"] is None and item["result"] == json.loads(AUDIT_REPLY) for item in body["items"])
+    # No chunk is in the budget section, so the tagged item falls back to the shared vector search
+    assert len(calls) == 1 and len(calls[0][0]) == 3 and calls[0][1] is None
+
+
+def test_batch_audit_passes_document_scopes(client, engine, monkeypatch):
+    _index(engine)
+    calls = []
+    batch_retrieve = engine.batch_retrieve
+    monkeypatch.setattr(engine, "batch_retrieve", lambda queries, **kwargs: calls.append(kwargs.get("documents")) or batch_retrieve(queries, **kwargs))
+
+    response = client.post("/audit/batch", json={"items": [
+        {"query": "Qual o orçamento?", "documents": ["plan.pdf"]},
+        {"query": "Qual o cronograma?", "documents": ["other.pdf"]},
+    ]})
+
+    items = response.json()["items"]
+    assert sorted(calls) == [["other.pdf"], ["plan.pdf"]]
+    assert [item["chunks"] for item in items] == [3, 0]
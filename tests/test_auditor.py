@@ -1,3 +1,14 @@
+import asyncio
+import json
+import threading
+import time
+
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from benchmarks.fakes import AUDIT_REPLY, fake_chat_model
+from src.auditor import AuditorAgent, LLMConcurrencyLimiter, LLMQueueTimeout
+from src.context_packer import ContextPacker
 from pydantic import BaseModel
 from enum import Enum
 import pytest
@@ -47,4 +58,283 @@ def test_invalid_compliance_score():
             methodology_summary="Invalid compliance score test.",
             risk_assessment=RiskAssessment.High,
             compliance_score=110  # Invalid compliance score
-        )
\ No newline at end of file
+        )
+
+# ----------------------------------------------------------------------
+# LLM concurrency limiter and async audits
+# ----------------------------------------------------------------------
+
+
+class PeakTracker:
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def record(self):
+        with self._lock:
+            self.peak = max(self.peak, self.limiter.in_flight)
+
+
+def test_sync_and_async_callers_share_one_cap():
+    limiter = LLMConcurrencyLimiter(max_in_flight=2, queue_timeout=5)
+    tracker = PeakTracker(limiter)
+
+    def sync_call():
+        with limiter.sync_slot():
+            tracker.record()
+            time.sleep(0.03)
+
+    async def async_call():
+        async with limiter.slot():
+            tracker.record()
+            await asyncio.sleep(0.03)
+
+    threads = [threading.Thread(target=sync_call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+
+    async def main():
+        await asyncio.gather(*[async_call() for _ in range(4)])
+
+    asyncio.run(main())
+    for thread in threads:
+        thread.join()
+    assert tracker.peak == 2
+    assert limiter.in_flight == 0
+
+
+def test_waiters_time_out_when_every_slot_is_held():
+    limiter = LLMConcurrencyLimiter(max_in_flight=1, queue_timeout=0.05)
+
+    def sync_call():
+        with limiter.sync_slot():
+            pass
+
+    async def main():
+        async with limiter.slot():
+            with pytest.raises(LLMQueueTimeout):
+                async with limiter.slot():
+                    pass
+            with pytest.raises(LLMQueueTimeout):
+                await asyncio.get_running_loop().run_in_executor(None, sync_call)
+
+    asyncio.run(main())
+    assert limiter.in_flight == 0
+
+
+def test_waiting_for_a_slot_does_not_block_the_event_loop():
+    limiter = LLMConcurrencyLimiter(max_in_flight=1, queue_timeout=5)
+    held, release = threading.Event(), threading.Event()
+
+    def hold():
+        with limiter.sync_slot():
+            held.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    assert held.wait(5)
+
+    async def main():
+        ticks = 0
+
+        async def waiter():
+            async with limiter.slot():
+                return ticks
+
+        task = asyncio.create_task(waiter())
+        threading.Timer(0.1, release.set).start()
+        while not task.done():
+            ticks += 1
+            await asyncio.sleep(0.005)
+        return await task
+
+    # The loop kept running other work while the waiter queued for the slot
+    assert asyncio.run(main()) > 5
+    thread.join()
+
+
+def test_slots_go_to_waiters_in_arrival_order():
+    limiter = LLMConcurrencyLimiter(max_in_flight=1, queue_timeout=5)
+    order = []
+
+    def sync_call(name):
+        with limiter.sync_slot():
+            order.append(name)
+
+    async def async_call(name):
+        async with limiter.slot():
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        async with limiter.slot():
+            first = asyncio.create_task(async_call("async 1"))
+            await asyncio.sleep(0.01)
+            thread = loop.run_in_executor(None, sync_call, "sync")
+            while len(limiter._waiters) < 2:
+                await asyncio.sleep(0.001)
+            cancelled = asyncio.create_task(async_call("cancelled"))
+            last = asyncio.create_task(async_call("async 2"))
+            await asyncio.sleep(0.01)
+            cancelled.cancel()
+        await asyncio.gather(first, thread, last)
+
+    asyncio.run(main())
+    assert order == ["async 1", "sync", "async 2"]
+    assert limiter.in_flight == 0 and limiter._free == 1
+
+
+class StubRetriever:
+    search_kwargs = {"k": 2}
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.searches = []
+
+    def invoke(self, search):
+        self.searches.append(search)
+        return self.docs
+
+    def batch(self, searches):
+        return [self.invoke(search) for search in searches]
+
+
+def test_aaudit_project_returns_the_parsed_answer():
+    retriever = StubRetriever([Document(page_content="Orçamento total: R$ 1.000.000", metadata={"source": "a.pdf", "page": 1})])
+    limiter = LLMConcurrencyLimiter(max_in_flight=1)
+    auditor = AuditorAgent(llm=fake_chat_model(), retriever=retriever, limiter=limiter)
+
+    result = asyncio.run(auditor.aaudit_project("Qual o orçamento?", "Extract the budget."))
+
+    assert result == json.loads(AUDIT_REPLY)
+    assert len(retriever.searches) == 1 and retriever.searches[0].startswith("Qual o orçamento?")
+    assert limiter.in_flight == 0
+
+
+class RecordingRetrieval:
+    """batch_retrieve and section_retrieve stubs recording their calls."""
+
+    def __init__(self):
+        self.batches = []
+        self.sections = []
+
+    def batch_retrieve(self, searches, documents=None):
+        self.batches.append((list(searches), documents))
+        return [[Document(page_content=f"chunk for {s.splitlines()[0]}", metadata={"source": "a.pdf", "page": 1})] for s in searches]
+
+    def section_retrieve(self, search, sections, documents=None):
+        self.sections.append((list(sections), documents))
+        return [Document(page_content="Orçamento: R$ 10", metadata={"source": "a.pdf", "page": 2})]
+
+
+def test_abatch_audit_shares_one_retrieval_pass_and_routes_tags():
+    retrieval = RecordingRetrieval()
+    retriever = StubRetriever([])
+    auditor = AuditorAgent(
+        llm=FakeListChatModel(responses=['{"answer": 1}', '{"answer": 2}', '{"answer": 3}']),
+        retriever=retriever,
+        batch_retrieve=retrieval.batch_retrieve,
+        section_retrieve=retrieval.section_retrieve,
+    )
+
+    batch = asyncio.run(auditor.abatch_audit(
+        [("Summarize the plan", "Summarize."), ("How much?", "Extract the budget."), ("What could go wrong?", "List the risks.")],
+        tags=[None, "Budget", None],
+    ))
+
+    # The untagged items were searched together, the tagged one read its section
+    assert [searches for searches, _ in retrieval.batches] == [[
+        auditor.search_text("Summarize the plan", "Summarize."),
+        auditor.search_text("What could go wrong?", "List the risks."),
+    ]]
+    assert retrieval.sections == [(["orcamento"], None)]
+    assert retriever.searches == []
+    assert [item["query"] for item in batch["items"]] == ["Summarize the plan", "How much?", "What could go wrong?"]
+    assert all(item["error"] is None and item["chunks"] == 1 for item in batch["items"])
+    assert batch["unique_chunks"] == 3
+
+
+def test_abatch_audit_retrieves_each_document_scope_separately():
+    retrieval = RecordingRetrieval()
+    retriever = StubRetriever([])
+    auditor = AuditorAgent(
+        llm=FakeListChatModel(responses=['{"answer": 1}']),
+        retriever=retriever,
+        batch_retrieve=retrieval.batch_retrieve,
+    )
+
+    asyncio.run(auditor.abatch_audit(
+        [("a", "x"), ("b", "x"), ("c", "x")],
+        documents=[["b.pdf", "a.pdf"], None, ["a.pdf", "b.pdf"]],
+    ))
+
+    # Both items on a.pdf + b.pdf in one scoped pass; the lone unscoped one through the retriever
+    assert [(len(searches), documents) for searches, documents in retrieval.batches] == [(2, ["a.pdf", "b.pdf"])]
+    assert retriever.searches == [auditor.search_text("b", "x")]
+
+
+def test_scoped_audits_are_refused_without_a_scoped_batch_retrieve():
+    auditor = AuditorAgent(llm=fake_chat_model(), retriever=StubRetriever([]))
+    with pytest.raises(ValueError, match="scoped"):
+        asyncio.run(auditor.abatch_audit([("a", "x")], documents=[["a.pdf"]]))
+
+
+def test_abatch_audit_packing_failure_only_fails_its_item():
+    class FailingPacker(ContextPacker):
+        def pack(self, docs):
+            if any("Risks" in d.page_content for d in docs):
+                raise ValueError("cannot pack")
+            return super().pack(docs)
+
+    retrieval = RecordingRetrieval()
+    auditor = AuditorAgent(
+        llm=FakeListChatModel(responses=['{"answer": 1}']),
+        retriever=StubRetriever([]),
+        batch_retrieve=retrieval.batch_retrieve,
+        packer=FailingPacker(),
+    )
+
+    batch = asyncio.run(auditor.abatch_audit([("Summarize", "x"), ("Risks", "x")]))
+
+    ok, failed = batch["items"]
+    assert ok["error"] is None and ok["result"] == {"answer": 1}
+    assert set(ok["timings"]) == {"pack_ms", "llm_ms"}
+    assert failed["error"] == "cannot pack" and failed["result"] is None
+    assert failed["context_tokens"] is None and "llm_ms" not in failed["timings"]
+
+
+def test_abatch_audit_packs_overlapping_chunks_once_per_item():
+    def chunk(text, digest):
+        return Document(page_content=text, metadata={"source": "a.pdf", "page": 1, "content_hash": digest})
+
+    def batch_retrieve(searches, documents=None):
+        # Fresh copies per item, as a search returns them; item 1 also got a repeat
+        return [
+            [chunk("budget table", "h1"), chunk("timeline", "h2"), chunk("budget table", "h1")],
+            [chunk("timeline", "h2"), chunk("risks", "h3")],
+        ]
+
+    packed = []
+
+    class RecordingPacker(ContextPacker):
+        def pack(self, docs):
+            packed.append(docs)
+            return super().pack(docs)
+
+    auditor = AuditorAgent(
+        llm=FakeListChatModel(responses=['{"answer": 1}']),
+        retriever=StubRetriever([]),
+        batch_retrieve=batch_retrieve,
+        packer=RecordingPacker(),
+    )
+
+    batch = asyncio.run(auditor.abatch_audit([("Budget", "x"), ("Risks", "x")]))
+
+    assert batch["unique_chunks"] == 3
+    assert [item["chunks"] for item in batch["items"]] == [2, 2]
+    by_text = {doc.page_content: doc for docs in packed for doc in docs}
+    # The chunk both items retrieved is one shared Document
+    assert sum(doc is by_text["timeline"] for docs in packed for doc in docs) == 2
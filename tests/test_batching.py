@@ -0,0 +1,56 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.batching import QueryBatcher
+
+
+class RecordingRetriever:
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+
+    def __call__(self, queries, **params):
+        self.release.wait(timeout=5)
+        self.calls.append((list(queries), params))
+        return [[f"{q}:{params.get('k')}"] for q in queries]
+
+
+def test_concurrent_queries_share_batches():
+    retriever = RecordingRetriever()
+    batcher = QueryBatcher(retriever, max_batch=8, window_ms=50)
+    queries = [f"q{i}" for i in range(6)]
+
+    with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+        futures = [pool.submit(batcher.retrieve, q, k=3) for q in queries]
+        retriever.release.set()
+        results = [f.result(timeout=5) for f in futures]
+
+    assert results == [[f"{q}:3"] for q in queries]
+    assert len(retriever.calls) < len(queries)
+    assert batcher.stats()["queries"] == len(queries)
+    batcher.close()
+
+
+def test_groups_by_params_and_dedups():
+    retriever = RecordingRetriever()
+    retriever.release.set()
+    batcher = QueryBatcher(retriever, max_batch=8, window_ms=50)
+
+    futures = [batcher.submit("a", k=1), batcher.submit("a", k=1), batcher.submit("b", k=2)]
+    assert [f.result(timeout=5) for f in futures] == [["a:1"], ["a:1"], ["b:2"]]
+    assert sorted(len(queries) for queries, _ in retriever.calls) == [1, 1]
+    batcher.close()
+
+
+def test_errors_reach_every_caller():
+    def failing(queries, **params):
+        raise RuntimeError("index unavailable")
+
+    batcher = QueryBatcher(failing, max_batch=4, window_ms=10)
+    futures = [batcher.submit("a"), batcher.submit("b")]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="index unavailable"):
+            future.result(timeout=5)
+    batcher.close()
@@ -0,0 +1,14 @@
+from benchmarks.run import compare, flatten
+
+
+def test_compare_flags_only_regressions_beyond_tolerance():
+    baseline = {"index": {"1000": {"retrieve_p99_ms": 10.0, "batch_retrieve_queries_per_s": 500.0, "chunks": 1000}}}
+    current = {"index": {"1000": {"retrieve_p99_ms": 11.0, "batch_retrieve_queries_per_s": 300.0, "chunks": 5000}}}
+    regressions = compare(baseline, current, tolerance=0.2)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("index.1000.batch_retrieve_queries_per_s")
+    assert compare(baseline, current, tolerance=0.5) == []
+
+
+def test_flatten_skips_non_numeric_values():
+    assert flatten({"a": {"b": 1, "c": "x", "d": True}}) == {"a.b": 1.0}
@@ -0,0 +1,61 @@
+import time
+from langchain_core.documents import Document
+
+from src.caches import AuditCaches, TTLCache
+
+
+def test_ttl_cache_expires_and_evicts_lru():
+    cache = TTLCache(max_entries=2, ttl_seconds=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("a") is None
+
+
+def test_ttl_cache_persists(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = TTLCache(persist_path=path)
+    cache.set("k", {"budget": 10})
+    cache.save()
+
+    assert TTLCache(persist_path=path).get("k") == {"budget": 10}
+
+
+def test_retrieval_cache_invalidated_on_index_change():
+    version = {"value": "1.0"}
+    caches = AuditCaches(TTLCache(), TTLCache(), index_version=lambda: version["value"])
+
+    key = caches.retrieval_key("budget", {"k": 10})
+    caches.set_docs(key, [Document(page_content="R$ 10", metadata={"page": 3})])
+    assert caches.get_docs(caches.retrieval_key("budget", {"k": 10}))[0].metadata == {"page": 3}
+
+    version["value"] = "2.0"
+    assert caches.get_docs(caches.retrieval_key("budget", {"k": 10})) is None
+    assert caches.retrieval.stats()["entries"] == 0
+
+
+def test_reader_cache_key_misses_after_the_writer_publishes(tmp_path, monkeypatch):
+    import src.embeddings as embeddings_module
+    from src.rag_engine import RAGEngine
+    from tests.test_rag_engine import FakeEmbeddings
+
+    monkeypatch.setattr(embeddings_module, "torch_embeddings", FakeEmbeddings)
+    path = str(tmp_path / "store")
+    writer = RAGEngine(embedding_model_name="fake", vector_store_path=path, query_batch_size=1)
+    writer.add_documents([Document(page_content="alpha", metadata={"source": "a.pdf", "page": 1})])
+    reader = RAGEngine(embedding_model_name="fake", vector_store_path=path, read_only=True, refresh_interval=0, query_batch_size=1)
+    reader.load_vector_store()
+    caches = AuditCaches(TTLCache(), TTLCache(), index_version=reader.current_version)
+
+    key = caches.retrieval_key("budget", {"k": 10})
+    caches.set_docs(key, [Document(page_content="alpha", metadata={"source": "a.pdf"})])
+    assert caches.get_docs(caches.retrieval_key("budget", {"k": 10})) is not None
+
+    # The reader never searches in between: only the cache lookup notices the new generation
+    writer.delete_source("a.pdf")
+    assert caches.get_docs(caches.retrieval_key("budget", {"k": 10})) is None
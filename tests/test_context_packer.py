@@ -0,0 +1,49 @@
+from langchain_core.documents import Document
+
+from src.context_packer import ContextPacker
+
+PAGE = " ".join(f"sentence {i} of the project plan." for i in range(60))
+
+
+def chunk(start: int, end: int, page: int = 1, source: str = "plan.pdf", with_offset: bool = True) -> Document:
+    metadata = {"source": source, "page": page}
+    if with_offset:
+        metadata["start_index"] = start
+    return Document(page_content=PAGE[start:end], metadata=metadata)
+
+
+def test_overlapping_chunks_of_a_page_are_merged():
+    packer = ContextPacker(max_tokens=10_000)
+    for with_offset in (True, False):
+        docs = [chunk(300, 700, with_offset=with_offset), chunk(0, 400, with_offset=with_offset)]
+        packed = packer.pack(docs)
+        assert packed.spans == 1
+        assert packed.text == f"[plan.pdf, p. 1]\n{PAGE[0:700]}"
+        assert packed.tokens_saved > 0
+
+
+def test_spans_are_ordered_by_page():
+    packer = ContextPacker(max_tokens=10_000)
+    docs = [chunk(0, 200, page=3), chunk(0, 200, page=1), chunk(500, 700, page=1)]
+    packed = packer.pack(docs)
+    assert packed.spans == 3
+    assert packed.text.index("p. 1]") < packed.text.index("p. 3]")
+    assert packed.text.index(PAGE[0:200]) < packed.text.index(PAGE[500:700])
+
+
+def test_budget_keeps_best_ranked_spans():
+    packer = ContextPacker(max_tokens=120, min_truncated_tokens=1_000)
+    docs = [chunk(0, 300, page=2), chunk(0, 300, page=1), chunk(0, 300, page=3)]
+    packed = packer.pack(docs)
+    assert packer.count_tokens(packed.text) <= 120
+    assert "p. 2]" in packed.text
+    assert packed.dropped_spans >= 1
+    assert "p. 3]" not in packed.text
+
+
+def test_last_span_is_truncated_to_fit():
+    packer = ContextPacker(max_tokens=150, min_truncated_tokens=10)
+    packed = packer.pack([chunk(0, 1000)])
+    assert packed.truncated
+    assert packed.tokens <= 150
+    assert packed.text.startswith("[plan.pdf, p. 1]")
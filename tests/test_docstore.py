@@ -0,0 +1,142 @@
+import faiss
+import numpy as np
+import pytest
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+import src.docstore as docstore_module
+from src.docstore import LayeredDocstore, LazyIdMap, MmapDocstore, doc_at, load_segment, save_segment
+from tests.test_rag_engine import FakeEmbeddings
+
+
+def _store(n=5):
+    docs = [
+        Document(page_content=f"chunk {i} — ação", metadata={"source": "a.pdf", "page": i + 1, "section_keys": ["orcamento"]})
+        for i in range(n)
+    ]
+    ids = [f"id-{i}" for i in range(n)]
+    vectors = np.asarray(FakeEmbeddings().embed_documents([d.page_content for d in docs]), dtype=np.float32)
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    return FAISS(
+        embedding_function=FakeEmbeddings(),
+        index=index,
+        docstore=InMemoryDocstore(dict(zip(ids, docs))),
+        index_to_docstore_id=dict(enumerate(ids))
+    )
+
+
+def test_save_and_load_round_trip_text_metadata_and_ids(tmp_path):
+    original = _store()
+    save_segment(original, str(tmp_path / "seg"))
+
+    loaded = load_segment(str(tmp_path / "seg"), FakeEmbeddings())
+
+    assert isinstance(loaded.docstore, LayeredDocstore)
+    assert dict(loaded.index_to_docstore_id) == original.index_to_docstore_id
+    for position in range(5):
+        assert doc_at(loaded, position) == doc_at(original, position)
+    assert loaded.docstore.search("id-3").metadata == {"source": "a.pdf", "page": 4, "section_keys": ["orcamento"]}
+    assert loaded.docstore.search("missing") == "ID missing not found."
+    assert np.array_equal(loaded.index.reconstruct_n(0, 5), original.index.reconstruct_n(0, 5))
+
+
+def test_only_the_records_a_search_returns_are_decoded(tmp_path, monkeypatch):
+    save_segment(_store(50), str(tmp_path / "seg"))
+    loaded = load_segment(str(tmp_path / "seg"), FakeEmbeddings())
+
+    decoded = []
+    get = MmapDocstore.get
+
+    def counting_get(self, position):
+        decoded.append(position)
+        return get(self, position)
+
+    monkeypatch.setattr(MmapDocstore, "get", counting_get)
+    query = np.asarray([FakeEmbeddings().embed_query("chunk 7 — ação")], dtype=np.float32)
+    _, found = loaded.index.search(query, 3)
+    docs = [doc_at(loaded, int(p)) for p in found[0]]
+
+    assert docs[0].page_content == "chunk 7 — ação"
+    assert sorted(decoded) == sorted(int(p) for p in found[0])
+    # Fetching by position never built the id -> position index
+    assert loaded.docstore.base._positions is None
+
+
+def test_read_only_load_maps_the_index_with_the_mmap_flags(tmp_path, monkeypatch):
+    save_segment(_store(), str(tmp_path / "seg"))
+    flags = []
+    read_index = faiss.read_index
+
+    def recording_read_index(path, io_flags=0):
+        flags.append(io_flags)
+        return read_index(path, io_flags)
+
+    monkeypatch.setattr(docstore_module.faiss, "read_index", recording_read_index)
+    load_segment(str(tmp_path / "seg"), FakeEmbeddings())
+    mapped = load_segment(str(tmp_path / "seg"), FakeEmbeddings(), read_only=True)
+
+    assert flags == [0, docstore_module.MMAP_FLAGS]
+    assert docstore_module.MMAP_FLAGS & faiss.IO_FLAG_MMAP and docstore_module.MMAP_FLAGS & faiss.IO_FLAG_READ_ONLY
+    _, found = mapped.index.search(np.asarray([FakeEmbeddings().embed_query("chunk 2 — ação")], dtype=np.float32), 1)
+    assert doc_at(mapped, int(found[0][0])).page_content == "chunk 2 — ação"
+
+
+def test_deletes_through_the_layered_docstore_mask_mapped_records(tmp_path):
+    save_segment(_store(), str(tmp_path / "seg"))
+    loaded = load_segment(str(tmp_path / "seg"), FakeEmbeddings())
+
+    del loaded.index_to_docstore_id[1]
+    loaded.docstore.delete(["id-1"])
+    loaded.docstore.add({"id-5": Document(page_content="appended")})
+    loaded.index_to_docstore_id[5] = "id-5"
+
+    assert 1 not in loaded.index_to_docstore_id
+    assert loaded.docstore.search("id-1") == "ID id-1 not found."
+    assert loaded.docstore.lookup(1, "id-1") == "ID id-1 not found."
+    assert list(loaded.index_to_docstore_id) == [0, 2, 3, 4, 5]
+    assert len(loaded.index_to_docstore_id) == 5
+    assert doc_at(loaded, 5).page_content == "appended"
+    with pytest.raises(KeyError):
+        del loaded.index_to_docstore_id[1]
+    # The file on disk is untouched: a fresh load still has the record
+    assert load_segment(str(tmp_path / "seg"), FakeEmbeddings()).docstore.search("id-1").page_content == "chunk 1 — ação"
+
+
+def test_lazy_id_map_over_an_id_log_only_covers_ids_logged_before_it():
+    ids = docstore_module.IdLog(["a", "b"])
+    view = LazyIdMap(ids)
+    ids.append("c")
+
+    assert dict(view) == {0: "a", 1: "b"}
+    assert 2 not in view and LazyIdMap(ids)[2] == "c"
+
+
+def test_reader_applies_tombstones_without_materializing_the_id_map(tmp_path, monkeypatch):
+    import src.embeddings as embeddings_module
+    from src.rag_engine import RAGEngine
+
+    monkeypatch.setattr(embeddings_module, "torch_embeddings", FakeEmbeddings)
+    path = str(tmp_path / "store")
+    writer = RAGEngine(embedding_model_name="fake", vector_store_path=path, query_batch_size=1)
+    writer.add_documents(
+        [Document(page_content=f"a {i}", metadata={"source": "a.pdf"}) for i in range(2)]
+        + [Document(page_content=f"b {i}", metadata={"source": "b.pdf"}) for i in range(5)]
+    )
+    writer.delete_source("a.pdf")
+
+    def walk(self):
+        raise AssertionError("walked every position of the id map")
+
+    monkeypatch.setattr(LazyIdMap, "__iter__", walk)
+    reader = RAGEngine(embedding_model_name="fake", vector_store_path=path, read_only=True, query_batch_size=1)
+    reader.load_vector_store()
+    (part,) = reader.snapshot.parts
+    id_map = part.index_to_docstore_id
+
+    assert isinstance(id_map, LazyIdMap)
+    assert id_map._overlay == {} and id_map._removed == {0, 1}
+    # No id -> position index was built over the mapped segment either
+    assert part.docstore.base._positions is None
+    assert reader.snapshot.size == 5
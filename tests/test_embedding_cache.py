@@ -0,0 +1,83 @@
+from src.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [[float(len(t)), 1.0, 0.0] for t in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0, 0.0]
+
+
+def test_repeated_chunks_hit_cache_across_instances(tmp_path):
+    model = CountingEmbeddings()
+    cache = EmbeddingCache(str(tmp_path), model_name="m", max_entries=10)
+    embeddings = CachedEmbeddings(model, cache)
+
+    first = embeddings.embed_documents(["header", "body", "header"])
+    assert model.calls == 2
+
+    reopened = CachedEmbeddings(model, EmbeddingCache(str(tmp_path), model_name="m", max_entries=10))
+    assert reopened.embed_documents(["header  ", "body"]) == [first[0], first[1]]
+    assert model.calls == 2
+    assert reopened.cache.stats()["hits"] == 2
+
+
+def test_lru_eviction(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), model_name="m", max_entries=2)
+    embeddings = CachedEmbeddings(CountingEmbeddings(), cache)
+
+    embeddings.embed_documents(["a", "b"])
+    embeddings.embed_documents(["a"])
+    embeddings.embed_documents(["c"])
+
+    assert cache.stats()["evictions"] == 1
+    assert cache.get_many([cache.key("b")]) == [None]
+    assert cache.get_many([cache.key("a")])[0] is not None
+
+
+def test_puts_append_to_journal_until_compaction(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), model_name="m", max_entries=100, compact_after=4)
+    embeddings = CachedEmbeddings(CountingEmbeddings(), cache)
+
+    embeddings.embed_documents(["a", "b"])
+    embeddings.embed_documents(["c"])
+    # Only the journal grew; the index still holds what the first allocation wrote
+    assert (tmp_path / "keys.bin").stat().st_size == 0
+    assert (tmp_path / "keys.log").stat().st_size == 3 * 20
+
+    reopened = EmbeddingCache(str(tmp_path), model_name="m", max_entries=100, compact_after=4)
+    assert all(v is not None for v in reopened.get_many([cache.key(t) for t in "abc"]))
+
+    embeddings.embed_documents(["d", "e"])
+    assert (tmp_path / "keys.log").stat().st_size == 0
+    assert (tmp_path / "keys.bin").stat().st_size == 5 * 20
+
+
+def test_evictions_survive_journal_replay(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), model_name="m", max_entries=2)
+    embeddings = CachedEmbeddings(CountingEmbeddings(), cache)
+    embeddings.embed_documents(["a", "b"])
+    embeddings.embed_documents(["ccc"])
+
+    reopened = EmbeddingCache(str(tmp_path), model_name="m", max_entries=2)
+    assert reopened.stats()["entries"] == 2
+    assert reopened.get_many([cache.key("a")]) == [None]
+    assert reopened.get_many([cache.key("ccc")])[0][0] == 3.0
+
+
+def test_save_persists_recency(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), model_name="m", max_entries=2)
+    embeddings = CachedEmbeddings(CountingEmbeddings(), cache)
+    embeddings.embed_documents(["a", "b"])
+    embeddings.embed_documents(["a"])
+    cache.save()
+
+    reopened = CachedEmbeddings(CountingEmbeddings(), EmbeddingCache(str(tmp_path), model_name="m", max_entries=2))
+    reopened.embed_documents(["c"])
+    assert reopened.cache.get_many([cache.key("b")]) == [None]
+    assert reopened.cache.get_many([cache.key("a")])[0] is not None
@@ -0,0 +1,89 @@
+import threading
+
+import numpy as np
+import pytest
+
+from src.embeddings import EmbeddingParityError, LazyEmbeddings, OnnxEmbeddings, parity_check
+
+
+class CountingModel:
+    instances = 0
+
+    def __init__(self):
+        CountingModel.instances += 1
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [[float(len(t))] for t in texts]
+
+    def embed_query(self, text):
+        return [float(len(text))]
+
+
+def test_model_loads_on_first_use_only_once():
+    CountingModel.instances = 0
+    lazy = LazyEmbeddings(CountingModel, name="counting")
+    assert not lazy.loaded and CountingModel.instances == 0
+
+    threads = [threading.Thread(target=lazy.embed_query, args=("abc",)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert lazy.loaded and CountingModel.instances == 1
+    assert lazy.load_seconds is not None
+    assert lazy.embed_documents(["a", "bb"]) == [[1.0], [2.0]]
+    # Attributes of the underlying model are reachable through the wrapper
+    assert lazy.calls == 2
+
+
+class WhitespaceTokenizer:
+    pad_token_id = 0
+
+    def __call__(self, texts, truncation=True, max_length=256):
+        ids = [[len(word) for word in text.split()][:max_length] for text in texts]
+        return {"input_ids": ids, "attention_mask": [[1] * len(i) for i in ids]}
+
+
+class RecordingSession:
+    """Returns each token id as its hidden state, so mean pooling gives the mean word length."""
+
+    def __init__(self):
+        self.widths = []
+
+    def run(self, outputs, feed):
+        self.widths.append(feed["input_ids"].shape[1])
+        return [feed["input_ids"][:, :, None].astype(np.float32).repeat(2, axis=2)]
+
+
+def test_onnx_backend_batches_by_length_and_keeps_order():
+    model = OnnxEmbeddings.__new__(OnnxEmbeddings)
+    model.tokenizer, model.session = WhitespaceTokenizer(), RecordingSession()
+    model.input_names, model.batch_size, model.max_length, model.normalize = ["input_ids", "attention_mask"], 2, 256, False
+
+    texts = ["a", "bb bb bb bb bb", "ccc", "dddd dddd dddd"]
+    vectors = model.embed_documents(texts)
+
+    assert [v[0] for v in vectors] == [1.0, 2.0, 3.0, 4.0]
+    # Longest first: the 5- and 3-word texts share a batch, the 1-word ones another
+    assert model.session.widths == [5, 1]
+
+
+def test_parity_check():
+    class Scaled(CountingModel):
+        def embed_documents(self, texts):
+            return [[2 * len(t), 1.0] for t in texts]
+
+    class Reference(CountingModel):
+        def embed_documents(self, texts):
+            return [[len(t), 0.5] for t in texts]
+
+    class Drifted(CountingModel):
+        def embed_documents(self, texts):
+            return [[0.5, len(t)] for t in texts]
+
+    assert parity_check(Scaled(), Reference(), min_cosine=0.999)["min_cosine"] > 0.9999
+    with pytest.raises(EmbeddingParityError):
+        parity_check(Drifted(), Reference(), min_cosine=0.999, texts=["a", "bb"])
@@ -0,0 +1,68 @@
+import faiss
+import numpy as np
+import pytest
+
+from src.index_factory import IndexSpec, build_index, index_kind, prepare_index, search_params
+
+
+@pytest.fixture(scope="module")
+def vectors():
+    return np.random.default_rng(0).standard_normal((1000, 16)).astype(np.float32)
+
+
+SPECS = {
+    "flat": IndexSpec(index_type="flat"),
+    "ivf_flat": IndexSpec(index_type="ivf_flat", nlist=8, nprobe=2),
+    "ivf_pq": IndexSpec(index_type="ivf_pq", nlist=8, pq_m=4, nprobe=2),
+    "hnsw": IndexSpec(index_type="hnsw", hnsw_m=8, ef_construction=40, ef_search=16),
+}
+
+
+@pytest.mark.parametrize("index_type", list(SPECS))
+def test_build_index_trains_each_type_and_finds_the_vectors(vectors, index_type):
+    index = build_index(SPECS[index_type], vectors)
+
+    assert index_kind(index) == index_type
+    assert index.ntotal == len(vectors)
+    # Every vector is its own nearest neighbour (approximately, for PQ codes)
+    _, found = index.search(vectors[:50], 5, params=search_params(index, nprobe=8, ef_search=64))
+    assert np.mean([i in row for i, row in enumerate(found)]) >= 0.9
+
+
+def test_too_few_vectors_fall_back_to_simpler_types(vectors):
+    assert index_kind(build_index(SPECS["ivf_pq"], vectors[:200])) == "ivf_flat"
+    assert index_kind(build_index(SPECS["ivf_flat"], vectors[:50])) == "flat"
+
+
+def test_prepare_index_enables_reconstruct_on_ivf_indexes(vectors):
+    # As written by an older FAISS build or another tool: no direct map
+    index = faiss.IndexIVFFlat(faiss.IndexFlatL2(16), 16, 8)
+    index.train(vectors)
+    index.add(vectors)
+    assert index.direct_map.type == faiss.DirectMap.NoMap
+
+    prepare_index(index, IndexSpec(index_type="ivf_flat", nprobe=5))
+
+    assert index.nprobe == 5
+    assert np.allclose(index.reconstruct(7), vectors[7])
+
+
+def test_search_params_override_the_index_defaults_per_query(vectors):
+    ivf = build_index(SPECS["ivf_flat"], vectors)
+    hnsw = build_index(SPECS["hnsw"], vectors)
+
+    assert search_params(ivf, nprobe=8).nprobe == 8
+    assert search_params(hnsw, ef_search=128).efSearch == 128
+    # Knobs of the other index type, and no knobs, leave the defaults alone
+    assert search_params(ivf, ef_search=128) is None
+    assert search_params(hnsw, nprobe=8) is None
+    assert search_params(build_index(SPECS["flat"], vectors)) is None
+
+    # Searching every list is exact, whatever the index's own nprobe
+    queries = vectors[:20] + 0.1
+    flat = faiss.IndexFlatL2(16)
+    flat.add(vectors)
+    _, exact = flat.search(queries, 10)
+    _, found = ivf.search(queries, 10, params=search_params(ivf, nprobe=8))
+    assert (found == exact).all()
+    assert ivf.nprobe == 2
@@ -0,0 +1,87 @@
+import json
+
+import pytest
+from langchain_core.documents import Document
+
+import src.embeddings as embeddings_module
+import src.index_tools as index_tools
+from src.index_factory import IndexSpec
+from src.rag_engine import RAGEngine
+from src.shards import build_engine
+from tests.test_rag_engine import FakeEmbeddings
+
+
+def _docs(n):
+    return [Document(page_content=f"chunk {i}", metadata={"source": "a.pdf", "page": i // 10 + 1}) for i in range(n)]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(embeddings_module, "torch_embeddings", FakeEmbeddings)
+    path = str(tmp_path / "store")
+    RAGEngine(embedding_model_name="fake", vector_store_path=path).add_documents(_docs(400))
+    return path
+
+
+def test_measure_recall_compares_each_setting_with_exact_search(store):
+    engine = RAGEngine(embedding_model_name="fake", vector_store_path=store, index_spec=IndexSpec(index_type="ivf_flat", nlist=8))
+    engine.rebuild_index()
+
+    report = index_tools.measure_recall(engine, k=5, num_queries=50, nprobes=[1, 8])
+
+    assert (report["index_type"], report["parts"], report["chunks"], report["queries"], report["k"]) == ("ivf_flat", 1, 400, 50, 5)
+    assert [run["nprobe"] for run in report["runs"]] == [1, 8]
+    # Probing every list is exact
+    assert report["runs"][1]["recall@5"] == 1.0
+    assert report["runs"][0]["recall@5"] <= 1.0
+    assert all(run["ms_per_query"] >= 0 for run in report["runs"])
+
+
+def test_measure_recall_covers_segments_added_since_compaction(store):
+    engine = RAGEngine(embedding_model_name="fake", vector_store_path=store)
+    engine.add_documents([Document(page_content=f"later {i}", metadata={"source": "b.pdf"}) for i in range(50)])
+
+    report = index_tools.measure_recall(engine, k=5, num_queries=450)
+
+    assert (report["parts"], report["chunks"], report["queries"]) == (2, 450, 450)
+    # Flat parts merged by distance are exact, later segment included
+    assert report["runs"][0]["recall@5"] == 1.0
+
+
+def test_stores_without_live_chunks_are_skipped(store, monkeypatch, capsys):
+    engine = RAGEngine(embedding_model_name="fake", vector_store_path=store)
+    engine.load_vector_store()
+    engine.delete_source("a.pdf")
+    assert index_tools.measure_recall(engine) is None
+
+    monkeypatch.setattr(index_tools, "build_engine", lambda settings: engine)
+    index_tools.main(["build"])
+    assert json.loads(capsys.readouterr().out)["stores"] == 0
+    index_tools.main(["recall"])
+    assert json.loads(capsys.readouterr().out) == {"stores": []}
+
+
+@pytest.mark.parametrize("sharding", ["none", "source"])
+def test_cli_builds_the_configured_index_type_then_reports_recall(tmp_path, monkeypatch, capsys, sharding):
+    monkeypatch.setattr(embeddings_module, "torch_embeddings", FakeEmbeddings)
+    for name, value in {
+        "VECTOR_DB_PATH": str(tmp_path / "store"), "EMBEDDING_CACHE_DIR": "", "INDEX_SHARDING": sharding,
+        "FAISS_INDEX_TYPE": "ivf_flat", "FAISS_NLIST": 4,
+    }.items():
+        monkeypatch.setattr(index_tools.settings, name, value)
+    docs = _docs(400)
+    for doc in docs[200:]:
+        doc.metadata["source"] = "b.pdf"
+    build_engine(index_tools.settings).add_documents(docs)
+
+    index_tools.main(["build"])
+    stores = 1 if sharding == "none" else 2
+    assert json.loads(capsys.readouterr().out) == {"index_type": "ivf_flat", "stores": stores, "chunks": 400, "built": {"ivf_flat": stores}}
+
+    index_tools.main(["recall", "--k", "5", "--queries", "20", "--nprobe", "1", "4"])
+    reports = json.loads(capsys.readouterr().out)["stores"]
+    assert [report["source"] for report in reports] == ([None] if sharding == "none" else ["a.pdf", "b.pdf"])
+    for report in reports:
+        assert report["index_type"] == "ivf_flat"
+        assert [run["nprobe"] for run in report["runs"]] == [1, 4]
+        assert report["runs"][1]["recall@5"] == 1.0
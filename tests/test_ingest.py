@@ -1,30 +1,63 @@
 import pytest
-from src.ingest import PDFLoader
 
-def test_pdf_loader_valid_file():
-    loader = PDFLoader("path/to/valid_file.pdf")
-    content = loader.load()
-    assert content is not None
-    assert isinstance(content, str)
-    assert len(content) > 0
+from benchmarks.synthetic import write_pdf
+from src.ingest import IngestionEngine, _worker_context
 
-def test_pdf_loader_invalid_file():
-    loader = PDFLoader("path/to/invalid_file.pdf")
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    return write_pdf(str(tmp_path / "plan.pdf"), pages=6)
+
+
+def test_load_pdf_valid_file(pdf_path):
+    pages = IngestionEngine(max_workers=1).load_pdf(pdf_path)
+    assert len(pages) == 6
+    assert all(page.page_content for page in pages)
+    assert [page.metadata["page"] for page in pages] == [1, 2, 3, 4, 5, 6]
+    assert pages[0].metadata == {"source": pdf_path, "page": 1, "total_pages": 6, "extractor": "pypdfium2"}
+
+
+def test_load_pdf_invalid_file(tmp_path):
     with pytest.raises(FileNotFoundError):
-        loader.load()
-
-def test_semantic_chunking():
-    loader = PDFLoader("path/to/valid_file.pdf")
-    content = loader.load()
-    chunks = loader.semantic_chunk(content)
-    assert len(chunks) > 0
-    assert all(isinstance(chunk, str) for chunk in chunks)
-    # Add more specific assertions based on expected chunk content
-
-def test_chunking_for_technical_sections():
-    loader = PDFLoader("path/to/valid_file.pdf")
-    content = loader.load()
-    chunks = loader.semantic_chunk(content)
-    # Assuming we expect certain sections to be present
-    assert any("Metodologia" in chunk for chunk in chunks)
-    assert any("Objetivos" in chunk for chunk in chunks)
\ No newline at end of file
+        IngestionEngine().load_pdf(str(tmp_path / "missing.pdf"))
+
+
+def test_blank_pages_are_skipped_and_tables_use_pdfplumber(tmp_path):
+    path = write_pdf(str(tmp_path / "budget.pdf"), pages=5, blank_pages=[1], table_pages=[3])
+    pages = IngestionEngine(max_workers=1).load_pdf(path)
+    assert [page.metadata["page"] for page in pages] == [1, 3, 4, 5]
+    assert {page.metadata["page"]: page.metadata["extractor"] for page in pages}[4] == "pdfplumber"
+    assert "Item Quantidade Valor unitario Total" in pages[2].page_content
+
+
+def test_backends_extract_the_same_prose(pdf_path):
+    fast = IngestionEngine(max_workers=1, extraction_backend="pypdfium2").load_pdf(pdf_path)
+    layout = IngestionEngine(max_workers=1, extraction_backend="pdfplumber").load_pdf(pdf_path)
+    assert [" ".join(d.page_content.split()) for d in fast] == [" ".join(d.page_content.split()) for d in layout]
+    assert {d.metadata["extractor"] for d in layout} == {"pdfplumber"}
+
+
+def test_parallel_extraction_matches_serial(pdf_path):
+    serial = IngestionEngine(max_workers=1).load_pdf(pdf_path)
+    parallel = IngestionEngine(max_workers=2, parallel_min_pages=1).load_pdf(pdf_path)
+    assert [d.page_content for d in parallel] == [d.page_content for d in serial]
+
+
+def test_extraction_workers_are_not_forked():
+    # Ingestion runs next to other threads; forking would copy their held locks
+    assert _worker_context().get_start_method() in ("forkserver", "spawn")
+
+
+def test_chunking(pdf_path):
+    ingestor = IngestionEngine(chunk_size=300, chunk_overlap=50, max_workers=1)
+    chunks = ingestor.process_file(pdf_path)
+    assert len(chunks) > 6
+    assert all(len(chunk.page_content) <= 300 for chunk in chunks)
+    assert all("start_index" in chunk.metadata for chunk in chunks)
+    assert list(ingestor.iter_chunks(pdf_path))[0].page_content == chunks[0].page_content
+
+
+def test_chunking_keeps_technical_sections(pdf_path):
+    chunks = IngestionEngine(max_workers=1).process_file(pdf_path)
+    assert any("Metodologia" in chunk.page_content for chunk in chunks)
+    assert any("Objetivos" in chunk.page_content for chunk in chunks)
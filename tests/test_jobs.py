@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+from src.jobs import JobManager, QueueFull
+
+
+def _wait(job, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not job.done and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+def test_job_goes_from_queued_to_running_to_succeeded():
+    manager = JobManager(max_concurrent=1)
+    started, release = threading.Event(), threading.Event()
+
+    def work(job):
+        started.set()
+        job.pages_processed = 3
+        job.chunks_processed = 7
+        release.wait(5)
+        job.chunks_added = 7
+
+    blocker = manager.submit("first.pdf", lambda job: release.wait(5))
+    job = manager.submit("plan.pdf", work)
+    assert job.status == "queued"
+
+    release.set()
+    assert started.wait(5)
+    _wait(job)
+    assert _wait(blocker).status == "succeeded"
+    info = job.to_dict()
+    assert info["status"] == "succeeded"
+    assert (info["pages_processed"], info["chunks_processed"], info["chunks_added"]) == (3, 7, 7)
+    assert info["elapsed_seconds"] is not None and info["error"] is None
+    assert [j.id for j in manager.list_jobs()] == [job.id, blocker.id]
+
+
+def test_progress_is_visible_while_running():
+    manager = JobManager(max_concurrent=1)
+    halfway, release = threading.Event(), threading.Event()
+
+    def work(job):
+        job.pages_processed = 5
+        halfway.set()
+        release.wait(5)
+
+    job = manager.submit("plan.pdf", work)
+    assert halfway.wait(5)
+    assert manager.get(job.id).to_dict()["status"] == "running"
+    assert manager.get(job.id).to_dict()["pages_processed"] == 5
+    release.set()
+    assert _wait(job).status == "succeeded"
+
+
+def test_failed_job_reports_its_error():
+    manager = JobManager()
+
+    def work(job):
+        raise ValueError("No text extracted from PDF")
+
+    job = _wait(manager.submit("scan.pdf", work))
+    assert job.status == "failed"
+    assert job.error == "No text extracted from PDF"
+    assert job.finished_at is not None
+
+
+def test_cancel_queued_and_running_jobs():
+    manager = JobManager(max_concurrent=1)
+    running, release = threading.Event(), threading.Event()
+
+    def work(job):
+        running.set()
+        while not release.is_set():
+            job.check_cancelled()
+            time.sleep(0.01)
+
+    first = manager.submit("a.pdf", work)
+    second = manager.submit("b.pdf", work)
+    assert running.wait(5)
+
+    assert manager.cancel(second.id).status == "cancelled"
+    manager.cancel(first.id)
+    assert _wait(first).status == "cancelled"
+    assert manager.cancel("missing") is None
+
+
+def test_queue_is_bounded():
+    manager = JobManager(max_concurrent=1, max_queued=1)
+    release = threading.Event()
+    manager.submit("a.pdf", lambda job: release.wait(5))
+    time.sleep(0.05)  # the first job leaves the queue
+    manager.submit("b.pdf", lambda job: None)
+    with pytest.raises(QueueFull):
+        manager.submit("c.pdf", lambda job: None)
+    release.set()
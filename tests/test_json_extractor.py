@@ -0,0 +1,76 @@
+import asyncio
+
+from src.auditor import AuditorAgent, JSONStreamExtractor, clean_json_output
+
+
+class Chunk:
+    def __init__(self, content):
+        self.content = content
+
+
+class StreamingLLM:
+    """Streams its reply token by token and records how much of it was generated."""
+
+    def __init__(self, reply: str, size: int = 3):
+        self.tokens = [reply[i:i + size] for i in range(0, len(reply), size)]
+        self.generated = 0
+
+    def stream(self, prompt_value):
+        for token in self.tokens:
+            self.generated += 1
+            yield Chunk(token)
+
+    async def astream(self, prompt_value):
+        for token in self.tokens:
+            self.generated += 1
+            yield Chunk(token)
+
+
+class Retriever:
+    search_kwargs = {}
+
+    def invoke(self, search):
+        return []
+
+    def batch(self, searches):
+        return [[] for _ in searches]
+
+
+REPLY = 'Sure! ```json\n{"budget": "10 {k}", "note": "a \\"quoted\\" }", "items": [{"a": 1}]}\n``` Let me also explain at length ' + "blah " * 200
+
+
+def test_extractor_ignores_braces_in_strings_across_chunks():
+    extractor = JSONStreamExtractor()
+    fed = "".join(extractor.feed(REPLY[i:i + 2]) for i in range(0, len(REPLY), 2))
+    assert extractor.done
+    assert extractor.value == {"budget": "10 {k}", "note": 'a "quoted" }', "items": [{"a": 1}]}
+    assert fed.endswith('[{"a": 1}]}')
+    assert extractor.feed("more") == ""
+
+
+def test_extractor_skips_braces_in_prose():
+    extractor = JSONStreamExtractor()
+    extractor.feed('Using {the template} here: {"score": 3}')
+    assert extractor.value == {"score": 3}
+
+
+def test_clean_json_output_falls_back_to_text():
+    assert clean_json_output("```json\nno json here```") == {"analysis_result": "no json here"}
+    assert clean_json_output(Chunk('{"a": {"b": "}"}} trailing')) == {"a": {"b": "}"}}
+
+
+def test_generation_stops_once_the_object_closes():
+    llm = StreamingLLM(REPLY)
+    agent = AuditorAgent(llm=llm, retriever=Retriever())
+    assert clean_json_output(agent._call_llm(None))["items"] == [{"a": 1}]
+    assert llm.generated < len(llm.tokens) // 4
+
+    llm.generated = 0
+    events = asyncio.run(_collect(agent.astream_audit("budget?", "Extract the budget")))
+    assert events[-1] == {"event": "result", "data": {"budget": "10 {k}", "note": 'a "quoted" }', "items": [{"a": 1}]}}
+    assert "".join(e["data"]["delta"] for e in events if e["event"] == "token").endswith("]}")
+    assert llm.generated < len(llm.tokens) // 4
+
+
+async def _collect(events):
+    return [event async for event in events]
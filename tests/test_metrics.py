@@ -0,0 +1,61 @@
+import asyncio
+import contextvars
+import time
+
+from src import metrics
+
+
+def _stage_count(stage: str) -> float:
+    return metrics.REGISTRY.get_sample_value("rag_stage_seconds_count", {"stage": stage}) or 0.0
+
+
+def test_spans_are_recorded_in_histograms_and_the_current_trace():
+    before = _stage_count("test_stage")
+    with metrics.trace("test") as trace:
+        with metrics.span("test_stage"):
+            pass
+        # Threads started with a copy of the context report into the same trace
+        contextvars.copy_context().run(lambda: metrics.observe("test_thread", 0.01))
+    with metrics.span("test_stage"):
+        pass
+
+    assert _stage_count("test_stage") == before + 2
+    assert [stage for stage, _ in trace.spans] == ["test_stage", "test_thread"]
+
+
+def test_concurrent_tasks_keep_separate_traces():
+    async def request(name: str):
+        with metrics.trace("test") as trace:
+            await asyncio.sleep(0)
+            metrics.observe(name, 0.001)
+        return trace
+
+    async def main():
+        return await asyncio.gather(request("a"), request("b"))
+
+    first, second = asyncio.run(main())
+    assert [stage for stage, _ in first.spans] == ["a"]
+    assert [stage for stage, _ in second.spans] == ["b"]
+
+
+def test_slow_requests_are_sampled_with_stage_breakdown():
+    metrics.configure(slow_request_ms=5, slow_sample_size=2)
+    try:
+        for _ in range(3):
+            with metrics.trace("test", file="plan.pdf"):
+                with metrics.span("slow_stage"):
+                    time.sleep(0.01)
+        with metrics.trace("test"):
+            pass
+        samples = metrics.slow_requests()
+        assert len(samples) == 2
+        assert samples[0]["file"] == "plan.pdf"
+        assert samples[0]["stages_ms"]["slow_stage"] >= 10
+    finally:
+        metrics.configure()
+
+
+def test_render_exposes_prometheus_text():
+    body, content_type = metrics.render()
+    assert content_type.startswith("text/plain")
+    assert b"rag_stage_seconds_bucket" in body
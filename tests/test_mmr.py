@@ -0,0 +1,29 @@
+import numpy as np
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+
+from src.mmr import metadata_filter, mmr
+
+
+def test_mmr_matches_langchain_selection():
+    rng = np.random.default_rng(0)
+    candidates = rng.normal(size=(200, 32)).astype(np.float32)
+    query = rng.normal(size=32).astype(np.float32)
+    unit = candidates / np.linalg.norm(candidates, axis=1, keepdims=True)
+
+    for lambda_mult in (0.3, 0.7, 1.0):
+        expected = maximal_marginal_relevance(query[None, :], list(candidates), k=15, lambda_mult=lambda_mult)
+        assert mmr(query, unit, k=15, lambda_mult=lambda_mult) == expected
+
+
+def test_mmr_handles_short_candidate_lists():
+    unit = np.eye(3, dtype=np.float32)
+    assert sorted(mmr(np.ones(3, dtype=np.float32), unit, k=10)) == [0, 1, 2]
+    assert mmr(np.ones(3, dtype=np.float32), unit[:0], k=5) == []
+
+
+def test_metadata_filter():
+    accept = metadata_filter({"source": ["a.pdf", "b.pdf"], "page": 3})
+    assert accept({"source": "a.pdf", "page": 3})
+    assert not accept({"source": "c.pdf", "page": 3})
+    assert not accept({"source": "b.pdf", "page": 4})
+    assert metadata_filter(lambda m: m.get("page", 0) > 2)({"page": 5})
@@ -0,0 +1,208 @@
+import hashlib
+import time
+import os
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+import src.embeddings as embeddings_module
+import src.rag_engine as rag_engine_module
+from src.rag_engine import RAGEngine
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic embeddings derived from a hash of the text."""
+
+    def __init__(self, *args, **kwargs):
+        self.calls = 0
+
+    def _embed(self, text: str):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [b / 255.0 for b in digest[:16]]
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(embeddings_module, "torch_embeddings", FakeEmbeddings)
+    return RAGEngine(embedding_model_name="fake", vector_store_path=str(tmp_path / "store"))
+
+
+def _docs(source, texts):
+    return [Document(page_content=t, metadata={"source": source, "page": i + 1}) for i, t in enumerate(texts)]
+
+
+def test_add_documents_appends_and_dedups(engine):
+    assert engine.add_documents(_docs("a.pdf", ["alpha", "beta"])) == 2
+    assert engine.add_documents(_docs("a.pdf", ["beta ", "gamma"])) == 1
+    assert engine.snapshot.size == 3
+    assert engine.embeddings.calls == 3
+
+
+def test_chunk_shared_by_two_sources_survives_deleting_one(engine):
+    engine.add_documents(_docs("a.pdf", ["shared clause", "alpha"]))
+    assert engine.add_documents(_docs("b.pdf", ["shared clause", "beta"])) == 2
+
+    engine.delete_source("a.pdf")
+    assert engine.sources() == {"b.pdf": 2}
+    found = engine.batch_retrieve(["shared clause"], k=2, fetch_k=2, documents=["b.pdf"])[0]
+    assert [doc.page_content for doc in found][:1] == ["shared clause"]
+    assert {doc.metadata["source"] for doc in found} == {"b.pdf"}
+
+
+def test_manifest_hashes_of_older_stores_are_filed_per_source():
+    manifest = {"hashes": {"h1": "id1", "h2": "id2"}, "sources": {"a.pdf": ["id1"], "b.pdf": ["id2"]}}
+    assert RAGEngine._scope_hashes(manifest)["hashes"] == {"a.pdf": {"h1": "id1"}, "b.pdf": {"h2": "id2"}}
+
+
+def test_delete_source_survives_reload(engine):
+    engine.add_documents(_docs("a.pdf", ["alpha", "beta"]))
+    engine.add_documents(_docs("b.pdf", ["gamma"]))
+
+    assert engine.delete_source("a.pdf") == 2
+
+    reloaded = RAGEngine(embedding_model_name="fake", vector_store_path=engine.vector_store_path)
+    reloaded.load_vector_store()
+    sources = {
+        reloaded.vector_store.docstore.search(i).metadata["source"]
+        for i in reloaded.vector_store.index_to_docstore_id.values()
+    }
+    assert sources == {"b.pdf"}
+
+
+def test_reader_follows_published_versions(engine):
+    engine.add_documents(_docs("a.pdf", ["alpha", "beta"]))
+
+    reader = RAGEngine(embedding_model_name="fake", vector_store_path=engine.vector_store_path, read_only=True)
+    reader.load_vector_store()
+    assert reader.index_version == engine.index_version
+    assert reader.refresh() is False
+
+    engine.add_documents(_docs("b.pdf", ["gamma"]))
+    assert reader.refresh() is True
+    assert reader.index_version == engine.index_version
+
+    found = {d.page_content for d in reader.batch_retrieve(["gamma"], k=3, fetch_k=3)[0]}
+    assert found == {"alpha", "beta", "gamma"}
+
+    with pytest.raises(rag_engine_module.ReadOnlyIndexError):
+        reader.delete_source("a.pdf")
+
+
+def test_publish_keeps_old_snapshot_and_collects_generations(engine):
+    engine.gc_grace_seconds = 0
+    engine.keep_generations = 1
+    engine.add_documents(_docs("a.pdf", ["alpha", "beta"]))
+    before = engine.snapshot
+
+    engine.add_documents(_docs("b.pdf", ["gamma"]))
+    # A query holding the old snapshot keeps searching exactly what it started with
+    assert before.size == 2
+    assert engine.snapshot.size == 3
+    assert before.version != engine.index_version
+
+    engine.delete_source("a.pdf")  # compacts: tombstones outnumber live chunks
+    store = engine.vector_store_path
+    with open(os.path.join(store, rag_engine_module.CURRENT_NAME)) as f:
+        current = f.read()
+    assert os.listdir(os.path.join(store, rag_engine_module.GENERATIONS_DIR)) == [current]
+    assert len(os.listdir(os.path.join(store, rag_engine_module.SEGMENTS_DIR))) == 1
+
+    reloaded = RAGEngine(embedding_model_name="fake", vector_store_path=store)
+    reloaded.load_vector_store()
+    assert reloaded.snapshot.size == 1
+
+
+def test_section_index_survives_reload_and_deletes(engine):
+    docs = _docs("a.pdf", ["budget table", "timeline", "budget notes"])
+    docs[0].metadata["section_keys"] = docs[2].metadata["section_keys"] = ["orcamento"]
+    docs[1].metadata["section_keys"] = ["cronograma"]
+    engine.add_documents(docs)
+    engine.add_documents([Document(page_content="other budget", metadata={"source": "b.pdf", "page": 1, "section_keys": ["orcamento"]})])
+    engine.delete_source("b.pdf")
+
+    reloaded = RAGEngine(embedding_model_name="fake", vector_store_path=engine.vector_store_path)
+    calls = reloaded.embeddings.calls
+    found = reloaded.section_retrieve("how much does it cost?", ["orcamento"], k=5)
+    assert [d.page_content for d in found] == ["budget table", "budget notes"]
+    # Few enough to return them all: the query is not even embedded
+    assert reloaded.embeddings.calls == calls
+    assert len(reloaded.section_retrieve("cost", ["orcamento"], k=1)) == 1
+    assert reloaded.section_retrieve("risks", ["riscos"]) == []
+
+
+def test_add_document_stream_reports_progress_per_batch(engine):
+    progress = []
+    added = engine.add_document_stream(iter(_docs("a.pdf", ["a", "b", "c", "d", "e"])), batch_size=2, on_batch=progress.append)
+
+    assert added == 5
+    assert progress == [2, 4, 5]
+    reloaded = RAGEngine(embedding_model_name="fake", vector_store_path=engine.vector_store_path)
+    reloaded.load_vector_store()
+    assert reloaded.snapshot.size == 5
+
+
+def test_failed_stream_keeps_finished_batches_and_stops_prefetch(engine, monkeypatch):
+    from src.utils import prefetch
+
+    closed = []
+
+    def chunks():
+        try:
+            yield from _docs("a.pdf", [f"chunk {i}" for i in range(100)])
+        finally:
+            closed.append(True)
+
+    embed = engine.embeddings.embed_documents
+    batches = []
+
+    def failing_embed(texts):
+        batches.append(texts)
+        if len(batches) == 2:
+            raise RuntimeError("embedding failed")
+        return embed(texts)
+
+    monkeypatch.setattr(engine.embeddings, "embed_documents", failing_embed)
+    with pytest.raises(RuntimeError, match="embedding failed"):
+        engine.add_document_stream(prefetch(chunks(), max_items=4), batch_size=3)
+
+    # The producer thread noticed and closed the source instead of blocking on the full buffer
+    deadline = time.monotonic() + 2
+    while not closed and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert closed
+
+    reloaded = RAGEngine(embedding_model_name="fake", vector_store_path=engine.vector_store_path)
+    reloaded.load_vector_store()
+    assert reloaded.snapshot.size == 3
+    # The engine is usable again
+    monkeypatch.setattr(engine.embeddings, "embed_documents", embed)
+    assert engine.add_documents(_docs("b.pdf", ["more"])) == 1
+
+
+def test_stream_publishes_one_part_and_serves_the_saved_segment(engine):
+    from src.docstore import LayeredDocstore
+
+    snapshots = []
+    texts = [f"chunk {i}" for i in range(640)]
+    added = engine.add_document_stream(iter(_docs("a.pdf", texts)), batch_size=16, on_batch=lambda _: snapshots.append(engine.snapshot))
+
+    assert added == 640
+    # One part per stream, however many batches went in
+    assert [(len(s.parts), s.size) for s in snapshots] == [(1, 16 * (i + 1)) for i in range(40)]
+    # An early snapshot still maps exactly what it held, although the index grew (and was copied) since
+    assert snapshots[1].size == 32
+    assert snapshots[1].parts[0].index is not snapshots[-1].parts[0].index
+
+    # After the commit, the part is the segment loaded back from disk
+    parts = engine.snapshot.parts
+    assert len(parts) == 1 and isinstance(parts[0].docstore, LayeredDocstore)
+    assert engine.snapshot.size == 640
+    found = engine.batch_retrieve(["chunk 600"], k=5, fetch_k=20)[0]
+    assert found[0].page_content == "chunk 600"
@@ -0,0 +1,53 @@
+import asyncio
+import json
+
+from src.auditor import DEFAULT_SYSTEM_PROMPT
+from src.sagemaker_entry import input_fn, output_fn, predict_fn
+
+
+class FakeAuditor:
+    """Answers every item with its query, failing those that ask for it."""
+
+    def __init__(self):
+        self.batches = []
+
+    async def abatch_audit(self, items, tags=None, documents=None):
+        self.batches.append((items, tags, documents))
+        return {"items": [
+            {"query": query, "result": None, "error": "LLM failed"} if "fail" in query else
+            {"query": query, "result": {"answer": query}, "error": None}
+            for query, _ in items
+        ]}
+
+
+def _model():
+    return {"auditor": FakeAuditor(), "loop": asyncio.new_event_loop()}
+
+
+def test_jsonlines_batch_reports_errors_per_record():
+    body = "\n".join([
+        json.dumps({"id": 1, "query": "budget?", "documents": ["a.pdf"], "tag": "Budget"}),
+        "{not json",
+        json.dumps({"id": 3, "query": "please fail", "system_prompt": "Be brief."}),
+        json.dumps({"id": 4, "documents": "a.pdf"}),
+    ]).encode("utf-8")
+    model = _model()
+
+    results = predict_fn(input_fn(body, "application/jsonlines"), model)
+
+    assert [r["id"] for r in results] == [1, None, 3, 4]
+    assert results[0]["result"] == {"answer": "budget?"}
+    assert results[1]["error"].startswith("Invalid JSON")
+    assert results[2]["error"] == "LLM failed"
+    assert "query" in results[3]["error"]
+    # The valid records went through as one batch
+    [(items, tags, documents)] = model["auditor"].batches
+    assert items == [("budget?", DEFAULT_SYSTEM_PROMPT), ("please fail", "Be brief.")]
+    assert tags == ["Budget", None]
+    assert documents == [["a.pdf"], None]
+
+
+def test_jsonlines_output_has_one_line_per_record():
+    output = output_fn([{"id": 1, "result": {"a": 1}}, {"id": 2, "error": "x"}], "application/jsonlines")
+    assert [json.loads(line)["id"] for line in output.splitlines()] == [1, 2]
+    assert output.endswith("\n")
@@ -0,0 +1,63 @@
+from langchain_core.documents import Document
+
+from benchmarks.synthetic import write_pdf
+from src.ingest import IngestionEngine
+from src.sections import SectionTracker, find_headings, section_key, sections_for_tag
+from src.utils import extract_sections
+
+PAGE_1 = """Projeto de Pesquisa
+1. Objetivos
+Desenvolver um sensor de baixo custo.
+1. Realizar ensaios de campo
+2. Metodologia
+2.1 Ensaios de Bancada
+Os ensaios seguem a norma vigente."""
+
+PAGE_2 = """Resultados dos ensaios em laboratorio.
+3. ORÇAMENTO DETALHADO
+Item Quantidade Valor
+Sensor 10 1.500,00"""
+
+
+def test_headings_and_section_keys():
+    headings = find_headings(PAGE_1)
+    assert [(h.level, h.title, h.key) for h in headings] == [
+        (1, "1. Objetivos", "objetivos"),
+        (1, "2. Metodologia", "metodologia"),
+        (2, "2.1 Ensaios de Bancada", None),
+    ]
+    assert PAGE_1[headings[1].offset:].startswith("2. Metodologia")
+    assert section_key("3. ORÇAMENTO DETALHADO") == "orcamento"
+    assert sections_for_tag("Budget") == ("orcamento",)
+    assert sections_for_tag(" cronograma: ") == ("cronograma",)
+    assert sections_for_tag("What is the budget of the project?") == ()
+
+
+def test_tracker_carries_sections_across_pages():
+    tracker = SectionTracker()
+    first = [
+        Document(page_content=PAGE_1[:60], metadata={"start_index": 0}),
+        Document(page_content=PAGE_1[PAGE_1.index("Os ensaios"):], metadata={"start_index": PAGE_1.index("Os ensaios")}),
+    ]
+    tracker.tag(PAGE_1, first)
+    second = [Document(page_content=PAGE_2, metadata={"start_index": 0})]
+    tracker.tag(PAGE_2, second)
+
+    assert first[0].metadata["section_keys"] == ["objetivos"]
+    assert first[1].metadata["section"] == "2. Metodologia > 2.1 Ensaios de Bancada"
+    # Starts in the methodology carried over from page 1 and holds the budget heading
+    assert second[0].metadata["section_keys"] == ["metodologia", "orcamento"]
+
+
+def test_ingest_tags_chunks(tmp_path):
+    path = write_pdf(str(tmp_path / "plan.pdf"), pages=3)
+    chunks = list(IngestionEngine(max_workers=1).iter_chunks(path))
+    assert chunks[0].metadata["section"] == "1. Objetivos"
+    assert {tuple(c.metadata["section_keys"]) for c in chunks if c.metadata["page"] == 2} == {("metodologia",)}
+
+
+def test_extract_sections_returns_section_text():
+    sections = extract_sections(PAGE_1 + "\n" + PAGE_2, ["Metodologia", "Orçamento"])
+    assert sections["Metodologia"].startswith("2.1 Ensaios de Bancada")
+    assert "Resultados dos ensaios" in sections["Metodologia"]
+    assert sections["Orçamento"].endswith("Sensor 10 1.500,00")
@@ -0,0 +1,143 @@
+import os
+import pytest
+from langchain_core.documents import Document
+
+import src.embeddings as embeddings_module
+from src.rag_engine import RAGEngine
+from src.shards import SHARDS_DIR, ShardedRAGEngine, shard_key
+from tests.test_rag_engine import FakeEmbeddings
+
+
+def _docs(source, texts):
+    return [Document(page_content=t, metadata={"source": source, "page": i + 1}) for i, t in enumerate(texts)]
+
+
+@pytest.fixture
+def make_engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(embeddings_module, "torch_embeddings", FakeEmbeddings)
+
+    def make(read_only=False, **kwargs):
+        root = RAGEngine(
+            embedding_model_name="fake", vector_store_path=str(tmp_path / "store"),
+            read_only=read_only, refresh_interval=0, query_batch_size=1
+        )
+        return ShardedRAGEngine(root, query_batch_size=1, **kwargs)
+
+    return make
+
+
+def test_every_source_gets_its_own_shard(make_engine):
+    engine = make_engine()
+    assert engine.add_documents(_docs("/in/a.pdf", ["alpha", "beta"]) + _docs("/in/b.pdf", ["gamma"])) == 3
+
+    assert engine.shards() == {"/in/a.pdf": shard_key("/in/a.pdf"), "/in/b.pdf": shard_key("/in/b.pdf")}
+    assert engine._shard(shard_key("/in/a.pdf")).sources() == {"/in/a.pdf": 2}
+    # One embedding model for all shards
+    assert engine._shard(shard_key("/in/b.pdf")).embeddings is engine.root.embeddings
+
+
+def test_scoped_search_only_opens_its_shards(make_engine):
+    make_engine().add_documents(_docs("/in/a.pdf", ["alpha", "beta"]) + _docs("/in/b.pdf", ["gamma", "delta"]))
+
+    engine = make_engine()
+    engine.load_vector_store()
+    results = engine.batch_retrieve(["alpha"], k=4, fetch_k=4, documents=["a.pdf"])
+
+    assert {doc.metadata["source"] for doc in results[0]} == {"/in/a.pdf"}
+    assert list(engine._loaded) == [shard_key("/in/a.pdf")]
+
+
+def test_unscoped_search_runs_mmr_over_every_shard(make_engine):
+    engine = make_engine()
+    engine.add_documents(_docs("a.pdf", ["alpha", "beta"]) + _docs("b.pdf", ["gamma", "delta"]))
+
+    hits = engine.batch_retrieve_with_scores(["gamma"], k=3, fetch_k=4)[0]
+    single = RAGEngine(embedding_model_name="fake", vector_store_path=str(engine.vector_store_path) + "-single", query_batch_size=1)
+    single.add_documents(_docs("a.pdf", ["alpha", "beta"]) + _docs("b.pdf", ["gamma", "delta"]))
+
+    # The same picks, in the same order, as MMR over a single store holding both documents
+    expected = single.batch_retrieve_with_scores(["gamma"], k=3, fetch_k=4)[0]
+    assert [doc.page_content for doc, _ in hits] == [doc.page_content for doc, _ in expected]
+    assert [score for _, score in hits] == pytest.approx([score for _, score in expected])
+
+
+def test_text_stored_in_several_shards_is_returned_once(make_engine):
+    engine = make_engine()
+    engine.add_documents(_docs("a.pdf", ["shared", "alpha"]) + _docs("b.pdf", ["shared", "beta"]))
+
+    found = [doc.page_content for doc in engine.batch_retrieve(["shared"], k=4, fetch_k=4)[0]]
+    assert sorted(found) == ["alpha", "beta", "shared"]
+
+
+def test_unscoped_search_is_routed_to_the_nearest_shards(make_engine):
+    make_engine().add_documents(_docs("a.pdf", ["alpha"]) + _docs("b.pdf", ["beta"]) + _docs("c.pdf", ["gamma"]))
+
+    engine = make_engine(max_fanout_shards=1)
+    engine.load_vector_store()
+    found = engine.batch_retrieve(["beta", "gamma"], k=2, fetch_k=2)
+
+    assert [[doc.page_content for doc in docs] for docs in found] == [["beta"], ["gamma"]]
+    assert sorted(engine._loaded) == sorted([shard_key("b.pdf"), shard_key("c.pdf")])
+
+
+def test_delete_source_removes_the_shard(make_engine, tmp_path):
+    engine = make_engine()
+    engine.add_documents(_docs("a.pdf", ["alpha", "beta"]) + _docs("b.pdf", ["gamma"]))
+
+    assert engine.delete_source("a.pdf") == 2
+    assert engine.shards() == {"b.pdf": shard_key("b.pdf")}
+    assert not os.path.exists(tmp_path / "store" / SHARDS_DIR / shard_key("a.pdf"))
+    assert {doc.metadata["source"] for doc in engine.batch_retrieve(["alpha"], k=4)[0]} == {"b.pdf"}
+
+
+def test_least_recently_used_shards_are_evicted(make_engine):
+    engine = make_engine(max_loaded_shards=1)
+    engine.add_documents(_docs("a.pdf", ["alpha"]) + _docs("b.pdf", ["beta"]) + _docs("c.pdf", ["gamma"]))
+
+    assert len(engine._loaded) == 1
+    assert len(engine.batch_retrieve(["alpha"], k=3)[0]) == 3
+    assert len(engine._loaded) == 1
+
+
+def test_unsharded_store_is_still_searched(make_engine, tmp_path):
+    legacy = RAGEngine(embedding_model_name="fake", vector_store_path=str(tmp_path / "store"), query_batch_size=1)
+    legacy.add_documents(_docs("old.pdf", ["alpha"]))
+
+    engine = make_engine()
+    engine.add_documents(_docs("new.pdf", ["beta"]))
+
+    assert engine.stats()["unsharded_store"]
+    assert {doc.metadata["source"] for doc in engine.batch_retrieve(["alpha"], k=4)[0]} == {"old.pdf", "new.pdf"}
+    assert [doc.metadata["source"] for doc in engine.batch_retrieve(["alpha"], k=4, documents=["old.pdf"])[0]] == ["old.pdf"]
+
+
+def test_reader_picks_up_published_shards(make_engine):
+    writer = make_engine()
+    writer.add_documents(_docs("a.pdf", ["alpha"]))
+
+    reader = make_engine(read_only=True)
+    reader.load_vector_store()
+    assert reader.index_version == writer.index_version
+
+    writer.add_documents(_docs("b.pdf", ["beta"]))
+    assert {doc.metadata["source"] for doc in reader.batch_retrieve(["beta"], k=4)[0]} == {"a.pdf", "b.pdf"}
+    assert reader.index_version == writer.index_version
+
+
+def test_replacing_a_source_moves_it_from_the_unsharded_store_only_on_success(make_engine):
+    engine = make_engine()
+    engine.root.add_documents(_docs("/in/a.pdf", ["old alpha", "old beta"]))
+    engine.load_vector_store()
+
+    def failing():
+        yield from _docs("/in/a.pdf", ["new alpha"])
+        raise RuntimeError("extraction failed")
+
+    with pytest.raises(RuntimeError):
+        engine.add_document_stream(failing(), batch_size=1, replace_source="/in/a.pdf")
+    assert engine.root.sources() == {"/in/a.pdf": 2}
+    assert engine.shards() == {}
+
+    assert engine.add_document_stream(iter(_docs("/in/a.pdf", ["new alpha"])), replace_source="/in/a.pdf") == 1
+    assert engine.root.sources() == {}
+    assert engine._shard(shard_key("/in/a.pdf")).sources() == {"/in/a.pdf": 1}
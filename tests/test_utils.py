@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+
+from src.utils import batched, prefetch
+
+
+class Source:
+    """Yields 0..count-1, recording the thread it runs on and whether it was closed."""
+
+    def __init__(self, count, fail_at=None):
+        self.count = count
+        self.fail_at = fail_at
+        self.thread = None
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        self.thread = threading.current_thread()
+        try:
+            for i in range(self.count):
+                if i == self.fail_at:
+                    raise ValueError("bad page")
+                yield i
+        finally:
+            self.closed.set()
+
+
+def test_prefetch_yields_everything_in_order():
+    source = Source(50)
+    assert list(prefetch(source, max_items=4)) == list(range(50))
+    assert source.closed.wait(1)
+
+
+def test_prefetch_reraises_producer_errors():
+    with pytest.raises(ValueError, match="bad page"):
+        list(prefetch(Source(10, fail_at=3), max_items=2))
+
+
+def test_prefetch_stops_producer_when_closed_early():
+    source = Source(1000)
+    items = prefetch(source, max_items=2)
+    assert next(items) == 0
+    items.close()
+
+    # The producer was blocked on the full buffer; it notices, closes the source and exits
+    assert source.closed.wait(2)
+    source.thread.join(2)
+    assert not source.thread.is_alive()
+
+
+def test_prefetch_stops_producer_when_consumer_fails():
+    source = Source(1000)
+    with pytest.raises(RuntimeError):
+        for item in prefetch(source, max_items=2):
+            if item == 5:
+                raise RuntimeError("embedding failed")
+    source.thread.join(2)
+    assert not source.thread.is_alive()
+    assert source.closed.is_set()
+
+
+def test_batched():
+    assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]